@@ -13,15 +13,20 @@ Classes:
     AirTable: Core simulation features including gravity, pucks, and springs
     CircularAirTable: Basic collision detection and resolution for circular pucks
     PerfectKissAirTable: Precise collision handling for perfect elastic collisions
+    EventDrivenAirTable: Exact-time collisions, predicted and processed in time order from a priority queue
+    FixedPointAirTable: Integer (fixed-point) positions and forces, deterministic and exactly reversible
     Box2DAirTable: Advanced simulation of non-circular objects using the Box2D engine
+    ContactEventBuffer: Box2D contact events recorded during a step, for processing after it
+    BulletBodyPool: Idle Box2D bodies of expired gun bullets, for reuse by new bullets
 
 Each table type supports puck and spring objects, and customizable physics parameters
 for different simulation needs.
 """
 
-import random, threading, time, math
+import random, threading, time, math, heapq, itertools, bisect
 from typing import Union, Tuple
 
+import numpy as np
 import pygame
 from pygame.color import THECOLORS
 import Box2D
@@ -30,13 +35,22 @@ from Box2D import (b2World, b2Vec2, b2_dynamicBody, b2AABB, b2QueryCallback,
 
 # Vector class
 from A09_vec2d import Vec2D
-from A15_air_table_objects import Wall, Puck, Spring, Gun, Jet
+from A15_air_table_objects import Wall, Puck, Spring, Gun, Jet, CATEGORY_BULLET
+from A15_broad_phase import SpatialHashGrid, SweepAndPrune, StaticBVH, REACH_FACTOR, MOVE_MARGIN_FACTOR
+from A15_puck_store import PuckStore, PuckLists
+from A15_spring_network import SpringForceTable, ImplicitSpringSolver, XPBDSpringSolver
+from A15_diagnostics import DiagnosticsRing, DiagnosticsFileSink
+from A15_parallel import StripCollider, collision_rounds, resolve_collision_round_arrays
+from A15_box2d_stepping import Box2DStepController
 # Global variables shared across scripts
-import A15_globals as g
+from A15_simulation_context import context_or_default
 
 
 class AirTable:
-    def __init__(self, walls_dic):
+    def __init__(self, walls_dic, ctx=None):
+        # The env, window, and clients are reached through the simulation context (A15_globals by default).
+        self.ctx = context_or_default(ctx)
+
         self.gON_2d_mps2 = Vec2D(-0.0, -9.8)
         self.gOFF_2d_mps2 = Vec2D(-0.0, -0.0)
         self.g_2d_mps2 = self.gOFF_2d_mps2
@@ -49,11 +63,22 @@ class AirTable:
         self.pucks = []
         self.controlled_pucks = []
         self.target_pucks = []
+
+        # NumPy arrays holding the state of all the pucks (one row per puck).
+        self.puck_store = PuckStore()
         
         self.springs = []
+        # NumPy arrays of the springs, for calculating all the spring forces in one pass.
+        self.spring_force_table = SpringForceTable()
         
         self.walls_dic_atBirth = walls_dic.copy()
         self.walls_dic = walls_dic.copy()
+
+        # Static wall segments and convex polygons inside the fence (circular engines). They are kept in
+        # a bounding-volume hierarchy, built when first needed after the shapes change. See
+        # checkForStaticCollisions.
+        self.static_shapes = []
+        self.static_bvh = None
         
         self.collision_count = 0
         self.coef_rest = 1.0
@@ -63,8 +88,97 @@ class AirTable:
         
         self.inhibit_wall_collisions = False
         self.inhibit_all_puck_collisions = False
+        # False when the category and mask bits of the pucks allow every puck-puck collision (then
+        # the pair checks skip categories_collide). Set in each step by any_categories_collide.
+        self.filters_active = True
+        # Per-step list copies of the puck state, for the pair loops (see check_for_collisions).
+        self.puck_lists = None
         self.correct_for_wall_penetration = True
         self.correct_for_puck_penetration = True
+
+        # Broad-phase culling for the circular engines: "all-pairs" (the original nested loop),
+        # "spatial-hash" (uniform grid), or "sweep-and-prune" (sorted endpoints along x). For
+        # the grid, a cell size of None derives the cell size from the largest puck radius.
+        # See A15_broad_phase.py.
+        self.broad_phases = ["all-pairs", "spatial-hash", "sweep-and-prune"]
+        self.broad_phase = "all-pairs"
+        self.spatial_hash = SpatialHashGrid(cell_size_m=None)
+        self.sweep_and_prune = SweepAndPrune()
+
+        # Puck-puck collision resolution: "vec2d" is check_for_puck_collisions, one pair at a
+        # time. The subclasses may add others (e.g. "scalar" for check_for_puck_collisions_scalar,
+        # the same math on plain floats, or "numpy-batch" in CircularAirTable).
+        self.collision_resolvers = ["vec2d"]
+        self.collision_resolver = "vec2d"
+
+        # Swept-circle (continuous) collision checks for bullets, and for any puck that moves
+        # farther than its radius in one time step. These would otherwise tunnel through
+        # other pucks when dt_s is large. See check_for_fast_puck_collisions. This is off by
+        # default (it changes the trajectories of the existing demos); turn it on (c key) when
+        # running at a low physics rate, e.g. on a busy server.
+        self.continuous_collisions = False
+
+        # Integrator for the circular engines: "semi-implicit-euler" (symplectic Euler: the new
+        # velocity moves the puck), "explicit-euler", "velocity-verlet", "rk4", "implicit-springs"
+        # (backward Euler for the spring network), or "xpbd" (springs and pins as compliant distance
+        # constraints). See A15_spring_network.py for the last two. Each call to step_physics can be
+        # divided into substeps. See update_TotalForce_Speed_Position_allPucks.
+        self.integrators = ["semi-implicit-euler", "explicit-euler", "velocity-verlet", "rk4", "implicit-springs", "xpbd"]
+        self.integrator = "semi-implicit-euler"
+        self.spring_solver = ImplicitSpringSolver()
+        self.xpbd_solver = XPBDSpringSolver(iterations=10)
+        self.substeps = 1
+
+        # Adaptive time step (environment timestep_adaptive). Each frame is divided into substeps
+        # sized by a local error estimate: the puck speeds relative to their radii, and the
+        # spring stiffness. See adaptive_step_limit_s.
+        self.adaptive_dt_max_s = 1.0/60.0
+        self.adaptive_dt_min_s = 1.0/2000.0
+        self.adaptive_travel_fraction = 0.2
+        self.adaptive_spring_fraction = 0.3
+        self.adaptive_max_substeps = 16
+        # Wall-clock time allowed for the physics in each frame.
+        self.adaptive_budget_s = 0.010
+        self.substep_cost_s = None
+
+        # Sleeping (circular engines). When every puck in an island (pucks connected by springs
+        # or touching) has been slower than the threshold speed for time_to_sleep_s, the island
+        # is put to sleep. Sleeping pucks are not moved and are not collision-tested against each
+        # other. A puck wakes when it gets a velocity, or a jet, cursor-string, or impulse force.
+        # Its island then wakes with it. See update_sleep_states. This is off by default: putting
+        # slow pucks to sleep zeroes their velocities, which changes the existing scenes. Turn it on
+        # (m key) for large scenes that come to rest.
+        self.sleeping_enabled = False
+        self.sleep_speed_threshold_mps = 0.01
+        self.time_to_sleep_s = 0.5
+        # Set when a puck wakes, so the islands are checked in the next update_sleep_states.
+        self.puck_woke = False
+        # The islands are also checked when the set of pucks that are ready to sleep changes (this
+        # is its key), and at least every time_to_sleep_s (e.g. after a ready puck loses contact
+        # with a moving one).
+        self.ready_key = None
+        self.islands_age_s = 0.0
+        # The candidate pairs of the step's collision checks (two index arrays), if they were
+        # listed. They are reused by the island search at the end of the step.
+        self.step_pair_arrays = None
+
+        # Energy and momentum diagnostics (shift+F1). When enabled, a sample is recorded every
+        # diagnostics_decimation steps, into a ring buffer that can be drawn or streamed to a file.
+        # Samples are put off further when needed to keep their cost under diagnostics_budget (a
+        # fraction) of the time spent in the physics steps. See record_diagnostics and A15_diagnostics.py.
+        self.diagnostics_enabled = False
+        self.diagnostics_decimation = 8
+        self.diagnostics_budget = 0.02
+        self.diagnostics = DiagnosticsRing(capacity=600)
+        self.diagnostics_sink = None
+        self.diagnostics_step_count = 0
+        # Physics time since the last sample, and the time taken by the last sample.
+        self.diagnostics_physics_s = 0.0
+        self.diagnostics_sample_s = 0.0
+        # A jump in the total energy, between samples, of more than this factor times the previous
+        # total (or 1 J) is reported as a blow-up.
+        self.diagnostics_blowup_factor = 10.0
+        self.diagnostics_blowup_reported = False
         
         # Time step (established in game loop)
         self.dt_s = None
@@ -83,9 +197,9 @@ class AirTable:
 
     def makeSquareFence(self):
         # Make a square fence.
-        xy_diff_m = (g.env.length_x_m - (g.env.length_x_m / g.env.aspect_ratio_wh))
+        xy_diff_m = (self.ctx.env.length_x_m - (self.ctx.env.length_x_m / self.ctx.env.aspect_ratio_wh))
         self.walls_dic['L_m'] = 0 + (xy_diff_m / 2.0)
-        self.walls_dic['R_m'] = g.env.length_x_m - (xy_diff_m / 2.0)
+        self.walls_dic['R_m'] = self.ctx.env.length_x_m - (xy_diff_m / 2.0)
 
     def throw_puck(self, puck, velocity_2d_mps, delay_s=1.0):
         def throw_it_later():
@@ -100,8 +214,8 @@ class AirTable:
     def buildControlledPuck(self, x_m=1.0, y_m=1.0, pos_2d_m=None, r_m=0.45, density=0.7, c_drag=0.7, 
                                   client_name=None, sf_abs=True, showSpoke=False, drone=False, bullet_age_limit_s=3):
         if (drone): 
-            g.env.clients[client_name].active = True
-            g.env.clients[client_name].drone = True
+            self.ctx.env.clients[client_name].active = True
+            self.ctx.env.clients[client_name].drone = True
 
         if (pos_2d_m):
             puck_position_2d_m = pos_2d_m
@@ -109,12 +223,12 @@ class AirTable:
             puck_position_2d_m = Vec2D(x_m, y_m)
 
         tempPuck = Puck(puck_position_2d_m, r_m, density, c_drag=c_drag, c_angularDrag=0.5,
-                         client_name=client_name, show_health=True, showSpoke=showSpoke)
+                         client_name=client_name, show_health=True, showSpoke=showSpoke, ctx=self.ctx)
         
         # Let the puck reference the jet and the jet reference the puck.
-        tempPuck.jet = Jet( tempPuck, sf_abs=sf_abs)
+        tempPuck.jet = Jet( tempPuck, sf_abs=sf_abs, ctx=self.ctx)
         # Same with the gun.
-        tempPuck.gun = Gun( tempPuck, sf_abs=sf_abs, bullet_age_limit_s=bullet_age_limit_s)
+        tempPuck.gun = Gun( tempPuck, sf_abs=sf_abs, bullet_age_limit_s=bullet_age_limit_s, ctx=self.ctx)
 
     def pinnedPuck(self, puck_position_2d_m, radius_m=1.5, density=1.0, angle_d=0,
                          pin_position_2d_m=None, strength_Npm=200.0):
@@ -126,10 +240,10 @@ class AirTable:
             color=THECOLORS["coral"],
             friction=1.0, friction_fixed=True,
             coef_rest=0.0, CR_fixed=True, border_px=5, 
-            angle_r=g.env.radians(angle_d)
+            angle_r=self.ctx.env.radians(angle_d), ctx=self.ctx
         )
         Spring(p1, pin_position_2d_m, color=THECOLORS['dodgerblue'],
-            strength_Npm=strength_Npm, width_m=0.03, c_drag=15.0, c_damp=15.0
+            strength_Npm=strength_Npm, width_m=0.03, c_drag=15.0, c_damp=15.0, ctx=self.ctx
         )
             
     def buildJelloGrid(self, angle: Union[int, Tuple[int, int]] = 0, 
@@ -176,7 +290,7 @@ class AirTable:
                 Puck( pos_2d_m, 0.25, 5.0, color=color,
                       c_drag=puck_drag, 
                       show_health=show_health, hit_limit=10,
-                      coef_rest=coef_rest, CR_fixed=True, c_angularDrag=0.5)
+                      coef_rest=coef_rest, CR_fixed=True, c_angularDrag=0.5, ctx=self.ctx)
                 pos_2d_m = pos_2d_m + pos_y_delta_2d_m
             
             pos_2d_m = pos_2d_m - (pos_y_delta_2d_m * grid_y_n) # Reset the y position for the next column
@@ -189,14 +303,14 @@ class AirTable:
         # Springs on pucks in same y position, next to each other in x position.
         for m in range(grid_y_n * (grid_x_n-1)):
             Spring( self.pucks[m], self.pucks[m+grid_y_n], spring_length_m, spring_strength_Npm2, 
-                    color=THECOLORS["blue"], c_damp=spring_damping)
+                    color=THECOLORS["blue"], c_damp=spring_damping, ctx=self.ctx)
         
         # Springs on pucks in same x position, next to each other in y position.
         for m in range(grid_x_n):
             for n in range(grid_y_n-1):
                 o_index = n + (m * (grid_y_n))
                 Spring( self.pucks[o_index], self.pucks[o_index+1], spring_length_m, spring_strength_Npm2, 
-                        color=THECOLORS["blue"], c_damp=spring_damping)
+                        color=THECOLORS["blue"], c_damp=spring_damping, ctx=self.ctx)
         
         # Springs connected on diagonals (springs are longer).
         spring_length_m = 1.2 * 2**0.5
@@ -206,10 +320,10 @@ class AirTable:
                 o_index = n + (m * (grid_y_n))
                 # Connect to a nearby puck: down one, right one.
                 Spring( self.pucks[o_index], self.pucks[o_index+(grid_y_n-1)], spring_length_m, spring_strength_Npm2, 
-                        color=THECOLORS["lightblue"], c_damp=spring_damping)
+                        color=THECOLORS["lightblue"], c_damp=spring_damping, ctx=self.ctx)
                 # Connect to a nearby puck: up one, right one.
                 Spring( self.pucks[o_index-1], self.pucks[o_index+(grid_y_n)], spring_length_m, spring_strength_Npm2, 
-                        color=THECOLORS["lightblue"], c_damp=spring_damping)
+                        color=THECOLORS["lightblue"], c_damp=spring_damping, ctx=self.ctx)
 
         # Throw the jello. Use a random speed.
         if type(speed) is tuple:
@@ -241,8 +355,8 @@ class AirTable:
             {'x_n':3, 'y_n':2, 'ang_min':-10, 'ang_max':90, 'spd_min':10,'spd_max': 40},
             {'x_n':2, 'y_n':2, 'ang_min':-10, 'ang_max':90, 'spd_min': 0,'spd_max':200}
         ]
-        g.env.demo_variations[demo_index]['count'] = len(initial_states)
-        state = initial_states[g.env.demo_variations[demo_index]['index']]
+        self.ctx.env.demo_variations[demo_index]['count'] = len(initial_states)
+        state = initial_states[self.ctx.env.demo_variations[demo_index]['index']]
 
         self.game_time_s = 0
         self.jello_tangle_checking_enabled = True
@@ -253,11 +367,11 @@ class AirTable:
             grid_x_n=state['x_n'], grid_y_n=state['y_n']
         )
 
-        if g.env.demo_variations[8]['index'] == 6:
-            self.pinnedPuck(Vec2D(g.game_window.center_2d_m.x, 2.5), strength_Npm=500.0)
+        if self.ctx.env.demo_variations[8]['index'] == 6:
+            self.pinnedPuck(Vec2D(self.ctx.game_window.center_2d_m.x, 2.5), strength_Npm=500.0)
 
-        g.game_window.set_caption( g.game_window.caption + 
-            f"     Variation {g.env.demo_variations[8]['index'] + 1}" +
+        self.ctx.game_window.set_caption( self.ctx.game_window.caption + 
+            f"     Variation {self.ctx.env.demo_variations[8]['index'] + 1}" +
             f"     grid = ({state['x_n']}, {state['y_n']})" +
             f"  angle = {throw['angle']:.1f}  speed = {throw['speed_mps']:.1f}"
         )
@@ -285,8 +399,8 @@ class AirTable:
             {'n_x':5,'n_y':5,'spr':True,'pa_i':7,'pb_i':17},
             {'n_x':5,'n_y':5,'spr':False}
         ]
-        g.env.demo_variations[demo_index]['count'] = len(initial_states)
-        state = initial_states[g.env.demo_variations[demo_index]['index']]
+        self.ctx.env.demo_variations[demo_index]['count'] = len(initial_states)
+        state = initial_states[self.ctx.env.demo_variations[demo_index]['index']]
         
         if 'angle' in state:
             angle = state['angle']
@@ -303,44 +417,44 @@ class AirTable:
         for puck in self.pucks:
             com_2d_m += puck.pos_2d_m
         com_2d_m = com_2d_m / len(self.pucks)
-        shift_2d_m = g.game_window.center_2d_m - com_2d_m
+        shift_2d_m = self.ctx.game_window.center_2d_m - com_2d_m
         for puck in self.pucks:
             puck.set_pos_and_vel(puck.pos_2d_m + shift_2d_m)
 
         # Pin two pucks of the jello grid.
-        if g.env.demo_variations[9]['index'] == 4:
+        if self.ctx.env.demo_variations[9]['index'] == 4:
             k_Npm = 700.0
         else:
             k_Npm = 800.0
         if state['spr']:
             Spring(self.pucks[state['pa_i']], Vec2D(0.3, 0.3), color=THECOLORS['yellow'],
-                length_m=0.0, strength_Npm=k_Npm, width_m=0.02)
+                length_m=0.0, strength_Npm=k_Npm, width_m=0.02, ctx=self.ctx)
             Spring(self.pucks[state['pb_i']], Vec2D(9.7, 8.4), color=THECOLORS['yellow'],
-                length_m=0.0, strength_Npm=k_Npm, width_m=0.02)
+                length_m=0.0, strength_Npm=k_Npm, width_m=0.02, ctx=self.ctx)
 
-        g.env.clients["C5"].active = True
-        g.env.clients["C5"].drone = True
+        self.ctx.env.clients["C5"].active = True
+        self.ctx.env.clients["C5"].drone = True
         self.buildControlledPuck( x_m=2.0, y_m=8.0, r_m=0.45, client_name="C5")
 
-        g.env.clients["C6"].active = True
-        g.env.clients["C6"].drone = True
+        self.ctx.env.clients["C6"].active = True
+        self.ctx.env.clients["C6"].drone = True
         self.buildControlledPuck( x_m=8.5, y_m=1.5, r_m=0.45, client_name="C6")
 
-        g.env.set_gravity("off")
+        self.ctx.env.set_gravity("off")
     
         # Establish initial targets.
         for controlled_puck in self.controlled_pucks:
-            if g.env.clients[ controlled_puck.client_name].drone:
+            if self.ctx.env.clients[ controlled_puck.client_name].drone:
                 controlled_puck.gun.findNewTarget()
     
-        g.game_window.set_caption( g.game_window.caption + 
-            f"     Variation {g.env.demo_variations[9]['index'] + 1}" +
+        self.ctx.game_window.set_caption( self.ctx.game_window.caption + 
+            f"     Variation {self.ctx.env.demo_variations[9]['index'] + 1}" +
             f"     grid = ({state['n_x']}, {state['n_y']})" +
             f"     pinned = {state['spr']}     angle = {angle}"
         )
 
     def puckPopper_variations(self, demo_index, twoDrone_special, custom_1=None, custom_2=None):
-        g.env.set_gravity("off")
+        self.ctx.env.set_gravity("off")
 
         initial_states = [
             {'type':'two-drones'},
@@ -357,8 +471,8 @@ class AirTable:
         if custom_2 is not None:
             initial_states.append({'type':'custom-2'})
 
-        g.env.demo_variations[demo_index]['count'] = len(initial_states)
-        state = initial_states[g.env.demo_variations[demo_index]['index']]
+        self.ctx.env.demo_variations[demo_index]['count'] = len(initial_states)
+        state = initial_states[self.ctx.env.demo_variations[demo_index]['index']]
                     
         # Box2D drag modeling is slightly different than that in the circular engines. So,
         # c_drag is set higher than the default value, 0.7.
@@ -380,11 +494,11 @@ class AirTable:
 
             # Make controllable pucks for all the clients.
             if (state['n-drones'] == 2): 
-                center_pos_2d_m = g.game_window.center_2d_m - Vec2D(2.5, 0)
+                center_pos_2d_m = self.ctx.game_window.center_2d_m - Vec2D(2.5, 0)
             else:
-                center_pos_2d_m = g.game_window.center_2d_m
+                center_pos_2d_m = self.ctx.game_window.center_2d_m
 
-            n_not_drone = len([c for c in g.env.clients.values() if c.active and not c.drone])
+            n_not_drone = len([c for c in self.ctx.env.clients.values() if c.active and not c.drone])
 
             # Calculate starting position to center the row.  
             #    total width = (n-1) * spacing  
@@ -394,8 +508,8 @@ class AirTable:
             spacing_m = 1.0
             human_pos_2d_m = center_pos_2d_m - Vec2D((n_not_drone - 1) * spacing_m / 2, 0)
 
-            for client_name in g.env.clients:
-                client = g.env.clients[client_name]
+            for client_name in self.ctx.env.clients:
+                client = self.ctx.env.clients[client_name]
                 if client.active and not client.drone:
                     self.buildControlledPuck(pos_2d_m=human_pos_2d_m, r_m=0.45, 
                         client_name=client_name, sf_abs=False, c_drag=c_drag, bullet_age_limit_s=3.0)
@@ -410,7 +524,7 @@ class AirTable:
                 angle = (360 / n_drones) * i
 
                 rotated_c_to_puck_2d_m = center_to_puck_2d_m.rotated(angle)
-                puck_position_2d_m = g.game_window.center_2d_m + rotated_c_to_puck_2d_m
+                puck_position_2d_m = self.ctx.game_window.center_2d_m + rotated_c_to_puck_2d_m
                             
                 # drone pucks
                 # Start at C4, leaving room for local, C1, C2, and C3 human players.
@@ -420,14 +534,14 @@ class AirTable:
 
         # Establish initial targets.
         for controlled_puck in self.controlled_pucks:
-            if g.env.clients[ controlled_puck.client_name].drone:
+            if self.ctx.env.clients[ controlled_puck.client_name].drone:
                 if state['type'] == 'n-drones' and state['n-drones'] == 5:
                     controlled_puck.gun.targetPuck = self.pucks[0] # 0 is the host client
                 else:    
                     controlled_puck.gun.findNewTarget()
         
-        g.game_window.set_caption( g.game_window.caption + 
-            f"     Variation {g.env.demo_variations[7]['index'] + 1}"
+        self.ctx.game_window.set_caption( self.ctx.game_window.caption + 
+            f"     Variation {self.ctx.env.demo_variations[7]['index'] + 1}"
         )
 
     """
@@ -436,15 +550,18 @@ class AirTable:
     def draw(self):
         if not self.inhibit_wall_collisions:
             #{"L_m":0.0, "R_m":10.0, "B_m":0.0, "T_m":10.0}
-            topLeft_2d_px =   g.env.ConvertWorldToScreen( Vec2D( self.walls_dic['L_m'],        self.walls_dic['T_m']))
-            topRight_2d_px =  g.env.ConvertWorldToScreen( Vec2D( self.walls_dic['R_m']-0.01,   self.walls_dic['T_m']))
-            botLeft_2d_px =   g.env.ConvertWorldToScreen( Vec2D( self.walls_dic['L_m'],        self.walls_dic['B_m']+0.01))
-            botRight_2d_px =  g.env.ConvertWorldToScreen( Vec2D( self.walls_dic['R_m']-0.01,   self.walls_dic['B_m']+0.01))
+            topLeft_2d_px =   self.ctx.env.ConvertWorldToScreen( Vec2D( self.walls_dic['L_m'],        self.walls_dic['T_m']))
+            topRight_2d_px =  self.ctx.env.ConvertWorldToScreen( Vec2D( self.walls_dic['R_m']-0.01,   self.walls_dic['T_m']))
+            botLeft_2d_px =   self.ctx.env.ConvertWorldToScreen( Vec2D( self.walls_dic['L_m'],        self.walls_dic['B_m']+0.01))
+            botRight_2d_px =  self.ctx.env.ConvertWorldToScreen( Vec2D( self.walls_dic['R_m']-0.01,   self.walls_dic['B_m']+0.01))
             
-            pygame.draw.line(g.game_window.surface, THECOLORS["orangered1"], topLeft_2d_px,  topRight_2d_px, 1)
-            pygame.draw.line(g.game_window.surface, THECOLORS["orangered1"], topRight_2d_px, botRight_2d_px, 1)
-            pygame.draw.line(g.game_window.surface, THECOLORS["orangered1"], botRight_2d_px, botLeft_2d_px,  1)
-            pygame.draw.line(g.game_window.surface, THECOLORS["orangered1"], botLeft_2d_px,  topLeft_2d_px,  1)
+            pygame.draw.line(self.ctx.game_window.surface, THECOLORS["orangered1"], topLeft_2d_px,  topRight_2d_px, 1)
+            pygame.draw.line(self.ctx.game_window.surface, THECOLORS["orangered1"], topRight_2d_px, botRight_2d_px, 1)
+            pygame.draw.line(self.ctx.game_window.surface, THECOLORS["orangered1"], botRight_2d_px, botLeft_2d_px,  1)
+            pygame.draw.line(self.ctx.game_window.surface, THECOLORS["orangered1"], botLeft_2d_px,  topLeft_2d_px,  1)
+
+        for shape in self.static_shapes:
+            shape.draw()
     
     def checkForPuckAtThisPosition(self, x_px_or_tuple, y_px = None):
         if y_px == None:
@@ -454,7 +571,7 @@ class AirTable:
             self.x_px = x_px_or_tuple
             self.y_px = y_px
         
-        test_position_m = g.env.ConvertScreenToWorld(Vec2D(self.x_px, self.y_px))
+        test_position_m = self.ctx.env.ConvertScreenToWorld(Vec2D(self.x_px, self.y_px))
         for puck in self.pucks:
             vector_difference_m = test_position_m - puck.pos_2d_m
             # Use squared lengths for speed (avoid square root)
@@ -498,6 +615,435 @@ class AirTable:
         puck.cursorString_spring_force_2d_N = Vec2D(0.0,0.0)
         puck.cursorString_puckDrag_force_2d_N = Vec2D(0.0,0.0)
         puck.impulse_2d_Ns = Vec2D(0.0,0.0)
+
+    def update_TotalForce_Speed_Position_allPucks(self):
+        # A vectorized version of update_TotalForce_Speed_Position. All the pucks are
+        # updated in one pass over the rows of the puck store, using the selected integrator.
+        if self.integrator == "semi-implicit-euler":
+            n = self.update_TotalForce_Speed_allPucks()
+            if n == 0: return
+
+            # Velocity changes the position:  dx = v * dt
+            vectors = self.puck_store.vectors
+            vectors['pos_2d_m'][:n] += vectors['vel_2d_mps'][:n] * self.dt_s
+
+        elif self.integrator == "explicit-euler":
+            self.integrate_explicit_euler()
+        elif self.integrator == "velocity-verlet":
+            self.integrate_velocity_verlet()
+        elif self.integrator == "rk4":
+            self.integrate_rk4()
+        elif self.integrator == "implicit-springs":
+            self.integrate_implicit_springs()
+        elif self.integrator == "xpbd":
+            self.integrate_xpbd()
+
+    def update_TotalForce_Speed_allPucks(self):
+        # Apply the net force to the velocity of every puck and reset the force accumulators. The
+        # positions are not changed. Returns the number of rows in the puck store.
+        store = self.puck_store
+        n = store.n
+        if n == 0: return n
+
+        if self.sleeping_enabled:
+            self.wake_pucks_with_new_motion(n)
+
+        # Acceleration changes the velocity:  dv = a * dt
+        store.vectors['vel_2d_mps'][:n] += self.acceleration_allPucks(n) * self.dt_s
+
+        self.reset_force_accumulators(n)
+        return n
+
+    def acceleration_allPucks(self, n):
+        # Net force on each puck (rows 0 to n-1 of the puck store) divided by its mass.
+        vectors = self.puck_store.vectors
+        mass_kg = self.puck_store.scalars['mass_kg'][:n, np.newaxis]
+
+        # Net resulting force on the pucks. (Same order of summation as in the single-puck method.)
+        forces_2d_N = vectors['SprDamp_force_2d_N'][:n] + vectors['jet_force_2d_N'][:n]
+        forces_2d_N += vectors['cursorString_spring_force_2d_N'][:n]
+        forces_2d_N += vectors['cursorString_puckDrag_force_2d_N'][:n]
+        forces_2d_N += vectors['puckDrag_force_2d_N'][:n]
+        forces_2d_N += vectors['impulse_2d_Ns'][:n] / self.dt_s
+        forces_2d_N = (mass_kg * np.array(self.g_2d_mps2.tuple())) + forces_2d_N
+
+        # Acceleration from Newton's law, limited as in the single-puck method.
+        acc_2d_mps2 = forces_2d_N / mass_kg
+        limit_mps2 = 1000.0  # m/s^2
+        np.clip(acc_2d_mps2, -limit_mps2, limit_mps2, out=acc_2d_mps2)
+
+        # Pins and sleeping pucks don't move.
+        acc_2d_mps2[~self.puck_store.dynamic[:n]] = 0.0
+        acc_2d_mps2[self.puck_store.ints['sleeping'][:n] != 0] = 0.0
+        return acc_2d_mps2
+
+    def reset_force_accumulators(self, n):
+        # The jet and drag forces are not aggregates (they are set, not added to), so
+        # they are not reset here.
+        vectors = self.puck_store.vectors
+        vectors['SprDamp_force_2d_N'][:n] = 0.0
+        vectors['cursorString_spring_force_2d_N'][:n] = 0.0
+        vectors['cursorString_puckDrag_force_2d_N'][:n] = 0.0
+        vectors['impulse_2d_Ns'][:n] = 0.0
+
+    def calc_state_dependent_forces(self):
+        # Recalculate the forces that depend on the puck positions and velocities: the drag
+        # and the springs (as calculated in the game loop before each step). The integrators
+        # that evaluate the forces more than once per step call this at each trial state.
+        # The jet, cursor-string and impulse forces are held constant over the step.
+        self.puck_store.vectors['SprDamp_force_2d_N'][:self.puck_store.n] = 0.0
+        self.calc_regularDragForce_allPucks()
+        self.calc_spring_forces_allSprings()
+
+    def calc_regularDragForce_allPucks(self):
+        # A vectorized version of Puck.calc_regularDragForce, for all the target pucks.
+        if not self.target_pucks: return
+        vectors = self.puck_store.vectors
+        rows = self.puck_store.rows_of(self.target_pucks)
+        c_drag = np.array([puck.c_drag for puck in self.target_pucks])
+        vectors['puckDrag_force_2d_N'][rows] = vectors['vel_2d_mps'][rows] * -1 * c_drag[:, np.newaxis]
+
+    def calc_spring_forces_allSprings(self):
+        # A vectorized version of Spring.calc_spring_forces_on_pucks, for all the springs.
+        self.spring_force_table.add_spring_forces(self.springs, self.puck_store)
+
+    def integrate_explicit_euler(self):
+        # Forward (explicit) Euler: the position is advanced with the velocity from the start
+        # of the step. Not symplectic, so the energy of an undamped spring grows each step.
+        # Included for comparison.
+        store = self.puck_store
+        n = store.n
+        if n == 0: return
+        if self.sleeping_enabled:
+            self.wake_pucks_with_new_motion(n)
+
+        pos_2d_m = store.vectors['pos_2d_m']
+        vel_2d_mps = store.vectors['vel_2d_mps']
+        acc_2d_mps2 = self.acceleration_allPucks(n)
+        pos_2d_m[:n] += vel_2d_mps[:n] * self.dt_s
+        vel_2d_mps[:n] += acc_2d_mps2 * self.dt_s
+
+        self.reset_force_accumulators(n)
+
+    def integrate_velocity_verlet(self):
+        # Velocity Verlet (kick-drift-kick). Second order and symplectic for the spring forces.
+        # The forces are evaluated twice: at the start of the step (already in the accumulators)
+        # and at the new positions. The velocity-dependent forces (dampers, drag) in the second
+        # evaluation use the half-step velocity.
+        store = self.puck_store
+        n = store.n
+        if n == 0: return
+        if self.sleeping_enabled:
+            self.wake_pucks_with_new_motion(n)
+
+        dt_s = self.dt_s
+        pos_2d_m = store.vectors['pos_2d_m']
+        vel_2d_mps = store.vectors['vel_2d_mps']
+
+        vel_2d_mps[:n] += self.acceleration_allPucks(n) * (0.5 * dt_s)
+        pos_2d_m[:n] += vel_2d_mps[:n] * dt_s
+
+        self.calc_state_dependent_forces()
+        vel_2d_mps[:n] += self.acceleration_allPucks(n) * (0.5 * dt_s)
+
+        self.reset_force_accumulators(n)
+
+    def integrate_rk4(self):
+        # Classical fourth-order Runge-Kutta for the non-collision forces. The forces are
+        # evaluated four times per step. Collisions are still handled after the step by
+        # check_for_collisions.
+        store = self.puck_store
+        n = store.n
+        if n == 0: return
+        if self.sleeping_enabled:
+            self.wake_pucks_with_new_motion(n)
+
+        dt_s = self.dt_s
+        pos_2d_m = store.vectors['pos_2d_m']
+        vel_2d_mps = store.vectors['vel_2d_mps']
+        pos_0_2d_m = pos_2d_m[:n].copy()
+        vel_0_2d_mps = vel_2d_mps[:n].copy()
+
+        # Derivatives of the position (k_x) and velocity (k_v) at the start of the step.
+        k1_x = vel_0_2d_mps
+        k1_v = self.acceleration_allPucks(n)
+
+        def derivatives_at(fraction, k_x, k_v):
+            # Move the pucks to the trial state, then evaluate the forces there.
+            pos_2d_m[:n] = pos_0_2d_m + k_x * (fraction * dt_s)
+            vel_2d_mps[:n] = vel_0_2d_mps + k_v * (fraction * dt_s)
+            self.calc_state_dependent_forces()
+            return vel_2d_mps[:n].copy(), self.acceleration_allPucks(n)
+
+        k2_x, k2_v = derivatives_at(0.5, k1_x, k1_v)
+        k3_x, k3_v = derivatives_at(0.5, k2_x, k2_v)
+        k4_x, k4_v = derivatives_at(1.0, k3_x, k3_v)
+
+        pos_2d_m[:n] = pos_0_2d_m + (k1_x + 2.0*k2_x + 2.0*k3_x + k4_x) * (dt_s / 6.0)
+        vel_2d_mps[:n] = vel_0_2d_mps + (k1_v + 2.0*k2_v + 2.0*k3_v + k4_v) * (dt_s / 6.0)
+
+        self.reset_force_accumulators(n)
+
+    def integrate_implicit_springs(self):
+        # Backward Euler for the springs (stiffness and damping), so that stiff spring networks
+        # are stable at large steps. The other forces are applied as in semi-implicit Euler. The
+        # spring forces were calculated (explicitly) before the step, and the solver adds the
+        # implicit correction. The new velocity then moves the puck.
+        store = self.puck_store
+        n = store.n
+        if n == 0: return
+        if self.sleeping_enabled:
+            self.wake_pucks_with_new_motion(n)
+
+        pos_2d_m = store.vectors['pos_2d_m']
+        vel_2d_mps = store.vectors['vel_2d_mps']
+        free = store.dynamic[:n] & (store.ints['sleeping'][:n] == 0)
+
+        vel_2d_mps[:n] += self.spring_solver.velocity_change(self.springs, store, n, self.acceleration_allPucks(n),
+                                                             vel_2d_mps[:n], self.dt_s, free)
+        pos_2d_m[:n] += vel_2d_mps[:n] * self.dt_s
+
+        self.reset_force_accumulators(n)
+
+    def integrate_xpbd(self):
+        # Extended position-based dynamics. The spring and damper forces (calculated before the step)
+        # are replaced by constraints: the pucks are moved by the other forces, the constraints are
+        # projected, and the velocity is the change in position over the step.
+        store = self.puck_store
+        n = store.n
+        if n == 0: return
+        if self.sleeping_enabled:
+            self.wake_pucks_with_new_motion(n)
+
+        dt_s = self.dt_s
+        pos_2d_m = store.vectors['pos_2d_m']
+        vel_2d_mps = store.vectors['vel_2d_mps']
+        free = store.dynamic[:n] & (store.ints['sleeping'][:n] == 0)
+
+        # Only the drag part of the spring forces remains a force.
+        store.vectors['SprDamp_force_2d_N'][:n] = self.xpbd_solver.prepare(self.springs, store, n)
+
+        pos_start_2d_m = pos_2d_m[:n].copy()
+        vel_2d_mps[:n] += self.acceleration_allPucks(n) * dt_s
+        pos_2d_m[:n] += vel_2d_mps[:n] * dt_s
+
+        self.xpbd_solver.solve_positions(store, n, pos_start_2d_m, dt_s, free)
+        vel_2d_mps[:n][free] = (pos_2d_m[:n][free] - pos_start_2d_m[free]) / dt_s
+
+        self.reset_force_accumulators(n)
+
+    def step_physics(self, substeps=None):
+        # Integrate the forces and check for collisions (circular and perfect-kiss engines). With
+        # substeps > 1, the step (dt_s) is divided into equal substeps. The spring and drag forces
+        # are recalculated for each substep. The jet and cursor-string forces are held constant
+        # and an impulse is applied once, in the first substep. If substeps is not specified,
+        # self.substeps is used.
+        if substeps is None:
+            substeps = self.substeps
+        start_s = time.perf_counter()
+
+        if substeps <= 1:
+            self.update_TotalForce_Speed_Position_allPucks()
+            self.check_for_collisions()
+        else:
+            store = self.puck_store
+            n = store.n
+            vectors = store.vectors
+            cursorString_spring_force_2d_N = vectors['cursorString_spring_force_2d_N'][:n].copy()
+            cursorString_puckDrag_force_2d_N = vectors['cursorString_puckDrag_force_2d_N'][:n].copy()
+
+            dt_s = self.dt_s
+            self.dt_s = dt_s / substeps
+            for substep in range(substeps):
+                if substep > 0:
+                    # Pucks may have been added or removed (e.g. by a bullet hit) in the last substep.
+                    if store.n != n: break
+                    vectors['cursorString_spring_force_2d_N'][:n] = cursorString_spring_force_2d_N
+                    vectors['cursorString_puckDrag_force_2d_N'][:n] = cursorString_puckDrag_force_2d_N
+                    self.calc_state_dependent_forces()
+                self.update_TotalForce_Speed_Position_allPucks()
+                self.check_for_collisions()
+            self.dt_s = dt_s
+
+        # Running average of the wall-clock time per substep (used by adaptive_substeps).
+        cost_s = (time.perf_counter() - start_s) / max(substeps, 1)
+        if self.substep_cost_s is None:
+            self.substep_cost_s = cost_s
+        else:
+            self.substep_cost_s += 0.1 * (cost_s - self.substep_cost_s)
+
+    def adaptive_step_limit_s(self):
+        # Local error estimate for the adaptive time step. The largest step is limited so that the
+        # fastest puck (relative to its size) moves only a fraction of its radius, and so that the
+        # stiffest spring is sampled many times per oscillation (dt * omega < adaptive_spring_fraction,
+        # where omega**2 = k * (1/m1 + 1/m2), and a pin end has no 1/m term).
+        limit_s = self.adaptive_dt_max_s
+
+        store = self.puck_store
+        n = store.n
+        if n > 0:
+            moving = store.dynamic[:n] & (store.ints['sleeping'][:n] == 0)
+            speed_mps = np.hypot(store.vectors['vel_2d_mps'][:n, 0], store.vectors['vel_2d_mps'][:n, 1])
+            rate_ps = np.max(speed_mps[moving] / store.scalars['radius_m'][:n][moving], initial=0.0)
+            if rate_ps > 0.0:
+                limit_s = min(limit_s, self.adaptive_travel_fraction / rate_ps)
+
+        # The implicit and XPBD spring solvers are stable for any stiffness. The springs between
+        # pucks in the store are taken from the spring force table (refreshed by the spring force
+        # calculation at the start of this step) in one pass.
+        omega_squared_max = 0.0
+        if self.integrator not in ["implicit-springs", "xpbd"]:
+            table = self.spring_force_table
+            if (table.key is not None) and (len(table.rows_1) > 0):
+                dynamic = store.dynamic[:n]
+                inverse_mass_pkg = np.zeros(n)
+                inverse_mass_pkg[dynamic] = 1.0 / store.scalars['mass_kg'][:n][dynamic]
+                omega_squared_max = float(np.max(table.k_Npm * (inverse_mass_pkg[table.rows_1] + inverse_mass_pkg[table.rows_2])))
+            for spring in table.other_springs:
+                inverse_mass_sum = 0.0
+                for puck in (spring.p1, spring.p2):
+                    if not puck.pin:
+                        inverse_mass_sum += 1.0 / puck.mass_kg
+                omega_squared_max = max(omega_squared_max, spring.strength_Npm * inverse_mass_sum)
+        if omega_squared_max > 0.0:
+            limit_s = min(limit_s, self.adaptive_spring_fraction / math.sqrt(omega_squared_max))
+
+        return max(limit_s, self.adaptive_dt_min_s)
+
+    def adaptive_substeps(self):
+        # Number of substeps for this frame (dt_s): enough to meet the step limit from the error
+        # estimate, but no more than fit in the wall-clock budget (based on the measured cost of a
+        # substep) or adaptive_max_substeps.
+        substeps = math.ceil(abs(self.dt_s) / self.adaptive_step_limit_s())
+        if self.substep_cost_s:
+            substeps = min(substeps, int(self.adaptive_budget_s / self.substep_cost_s))
+        return max(1, min(substeps, self.adaptive_max_substeps))
+
+    def system_energy_J(self):
+        # Total mechanical energy of the pucks and springs: kinetic, gravitational potential
+        # (relative to y = 0) and spring potential. Useful for measuring the energy drift of the
+        # integrators (with the drag and damping turned off).
+        store = self.puck_store
+        n = store.n
+        dynamic = store.dynamic[:n]
+        mass_kg = store.scalars['mass_kg'][:n][dynamic]
+        vel_2d_mps = store.vectors['vel_2d_mps'][:n][dynamic]
+        pos_2d_m = store.vectors['pos_2d_m'][:n][dynamic]
+
+        kinetic_J = 0.5 * np.sum(mass_kg * np.sum(vel_2d_mps**2, axis=1))
+        gravity_J = -np.sum(mass_kg * (pos_2d_m @ np.array(self.g_2d_mps2.tuple())))
+        spring_J = 0.0
+        for spring in self.springs:
+            stretch_m = (spring.p1.pos_2d_m - spring.p2.pos_2d_m).length() - spring.length_m
+            spring_J += 0.5 * spring.strength_Npm * stretch_m**2
+
+        return float(kinetic_J + gravity_J + spring_J)
+
+    def measure_diagnostics(self):
+        # One diagnostics sample (see DiagnosticsRing.fields): time, kinetic, spring and gravitational
+        # (relative to y = 0) energies, their total, linear momentum, and angular momentum about the
+        # center of the table. All the pucks in one vectorized pass. The pins (non-dynamic rows) get
+        # a mass of zero, so no rows are copied out of the store.
+        store = self.puck_store
+        n = store.n
+        mass_kg = store.scalars['mass_kg'][:n] * store.dynamic[:n]
+        vel_2d_mps = store.vectors['vel_2d_mps'][:n]
+        pos_2d_m = store.vectors['pos_2d_m'][:n]
+
+        px_Ns, py_Ns = (mass_kg @ vel_2d_mps).tolist()
+        kinetic_J = 0.5 * float(mass_kg @ np.einsum('ij,ij->i', vel_2d_mps, vel_2d_mps))
+        mx_kgm, my_kgm = (mass_kg @ pos_2d_m).tolist()
+        gravity_J = -(mx_kgm * self.g_2d_mps2.x + my_kgm * self.g_2d_mps2.y)
+
+        # Angular momentum about the center: sum of m(x vy - y vx), shifted from the origin to the center.
+        center_x_m = 0.5 * (self.walls_dic["L_m"] + self.walls_dic["R_m"])
+        center_y_m = 0.5 * (self.walls_dic["B_m"] + self.walls_dic["T_m"])
+        mass_pos_2d_kgm = mass_kg[:, np.newaxis] * pos_2d_m
+        L_Js = (float(np.dot(mass_pos_2d_kgm[:,0], vel_2d_mps[:,1]) - np.dot(mass_pos_2d_kgm[:,1], vel_2d_mps[:,0]))
+                - center_x_m * py_Ns + center_y_m * px_Ns + self.spin_angular_momentum_Js())
+
+        # Springs, from the arrays of the spring force table. The table is refreshed by the spring force
+        # calculation at the start of each step (see record_diagnostics), not here.
+        table = self.spring_force_table
+        spring_J = 0.0
+        if len(table.rows_1) > 0:
+            separation_2d_m = store.vectors['pos_2d_m'][table.rows_1] - store.vectors['pos_2d_m'][table.rows_2]
+            stretch_m = np.sqrt(np.einsum('ij,ij->i', separation_2d_m, separation_2d_m)) - table.length_m
+            spring_J = 0.5 * float(np.dot(table.k_Npm, stretch_m**2))
+        for spring in table.other_springs:
+            stretch_m = (spring.p1.pos_2d_m - spring.p2.pos_2d_m).length() - spring.length_m
+            spring_J += 0.5 * spring.strength_Npm * stretch_m**2
+
+        total_J = kinetic_J + spring_J + gravity_J
+        return (self.time_s, kinetic_J, spring_J, gravity_J, total_J, px_Ns, py_Ns, L_Js)
+
+    def handle_hits_by_client(self, events):
+        # Total the hits in this step for each client that fired the bullets.
+        self.hits_by_client = {}
+        for kind, puckA, puckB, approach_speed_mps in events:
+            hit = self.bullet_hit(kind, puckA, puckB)
+            if hit is None: continue
+            client_name = hit[0].client_name
+            self.hits_by_client[client_name] = self.hits_by_client.get(client_name, 0) + 1
+
+    def spin_angular_momentum_Js(self):
+        # The pucks of the circular engines don't spin.
+        return 0.0
+
+    def record_diagnostics(self, physics_step_s):
+        # Called by the game loop after each step, with the time taken by the physics step (the world
+        # step for Box2D). A sample is recorded after at least diagnostics_decimation steps, and once
+        # the physics time since the last sample is enough that the cost of that sample is within
+        # the diagnostics_budget of it.
+        self.diagnostics_step_count += 1
+        self.diagnostics_physics_s += physics_step_s
+        if self.diagnostics_step_count < self.diagnostics_decimation: return
+        if self.diagnostics_sample_s > self.diagnostics_budget * self.diagnostics_physics_s: return
+
+        # The spring table's rows are from the spring force calculation at the start of this step. If
+        # pucks have been removed since then (the store rows have moved), wait for the next step.
+        table_key = self.spring_force_table.key
+        if (table_key is None) or (table_key[0] != self.puck_store.layout_version): return
+
+        sample_start_s = time.perf_counter()
+        previous_J = self.diagnostics.latest('total_J')
+        sample = self.measure_diagnostics()
+        self.diagnostics.append(sample)
+
+        total_J = sample[4]
+        if not self.diagnostics_blowup_reported:
+            if (not math.isfinite(total_J)) or ((previous_J is not None) and
+                    (abs(total_J - previous_J) > self.diagnostics_blowup_factor * max(abs(previous_J), 1.0))):
+                print(f"Energy blow-up at t = {self.time_s:.3f} s: {previous_J} J to {total_J} J")
+                self.diagnostics_blowup_reported = True
+
+        if self.diagnostics_sink:
+            self.diagnostics_sink.write_new(self.diagnostics)
+
+        self.diagnostics_sample_s = time.perf_counter() - sample_start_s
+        self.diagnostics_step_count = 0
+        self.diagnostics_physics_s = 0.0
+
+    def reset_diagnostics(self):
+        self.diagnostics.reset()
+        self.diagnostics_step_count = 0
+        self.diagnostics_physics_s = 0.0
+        self.diagnostics_sample_s = 0.0
+        self.diagnostics_blowup_reported = False
+        if self.diagnostics_sink:
+            self.diagnostics_sink.written_count = 0
+
+    def start_diagnostics_file(self, file_name):
+        # Stream the samples to a CSV file (and turn the diagnostics on).
+        self.stop_diagnostics_file()
+        self.diagnostics_sink = DiagnosticsFileSink(file_name)
+        self.diagnostics_sink.written_count = self.diagnostics.count
+        self.diagnostics_enabled = True
+
+    def stop_diagnostics_file(self):
+        if self.diagnostics_sink:
+            self.diagnostics_sink.close()
+            self.diagnostics_sink = None
         
     def normal_AFTER_2d_mps(self, A_normal_BEFORE_2d_mps, A_mass_kg, B_normal_BEFORE_2d_mps, B_mass_kg, CR_puck):
         # For inputs as defined here, this returns the AFTER normal for the first puck in the inputs. So if B
@@ -513,6 +1059,83 @@ class AirTable:
         B = self.normal_AFTER_2d_mps(B_normal_BEFORE_2d_mps, B_mass_kg, A_normal_BEFORE_2d_mps, A_mass_kg, CR_puck)
         return A, B
 
+    def projection_xy(self, v_x, v_y, onto_x, onto_y):
+        # Vec2D.projection_onto, on floats.
+        onto_m2 = (onto_x * onto_x) + (onto_y * onto_y)
+        if (onto_m2 > 0):
+            scale = ((v_x * onto_x) + (v_y * onto_y)) / onto_m2
+            return onto_x * scale, onto_y * scale
+        else:
+            return v_x * 0, v_y * 0
+
+    def AandB_normal_AFTER_xy(self, A_x, A_y, A_mass_kg, B_x, B_y, B_mass_kg, CR_puck):
+        # AandB_normal_AFTER_2d_mps, on floats. The 1D collision formula is applied to each component.
+        mass_sum_kg = A_mass_kg + B_mass_kg
+        A_after_x = ((B_x - A_x) * (CR_puck * B_mass_kg) + (A_x * A_mass_kg + B_x * B_mass_kg)) / mass_sum_kg
+        A_after_y = ((B_y - A_y) * (CR_puck * B_mass_kg) + (A_y * A_mass_kg + B_y * B_mass_kg)) / mass_sum_kg
+        # The symmetry: put the B data first.
+        mass_sum_kg = B_mass_kg + A_mass_kg
+        B_after_x = ((A_x - B_x) * (CR_puck * A_mass_kg) + (B_x * B_mass_kg + A_x * A_mass_kg)) / mass_sum_kg
+        B_after_y = ((A_y - B_y) * (CR_puck * A_mass_kg) + (B_y * B_mass_kg + A_y * A_mass_kg)) / mass_sum_kg
+        return A_after_x, A_after_y, B_after_x, B_after_y
+
+    def categories_collide(self, puck, otherpuck):
+        # Box2D-style filtering: each puck's category must be in the other's mask.
+        return ((puck.categoryBits & otherpuck.maskBits) != 0) and ((otherpuck.categoryBits & puck.maskBits) != 0)
+
+    def collision_filter(self, i_index, j_index, rows):
+        # Vectorized categories_collide for index arrays of pairs (rows are the store rows of the pucks list).
+        categoryBits = self.puck_store.ints['categoryBits'][rows]
+        maskBits = self.puck_store.ints['maskBits'][rows]
+        return ((categoryBits[i_index] & maskBits[j_index]) != 0) & ((categoryBits[j_index] & maskBits[i_index]) != 0)
+
+    def count_bullet_hit(self, puck, otherpuck):
+        # If it's a bullet coming from another client, add to the
+        # hit count for non-bullet client.
+        if (otherpuck.client_name != None):
+            if (puck.client_name != otherpuck.client_name):
+                if (otherpuck.bullet and (not puck.bullet)):
+                    if puck.gun and puck.gun.shield:
+                        puck.gun.shield_hit_count += 1
+                        puck.gun.shield_hit = True
+                        puck.gun.shield_hit_duration_s = 0.0
+                    else:
+                        puck.bullet_hit_count += 1
+                        puck.hit = True
+                        puck.hitflash_duration_timer_s = 0.0
+
+    def predict_pair_times(self, i_index, j_index, pos_2d_m, vel_2d_mps, radius_m, groupIndex):
+        # Time until each pair (i, j) of pucks first touches. The positions are for the same
+        # instant for all the pucks. Returns infinity for pairs that will not collide. (If
+        # displacements are given in place of the velocities, the result is a fraction of
+        # the displacement.)
+        dp_2d_m = pos_2d_m[j_index] - pos_2d_m[i_index]
+        dv_2d_mps = vel_2d_mps[j_index] - vel_2d_mps[i_index]
+        
+        # Solve |dp + dv*t| = (r_i + r_j) for the first (smaller) root.
+        b = np.einsum('ij,ij->i', dp_2d_m, dv_2d_mps)
+        a = np.einsum('ij,ij->i', dv_2d_mps, dv_2d_mps)
+        c = np.einsum('ij,ij->i', dp_2d_m, dp_2d_m) - (radius_m[i_index] + radius_m[j_index])**2
+        discriminant = b*b - a*c
+        
+        # Only pairs that are approaching (b < 0) and whose paths come close enough (discriminant >= 0).
+        approaching = (b < 0) & (discriminant >= 0)
+        # Ignore collisions within same negative group.
+        approaching &= ~((groupIndex[i_index] == groupIndex[j_index]) & (groupIndex[i_index] < 0))
+        
+        time_s = np.full(len(b), np.inf)
+        k = np.flatnonzero(approaching)
+        # This form of the quadratic root avoids the cancellation error of (-b - sqrt(d))/a. Pairs
+        # that are already overlapping (c <= 0), and approaching, collide immediately.
+        time_s[k] = np.where(c[k] <= 0, 0.0, c[k] / (-b[k] + np.sqrt(discriminant[k])))
+        return time_s
+
+    def near_fence(self, x_m, y_m, r_m):
+        # The tests of checkForFenceCollisions, on floats (e.g. from the puck lists).
+        walls_dic = self.walls_dic
+        return (((y_m - r_m) < walls_dic["B_m"]) or ((y_m + r_m) > walls_dic["T_m"]) or
+                ((x_m - r_m) < walls_dic["L_m"]) or ((x_m + r_m) > walls_dic["R_m"]))
+
     def checkForFenceCollisions(self, puck):
         if (((puck.pos_2d_m.y - puck.radius_m) < self.walls_dic["B_m"]) or ((puck.pos_2d_m.y + puck.radius_m) > self.walls_dic["T_m"])):
             
@@ -543,27 +1166,811 @@ class AirTable:
             puck.vel_2d_mps.x *= -1 * min(self.coef_rest, puck.coef_rest)
             if (self.engine == "circular-perfectKiss") and self.perfect_kiss: self.collision_count += 1 * self.count_direction
 
+    def add_static_shape(self, shape):
+        self.static_shapes.append(shape)
+        self.static_bvh = None
+
+    def remove_static_shape(self, shape):
+        self.static_shapes.remove(shape)
+        self.static_bvh = None
+
+    def remove_all_static_shapes(self):
+        self.static_shapes = []
+        self.static_bvh = None
+
+    def checkForStaticCollisions(self, puck):
+        # Collisions with the static wall segments and polygons. Only the shapes near the puck
+        # (from the bounding-volume hierarchy) are checked.
+        if self.static_bvh is None:
+            self.static_bvh = StaticBVH(self.static_shapes)
+
+        x_m = puck.pos_2d_m.x
+        y_m = puck.pos_2d_m.y
+        r_m = puck.radius_m
+        for shape in self.static_bvh.query(x_m - r_m, y_m - r_m, x_m + r_m, y_m + r_m):
+            contact = shape.contact(x_m, y_m, r_m)
+            if contact is None: continue
+            normal_x, normal_y, penetration_m = contact
+
+            if self.correct_for_wall_penetration:
+                # As for the fence, move the puck out by twice the penetration (as if reflected off the wall).
+                x_m += 2 * penetration_m * normal_x
+                y_m += 2 * penetration_m * normal_y
+                puck.pos_2d_m = Vec2D(x_m, y_m)
+
+            # Reverse the normal component of the velocity, if the puck is moving into the wall.
+            vel_2d_mps = puck.vel_2d_mps
+            normal_speed_mps = vel_2d_mps.x * normal_x + vel_2d_mps.y * normal_y
+            if normal_speed_mps < 0.0:
+                CR = min(self.coef_rest, puck.coef_rest)
+                puck.vel_2d_mps = Vec2D(vel_2d_mps.x - (1 + CR) * normal_speed_mps * normal_x,
+                                        vel_2d_mps.y - (1 + CR) * normal_speed_mps * normal_y)
+                if (self.engine == "circular-perfectKiss") and self.perfect_kiss: self.collision_count += 1 * self.count_direction
+
+    def check_for_static_collisions_allPucks(self):
+        for puck in self.pucks:
+            if not puck.sleeping:
+                self.checkForStaticCollisions(puck)
+
+    def set_broad_phase(self, broad_phase, cell_size_m=None):
+        if broad_phase not in self.broad_phases:
+            raise ValueError(f"Unknown broad phase: {broad_phase}")
+        self.broad_phase = broad_phase
+        if broad_phase == "spatial-hash":
+            self.spatial_hash.cell_size_m = cell_size_m
+
+    def set_collision_resolver(self, collision_resolver):
+        if collision_resolver not in self.collision_resolvers:
+            raise ValueError(f"Unknown collision resolver: {collision_resolver}")
+        self.collision_resolver = collision_resolver
+
+    def sleep_flags(self):
+        # The sleep flags of the pucks (a list, in the order of the pucks list), or None if no
+        # puck is asleep (or sleeping is off).
+        if not self.sleeping_enabled: return None
+        sleeping = (self.puck_store.ints['sleeping'][self.puck_store.rows_of(self.pucks)] != 0).tolist()
+        return sleeping if any(sleeping) else None
+
+    def candidate_pairs(self, include_sleeping=False):
+        # Index pairs (i < j) of pucks that are close enough to be checked for collisions. Pairs of
+        # two sleeping pucks are left out unless include_sleeping is set.
+        sleeping = None if include_sleeping else self.sleep_flags()
+        if self.broad_phase == "spatial-hash":
+            return self.spatial_hash.candidate_pairs(self.pucks, sleeping)
+        elif self.broad_phase == "sweep-and-prune":
+            return self.sweep_and_prune.candidate_pairs(self.pucks, sleeping)
+        else:
+            n_pucks = len(self.pucks)
+            if sleeping:
+                return [(i, j) for i in range(n_pucks) for j in range(i+1, n_pucks) if not (sleeping[i] and sleeping[j])]
+            return [(i, j) for i in range(n_pucks) for j in range(i+1, n_pucks)]
+
+    def check_for_fast_puck_collisions(self):
+        # Swept-circle collision checks for the fast pucks. The pucks have already been moved
+        # (by vel_2d_mps * dt_s). Each fast puck's path over the step is checked against the
+        # paths of all the other pucks. At the earliest contact, the two pucks are put at their
+        # touching positions, the collision is resolved, and they travel the rest of the step
+        # with the new velocities. Walls don't need this: the fence check mirrors a puck back
+        # inside no matter how far past the wall it has gone.
+        n_pucks = len(self.pucks)
+        if n_pucks < 2: return
+        
+        store = self.puck_store
+        rows = store.rows_of(self.pucks)
+        vel_2d_mps = store.vectors['vel_2d_mps'][rows]
+        radius_m = store.scalars['radius_m'][rows]
+        
+        speed_mps = np.sqrt(np.einsum('ij,ij->i', vel_2d_mps, vel_2d_mps))
+        is_bullet = np.fromiter((puck.bullet for puck in self.pucks), dtype=bool, count=n_pucks)
+        fast = np.flatnonzero(is_bullet | (speed_mps * abs(self.dt_s) > radius_m))
+        
+        for i in fast:
+            # Positions at the start of the step and the displacements during the step. The
+            # arrays are re-read for each fast puck because an earlier one may have changed them.
+            pos_2d_m = store.vectors['pos_2d_m'][rows]
+            displacement_2d_m = store.vectors['vel_2d_mps'][rows] * self.dt_s
+            start_2d_m = pos_2d_m - displacement_2d_m
+            
+            others = np.delete(np.arange(n_pucks), i)
+            others = others[self.collision_filter(np.full(n_pucks - 1, i), others, rows)]
+            if len(others) == 0: continue
+            fractions = self.predict_pair_times(np.full(len(others), i), others, start_2d_m, displacement_2d_m, radius_m, store.ints['groupIndex'][rows])
+            k = np.argmin(fractions)
+            if fractions[k] < 1.0:
+                j = others[k]
+                self.resolve_swept_collision(min(i, j), max(i, j), fractions[k])
+
+    def resolve_swept_collision(self, i, j, fraction):
+        # Collide pucks i and j (i < j) at the fraction of the time step when they touch.
+        puck, otherpuck = self.pucks[i], self.pucks[j]
+        
+        if self.engine == "circular":
+            self.collision_count += 1
+        elif (self.engine == "circular-perfectKiss") and self.perfect_kiss:
+            self.collision_count += 1 * self.count_direction
+        
+        self.count_bullet_hit(puck, otherpuck)
+        
+        # Move the pucks back to the touching positions.
+        time_remaining_s = self.dt_s * (1.0 - fraction)
+        puck.pos_2d_m = puck.pos_2d_m - (puck.vel_2d_mps * time_remaining_s)
+        otherpuck.pos_2d_m = otherpuck.pos_2d_m - (otherpuck.vel_2d_mps * time_remaining_s)
+        
+        # Parallel to the normal
+        puck_to_puck_2d_m = otherpuck.pos_2d_m - puck.pos_2d_m
+        # Parallel to the tangent
+        tangent_p_to_p_2d_m = Vec2D.rotate90(puck_to_puck_2d_m)
+        
+        # The calculate velocity components along and perpendicular to the normal.
+        puck_normal_2d_mps = puck.vel_2d_mps.projection_onto(puck_to_puck_2d_m)
+        puck_tangent_2d_mps = puck.vel_2d_mps.projection_onto(tangent_p_to_p_2d_m)
+        otherpuck_normal_2d_mps = otherpuck.vel_2d_mps.projection_onto(puck_to_puck_2d_m)
+        otherpuck_tangent_2d_mps = otherpuck.vel_2d_mps.projection_onto(tangent_p_to_p_2d_m)
+        
+        CR_puck = min(puck.coef_rest, otherpuck.coef_rest)
+        puck_normal_AFTER_mps, otherpuck_normal_AFTER_mps = self.AandB_normal_AFTER_2d_mps( puck_normal_2d_mps, puck.mass_kg, otherpuck_normal_2d_mps, otherpuck.mass_kg, CR_puck)
+        
+        puck.vel_2d_mps = puck_normal_AFTER_mps + puck_tangent_2d_mps
+        otherpuck.vel_2d_mps = otherpuck_normal_AFTER_mps + otherpuck_tangent_2d_mps
+        
+        # Travel the rest of the time step with the AFTER velocities.
+        puck.pos_2d_m = puck.pos_2d_m + (puck.vel_2d_mps * time_remaining_s)
+        otherpuck.pos_2d_m = otherpuck.pos_2d_m + (otherpuck.vel_2d_mps * time_remaining_s)
+
+    def candidate_pair_arrays(self, include_sleeping=False):
+        # The candidate pairs as two index arrays (for the vectorized resolvers). Pairs that are
+        # filtered out by their category and mask bits are dropped. Pairs of sleeping pucks are
+        # also left out unless include_sleeping is set.
+        rows = self.puck_store.rows_of(self.pucks)
+        sleeping = None
+        if self.sleeping_enabled and (not include_sleeping):
+            sleeping = self.puck_store.ints['sleeping'][rows] != 0
+            if np.all(sleeping):
+                return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+        
+        if self.broad_phase == "all-pairs":
+            i_index, j_index = np.triu_indices(len(self.pucks), 1)
+            collide = self.collision_filter(i_index, j_index, rows)
+            if (sleeping is not None) and np.any(sleeping):
+                collide &= ~(sleeping[i_index] & sleeping[j_index])
+            if not np.all(collide):
+                i_index, j_index = i_index[collide], j_index[collide]
+        else:
+            # The broad phases have already applied the filter (and left out the sleeping pairs).
+            pairs = np.array(self.candidate_pairs(include_sleeping), dtype=np.intp).reshape(-1, 2)
+            i_index, j_index = pairs[:,0], pairs[:,1]
+        return i_index, j_index
+
+    def wake_pucks_with_new_motion(self, n):
+        # Wake the sleeping pucks (rows 0 to n-1 of the store) that have been given a velocity
+        # (e.g. by a collision, a throw, or the r key) or a jet, cursor-string or impulse force.
+        store = self.puck_store
+        sleeping = store.ints['sleeping'][:n]
+        if not np.any(sleeping): return
+        
+        vectors = store.vectors
+        moving = np.any(vectors['vel_2d_mps'][:n] != 0.0, axis=1)
+        for name in ['jet_force_2d_N', 'cursorString_spring_force_2d_N', 'impulse_2d_Ns']:
+            moving |= np.any(vectors[name][:n] != 0.0, axis=1)
+        
+        waking = (sleeping != 0) & moving
+        if np.any(waking):
+            sleeping[waking] = 0
+            store.scalars['rest_time_s'][:n][waking] = 0.0
+            self.puck_woke = True
+
+    def wake_puck(self, puck):
+        if puck.sleeping:
+            puck.sleeping = 0
+            self.puck_woke = True
+        puck.store.scalars['rest_time_s'][puck.store_row] = 0.0
+
+    def wake_all_pucks(self):
+        # E.g. when gravity is toggled.
+        for puck in self.pucks:
+            self.wake_puck(puck)
+
+    def wake_pucks_near(self, puck):
+        # Wake the pucks touching this one, and the pucks connected to it by springs. Their
+        # islands then wake in the next update_sleep_states. (Used when a puck is deleted.)
+        if not self.sleeping_enabled: return
+        for otherpuck in self.pucks:
+            if otherpuck is puck: continue
+            reach_m = (puck.radius_m + otherpuck.radius_m) * REACH_FACTOR
+            if (otherpuck.pos_2d_m - puck.pos_2d_m).length_squared() < reach_m**2:
+                self.wake_puck(otherpuck)
+        for spring in self.springs:
+            if spring.p1 is puck:
+                self.wake_puck(spring.p2)
+            elif spring.p2 is puck:
+                self.wake_puck(spring.p1)
+
+    def find_islands(self, pair_arrays=None):
+        # Label each puck with its island: groups of pucks connected by springs or by touching
+        # (within the broad-phase reach). Returns an array of labels, one per puck. The candidate
+        # pairs of the step's collision checks can be given (as two index arrays); they are
+        # listed here if not.
+        n_pucks = len(self.pucks)
+        parent = list(range(n_pucks))
+        
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]  # path halving
+                i = parent[i]
+            return i
+        
+        def join(i, j):
+            root_i, root_j = root(i), root(j)
+            if root_i != root_j:
+                parent[root_j] = root_i
+        
+        index_of = {puck: i for i, puck in enumerate(self.pucks)}
+        for spring in self.springs:
+            # Pin pucks are not in the pucks list. They don't connect islands.
+            if (spring.p1 in index_of) and (spring.p2 in index_of):
+                join(index_of[spring.p1], index_of[spring.p2])
+        
+        # (Pairs of two sleeping pucks are not listed. So a sleeping island that is touched
+        # wakes one layer of pucks at a time.)
+        if pair_arrays is None:
+            pair_arrays = self.candidate_pair_arrays()
+        i_index, j_index = pair_arrays
+        store = self.puck_store
+        rows = store.rows_of(self.pucks)
+        pos_2d_m = store.vectors['pos_2d_m'][rows]
+        radius_m = store.scalars['radius_m'][rows]
+        puck_to_puck_2d_m = pos_2d_m[j_index] - pos_2d_m[i_index]
+        p_to_p_m2 = np.einsum('ij,ij->i', puck_to_puck_2d_m, puck_to_puck_2d_m)
+        reach_m2 = ((radius_m[i_index] + radius_m[j_index]) * REACH_FACTOR)**2
+        for k in np.flatnonzero(p_to_p_m2 < reach_m2):
+            join(int(i_index[k]), int(j_index[k]))
+        
+        return np.array([root(i) for i in range(n_pucks)], dtype=np.intp)
+
+    def update_sleep_states(self):
+        # Call this at the end of each physics step (after the collisions).
+        step_pair_arrays, self.step_pair_arrays = self.step_pair_arrays, None
+        if (not self.sleeping_enabled) or (len(self.pucks) == 0): return
+        
+        store = self.puck_store
+        rows = store.rows_of(self.pucks)
+        sleeping = store.ints['sleeping'][rows] != 0
+        vel_2d_mps = store.vectors['vel_2d_mps'][rows]
+        speed_mps2 = np.einsum('ij,ij->i', vel_2d_mps, vel_2d_mps)
+        
+        # Time at rest for the awake pucks.
+        rest_time_s = store.scalars['rest_time_s'][rows]
+        slow = speed_mps2 < self.sleep_speed_threshold_mps**2
+        rest_time_s = np.where(slow, rest_time_s + abs(self.dt_s), 0.0)
+        rest_time_s[sleeping] = 0.0
+        store.scalars['rest_time_s'][rows] = rest_time_s
+        
+        ready = (~sleeping) & (rest_time_s >= self.time_to_sleep_s)
+        
+        # The islands only need to be found when something may change: a puck has woken, or the
+        # set of ready pucks has changed. A ready puck in an island that is still moving stays
+        # ready, so the islands are also re-checked every time_to_sleep_s while there is one.
+        ready_key = (store.layout_version, rows[ready].tobytes())
+        ready_changed = (ready_key != self.ready_key)
+        self.ready_key = ready_key
+        self.islands_age_s += abs(self.dt_s)
+        if not (self.puck_woke or (np.any(ready) and (ready_changed or (self.islands_age_s >= self.time_to_sleep_s)))): return
+        self.puck_woke = False
+        self.islands_age_s = 0.0
+        
+        labels = self.find_islands(step_pair_arrays)
+        n_members = np.bincount(labels, minlength=len(labels))
+        n_quiet = np.bincount(labels, weights=(sleeping | ready).astype(float), minlength=len(labels))
+        n_sleeping = np.bincount(labels, weights=sleeping.astype(float), minlength=len(labels))
+        
+        # An island goes to sleep when all of its pucks are quiet (asleep or ready to sleep).
+        # An island with a sleeping puck and a puck that is still moving is woken up.
+        to_sleep = ((n_quiet == n_members) & (n_sleeping < n_members))[labels]
+        to_wake = ((n_sleeping > 0) & (n_quiet < n_members))[labels] & sleeping
+        
+        if np.any(to_sleep):
+            sleep_rows = rows[to_sleep]
+            store.ints['sleeping'][sleep_rows] = 1
+            store.vectors['vel_2d_mps'][sleep_rows] = 0.0
+        if np.any(to_wake):
+            wake_rows = rows[to_wake]
+            store.ints['sleeping'][wake_rows] = 0
+            store.scalars['rest_time_s'][wake_rows] = 0.0
+
+    def any_categories_collide(self):
+        # False if the category and mask bits of the pucks rule out every puck-puck collision
+        # (e.g. a burst of pucks that pass through each other). Then the pair checks can be skipped.
+        # Also sets filters_active: whether the bits rule out any of the puck-puck collisions.
+        rows = self.puck_store.rows_of(self.pucks)
+        filter_bits = np.stack((self.puck_store.ints['categoryBits'][rows], self.puck_store.ints['maskBits'][rows]), axis=1)
+        combinations, counts = np.unique(filter_bits, axis=0, return_counts=True)
+        any_collide = False
+        self.filters_active = False
+        for a in range(len(combinations)):
+            for b in range(a, len(combinations)):
+                if (a == b) and (counts[a] < 2): continue
+                if (combinations[a,0] & combinations[b,1]) and (combinations[b,0] & combinations[a,1]):
+                    any_collide = True
+                else:
+                    self.filters_active = True
+        return any_collide
+
     def check_for_collisions(self):
+        skip_puck_collisions = self.inhibit_all_puck_collisions or (not self.any_categories_collide())
+
+        if self.collision_resolver == "sequential-impulse":
+            # The contacts (and the tangle check) were handled in the solver, before the
+            # positions were updated. Only the swept checks for fast pucks are done here.
+            if self.continuous_collisions and (not skip_puck_collisions):
+                self.check_for_fast_puck_collisions()
+            if self.static_shapes:
+                self.check_for_static_collisions_allPucks()
+            return
+
         self.tangled = False
 
-        # Collisions with the perimeter fence (walls)
-        for i, puck in enumerate(self.pucks):
-            if not self.inhibit_wall_collisions:
-                self.checkForFenceCollisions(puck)
+        if self.continuous_collisions and (not skip_puck_collisions):
+            self.check_for_fast_puck_collisions()
 
-            # Collisions with other pucks
-            if not self.inhibit_all_puck_collisions:
-                for otherpuck in self.pucks[i+1:]:
-                    self.check_for_puck_collisions(puck, otherpuck)
+        # The state read by the loops below (and by the scalar pair check), as plain lists.
+        self.puck_lists = PuckLists(self.puck_store, self.pucks)
+        sleeping = self.puck_lists.sleeping
+        
+        # Sleeping pucks don't move. So they are not checked against the walls, the static shapes
+        # or each other. (Nothing is left to check when all the pucks are asleep.)
+        if self.sleeping_enabled and all(sleeping): return
+
+        if self.collision_resolver in ["numpy-batch", "parallel-strips"]:
+            if not self.inhibit_wall_collisions:
+                lists = self.puck_lists
+                for i, puck in enumerate(self.pucks):
+                    if (not sleeping[i]) and self.near_fence(lists.x_m[i], lists.y_m[i], lists.radius_m[i]):
+                        self.checkForFenceCollisions(puck)
+            if self.static_shapes:
+                self.check_for_static_collisions_allPucks()
+
+            if not skip_puck_collisions:
+                if not ((self.collision_resolver == "parallel-strips") and self.resolve_puck_collisions_parallel()):
+                    i_index, j_index = self.candidate_pair_arrays()
+                    self.step_pair_arrays = (i_index, j_index)
+                    self.resolve_puck_collisions_batch(i_index, j_index)
+            return
+
+        # The pair check is called with the indices (in the pucks list) of the two pucks.
+        if self.collision_resolver == "scalar":
+            check_pair = self.check_for_puck_collisions_scalar
+        else:
+            pucks = self.pucks
+            def check_pair(i, j):
+                self.check_for_puck_collisions(pucks[i], pucks[j])
+
+        if (self.broad_phase == "all-pairs") or skip_puck_collisions:
+            lists = self.puck_lists
+            x_m, y_m, radius_m = lists.x_m, lists.y_m, lists.radius_m
+            n_pucks = len(self.pucks)
+            # The awake pucks (in order), for the pairs of the sleeping pucks.
+            awake = [k for k in range(n_pucks) if not sleeping[k]] if any(sleeping) else None
+            
+            # Collisions with the perimeter fence (walls) and the static shapes
+            for i, puck in enumerate(self.pucks):
+                if not sleeping[i]:
+                    if (not self.inhibit_wall_collisions) and self.near_fence(x_m[i], y_m[i], radius_m[i]):
+                        self.checkForFenceCollisions(puck)
+                        lists.reread(i)
+                    if self.static_shapes:
+                        self.checkForStaticCollisions(puck)
+                        lists.reread(i)
+
+                # Collisions with other pucks. A sleeping puck is only checked against the (later)
+                # awake pucks. Only the pairs that are close enough to be tangled (the first test
+                # in check_pair) are passed to check_pair.
+                if not skip_puck_collisions:
+                    later_pucks = awake[bisect.bisect_right(awake, i):] if sleeping[i] else range(i+1, n_pucks)
+                    for j in later_pucks:
+                        dx_m, dy_m = x_m[j] - x_m[i], y_m[j] - y_m[i]
+                        if (dx_m*dx_m + dy_m*dy_m) < (1.1 * (radius_m[i] + radius_m[j])**2):
+                            check_pair(i, j)
+                            lists.reread(i)
+                            lists.reread(j)
+        else:
+            pairs = self.candidate_pairs()
+            if self.sleeping_enabled:
+                pair_array = np.array(pairs, dtype=np.intp).reshape(-1, 2)
+                self.step_pair_arrays = (pair_array[:,0], pair_array[:,1])
+            self.check_listed_pairs(pairs, check_pair)
+
+    def check_listed_pairs(self, pairs, check_pair):
+        # Wall and puck-puck checks using the broad-phase pairs. The pairs are sorted, so the
+        # puck-puck checks can be interleaved with the wall checks in the same order as the
+        # all-pairs loop.
+        #
+        # The pairs were listed at the positions from before these checks. The wall and pair
+        # corrections move pucks, and the listing only allows for moves up to MOVE_MARGIN_FACTOR
+        # of the radius (in x or y). A puck that moves further (e.g. a penetration back-out at a
+        # low approach speed) is checked against every later puck, and every earlier puck checks
+        # it. So the same pairs are checked, in the same order, as in the all-pairs loop.
+        pucks = self.pucks
+        n_pucks = len(pucks)
+        lists = self.puck_lists
+        x_m, y_m, radius_m, sleeping = lists.x_m, lists.y_m, lists.radius_m, lists.sleeping
+        x_start_m, y_start_m = x_m[:], y_m[:]
+        margin_m = [r_m * MOVE_MARGIN_FACTOR for r_m in radius_m]
+        moved = set()
+        # The listed pairs leave out the pairs of two sleeping pucks. Only the checks of the
+        # moved pucks (below) need to skip them.
+        any_sleeping = any(sleeping)
+
+        def note_move(k):
+            # Update the lists, after a check that may have moved puck k.
+            lists.reread(k)
+            if k in moved: return
+            if (abs(x_m[k] - x_start_m[k]) > margin_m[k]) or (abs(y_m[k] - y_start_m[k]) > margin_m[k]):
+                moved.add(k)
+
+        def check(i, j):
+            # Only the pairs that are close enough to be tangled (the first test in check_pair)
+            # are passed to check_pair.
+            if any_sleeping and sleeping[i] and sleeping[j]: return
+            dx_m, dy_m = x_m[j] - x_m[i], y_m[j] - y_m[i]
+            if (dx_m*dx_m + dy_m*dy_m) < (1.1 * (radius_m[i] + radius_m[j])**2):
+                check_pair(i, j)
+                note_move(i)
+                note_move(j)
+
+        n_pairs = len(pairs)
+        k = 0
+        for i, puck in enumerate(pucks):
+            if not sleeping[i]:
+                if (not self.inhibit_wall_collisions) and self.near_fence(x_m[i], y_m[i], radius_m[i]):
+                    self.checkForFenceCollisions(puck)
+                    note_move(i)
+                if self.static_shapes:
+                    self.checkForStaticCollisions(puck)
+                    note_move(i)
+
+            listed_j = []
+            while (k < n_pairs) and (pairs[k][0] == i):
+                listed_j.append(pairs[k][1])
+                k += 1
+
+            if i in moved:
+                for j in range(i+1, n_pucks):
+                    check(i, j)
+                continue
+
+            # The listed pairs, plus the later pucks that have moved too far.
+            if moved:
+                listed_j = sorted(set(listed_j).union(j for j in moved if j > i))
+            j_last = i
+            for j in listed_j:
+                check(i, j)
+                j_last = j
+                if i in moved: break
+            if i in moved:
+                # This puck moved too far in one of its own pair corrections.
+                for j in range(j_last+1, n_pucks):
+                    check(i, j)
 
 
 class CircularAirTable(AirTable):
-    def __init__(self, walls_dic):
-        super().__init__(walls_dic)
+    def __init__(self, walls_dic, ctx=None):
+        super().__init__(walls_dic, ctx=ctx)
 
         self.engine = "circular"
+        self.collision_resolvers.append("scalar")
+        self.collision_resolvers.append("numpy-batch")
+        self.collision_resolvers.append("sequential-impulse")
+        self.collision_resolvers.append("parallel-strips")
+
+        # Sequential-impulse contact solver (collision_resolver = "sequential-impulse"). The
+        # accumulated normal impulse of each contact is kept between steps (keyed by the
+        # pair of pucks, or the puck and the wall) and applied at the start of the next step.
+        self.solver_iterations = 10
+        self.warm_starting = True
+        self.contact_impulse_cache = {}
+        # Fraction of the penetration (beyond the allowed slop) removed per step.
+        self.baumgarte_factor = 0.2
+        self.linear_slop_m = 0.005
+        # Below this approach speed, contacts are treated as resting (no bounce).
+        self.restitution_threshold_mps = 1.0
+
+        # Parallel puck-puck collisions (collision_resolver = "parallel-strips"): the table is split into
+        # vertical strips, resolved by a pool of worker processes (see A15_parallel.py). The pool is
+        # started when the resolver is selected (see set_collision_resolver). Below parallel_min_pucks,
+        # the numpy-batch resolver is used instead (handing the strips to the workers costs more than
+        # it saves).
+        self.strip_collider = StripCollider(n_workers=None)
+        self.parallel_min_pucks = 500
+
+    def update_TotalForce_Speed_Position_allPucks(self):
+        if self.collision_resolver != "sequential-impulse":
+            super().update_TotalForce_Speed_Position_allPucks()
+            return
+
+        # Impulses change the velocities, so the contacts are solved between the velocity
+        # update and the position update. (This is always semi-implicit Euler, whatever the
+        # selected integrator.)
+        n = self.update_TotalForce_Speed_allPucks()
+        if n == 0: return
+        self.tangled = False
+        self.solve_contacts_sequential_impulse()
+        
+        vectors = self.puck_store.vectors
+        vectors['pos_2d_m'][:n] += vectors['vel_2d_mps'][:n] * self.dt_s
+
+    def solve_contacts_sequential_impulse(self):
+        n_pucks = len(self.pucks)
+        if (n_pucks == 0) or (self.dt_s <= 0): return
+        
+        store = self.puck_store
+        rows = store.rows_of(self.pucks)
+        pos_2d_m = store.vectors['pos_2d_m'][rows]
+        radius_m = store.scalars['radius_m'][rows]
+        coef_rest = store.scalars['coef_rest'][rows]
+        groupIndex = store.ints['groupIndex'][rows]
+        sleeping = store.ints['sleeping'][rows] != 0
+        inv_mass = 1.0 / store.scalars['mass_kg'][rows]
+        # Plain lists of floats are faster than NumPy for the one-contact-at-a-time updates below.
+        vx = store.vectors['vel_2d_mps'][rows, 0].tolist()
+        vy = store.vectors['vel_2d_mps'][rows, 1].tolist()
+        
+        # Each contact: [i, j, nx, ny, normal_mass, bias_mps, impulse_Ns, key]. The normal points
+        # from puck i to puck j. For a wall contact, j is None and the normal points into the table.
+        contacts = []
+        
+        def add_contact(i, j, nx, ny, penetration_m, CR, key):
+            if j is None:
+                vn_mps = vx[i]*nx + vy[i]*ny
+                normal_mass = 1.0 / inv_mass[i]
+            else:
+                vn_mps = (vx[j] - vx[i])*nx + (vy[j] - vy[i])*ny
+                normal_mass = 1.0 / (inv_mass[i] + inv_mass[j])
+            
+            # Baumgarte stabilization: push out the penetration beyond the slop over a few steps.
+            bias_mps = self.baumgarte_factor / self.dt_s * max(penetration_m - self.linear_slop_m, 0.0)
+            # Restitution for contacts that are approaching fast enough.
+            if vn_mps < -self.restitution_threshold_mps:
+                bias_mps = max(bias_mps, -CR * vn_mps)
+            
+            if key not in self.contact_impulse_cache:
+                # A new contact.
+                if j is not None:
+                    self.collision_count += 1
+                    self.count_bullet_hit(self.pucks[i], self.pucks[j])
+                impulse_Ns = 0.0
+            elif self.warm_starting:
+                impulse_Ns = self.contact_impulse_cache[key]
+            else:
+                impulse_Ns = 0.0
+            contacts.append([i, j, nx, ny, normal_mass, bias_mps, impulse_Ns, key])
+        
+        # Puck-puck contacts
+        if (not self.inhibit_all_puck_collisions) and self.any_categories_collide():
+            i_index, j_index = self.candidate_pair_arrays()
+            self.step_pair_arrays = (i_index, j_index)
+            
+            puck_to_puck_2d_m = pos_2d_m[j_index] - pos_2d_m[i_index]
+            p_to_p_m2 = np.einsum('ij,ij->i', puck_to_puck_2d_m, puck_to_puck_2d_m)
+            r_plus_r_m2 = (radius_m[i_index] + radius_m[j_index])**2
+            if np.any(p_to_p_m2 < (1.1 * r_plus_r_m2)):
+                self.tangled = True
+            
+            # Ignore contacts within same negative group.
+            touching = (p_to_p_m2 < r_plus_r_m2) & ~((groupIndex[i_index] == groupIndex[j_index]) & (groupIndex[i_index] < 0))
+            for k in np.flatnonzero(touching):
+                i, j = int(i_index[k]), int(j_index[k])
+                p_to_p_m = p_to_p_m2[k]**0.5
+                if p_to_p_m > 0:
+                    nx, ny = puck_to_puck_2d_m[k] / p_to_p_m
+                else:
+                    nx, ny = 1.0, 0.0
+                penetration_m = (radius_m[i] + radius_m[j]) - p_to_p_m
+                add_contact(i, j, nx, ny, penetration_m, min(coef_rest[i], coef_rest[j]), (self.pucks[i], self.pucks[j]))
+        
+        # Puck-wall contacts
+        if not self.inhibit_wall_collisions:
+            walls = ((self.walls_dic["L_m"], 0,  1.0, 'L'), (self.walls_dic["R_m"], 0, -1.0, 'R'),
+                     (self.walls_dic["B_m"], 1,  1.0, 'B'), (self.walls_dic["T_m"], 1, -1.0, 'T'))
+            for i in np.flatnonzero(~sleeping):
+                for wall_m, axis, direction, name in walls:
+                    # Distance from the wall to the near edge of the puck (negative if penetrating).
+                    gap_m = (pos_2d_m[i, axis] - wall_m) * direction - radius_m[i]
+                    if gap_m < 0:
+                        nx, ny = (direction, 0.0) if (axis == 0) else (0.0, direction)
+                        add_contact(i, None, nx, ny, -gap_m, min(self.coef_rest, coef_rest[i]), (self.pucks[i], name))
+        
+        def apply_impulse(contact, impulse_Ns):
+            i, j, nx, ny = contact[0], contact[1], contact[2], contact[3]
+            if j is None:
+                vx[i] += impulse_Ns * nx * inv_mass[i]
+                vy[i] += impulse_Ns * ny * inv_mass[i]
+            else:
+                vx[i] -= impulse_Ns * nx * inv_mass[i]
+                vy[i] -= impulse_Ns * ny * inv_mass[i]
+                vx[j] += impulse_Ns * nx * inv_mass[j]
+                vy[j] += impulse_Ns * ny * inv_mass[j]
+        
+        # Warm start: apply last step's impulses.
+        for contact in contacts:
+            if contact[6] != 0.0:
+                apply_impulse(contact, contact[6])
+        
+        # Gauss-Seidel iterations. The accumulated impulse of each contact is clamped (it can only
+        # push), but each change may be negative, which lets the solver undo an earlier overshoot.
+        for iteration in range(self.solver_iterations):
+            for contact in contacts:
+                i, j, nx, ny, normal_mass, bias_mps, impulse_Ns = contact[:7]
+                if j is None:
+                    vn_mps = vx[i]*nx + vy[i]*ny
+                else:
+                    vn_mps = (vx[j] - vx[i])*nx + (vy[j] - vy[i])*ny
+                
+                new_impulse_Ns = max(impulse_Ns + normal_mass * (bias_mps - vn_mps), 0.0)
+                apply_impulse(contact, new_impulse_Ns - impulse_Ns)
+                contact[6] = new_impulse_Ns
+        
+        # Keep the cached impulses of the sleeping contacts (these were not solved) for when they wake.
+        cache = {key: impulse_Ns for key, impulse_Ns in self.contact_impulse_cache.items() if key[0].sleeping and 
+                 ((not isinstance(key[1], Puck)) or key[1].sleeping)}
+        cache.update({contact[7]: contact[6] for contact in contacts})
+        self.contact_impulse_cache = cache
+        
+        store.vectors['vel_2d_mps'][rows, 0] = vx
+        store.vectors['vel_2d_mps'][rows, 1] = vy
+
+    def resolve_puck_collisions_batch(self, i_index, j_index):
+        # A vectorized version of check_for_puck_collisions. The inputs are arrays of indexes
+        # into the pucks list: candidate pairs (i, j) with i < j, e.g. from the broad phase.
+        # The overlap test is done once, at the start, for all the pairs. So unlike the
+        # pair-at-a-time loop, a collision caused by an earlier collision in the same step
+        # is not resolved until the next step.
+        if len(i_index) == 0: return
+
+        store = self.puck_store
+        rows = store.rows_of(self.pucks)
+        a_rows = rows[i_index]
+        b_rows = rows[j_index]
+
+        pos = store.vectors['pos_2d_m']
+        radius_m = store.scalars['radius_m']
+        groupIndex = store.ints['groupIndex']
+
+        # Check if the puck circles are overlapping (squared distances, no square roots).
+        puck_to_puck_2d_m = pos[b_rows] - pos[a_rows]
+        p_to_p_m2 = np.einsum('ij,ij->i', puck_to_puck_2d_m, puck_to_puck_2d_m)
+        r_plus_r_m2 = (radius_m[a_rows] + radius_m[b_rows])**2
+
+        if np.any(p_to_p_m2 < (1.1 * r_plus_r_m2)):
+            self.tangled = True
+
+        # Ignore collisions within same negative group.
+        colliding = (p_to_p_m2 < r_plus_r_m2) & ~((groupIndex[a_rows] == groupIndex[b_rows]) & (groupIndex[a_rows] < 0))
+        colliding_k = np.flatnonzero(colliding)
+        if len(colliding_k) == 0: return
+
+        self.collision_count += len(colliding_k)
+
+        # Hit counting (needs the puck objects), then the collisions in rounds (see collision_rounds).
+        for k in colliding_k:
+            self.count_bullet_hit(self.pucks[i_index[k]], self.pucks[j_index[k]])
+
+        for round_k in collision_rounds(i_index, j_index, colliding_k):
+            self.resolve_collision_round(a_rows[round_k], b_rows[round_k])
+
+    def set_collision_resolver(self, collision_resolver):
+        # Start the worker pool for the parallel strips now (the workers take a while to start), and
+        # stop it when another resolver is selected.
+        super().set_collision_resolver(collision_resolver)
+        if collision_resolver == "parallel-strips":
+            self.strip_collider.start()
+        else:
+            self.strip_collider.close()
+
+    def resolve_puck_collisions_parallel(self):
+        # The puck-puck collisions, resolved strip by strip in the worker processes. Returns False if
+        # the scene is too small (or the table too narrow) to be worth splitting.
+        if len(self.pucks) < self.parallel_min_pucks: return False
+        result = self.strip_collider.resolve(self, REACH_FACTOR)
+        if result is None: return False
+
+        tangled, pairs = result
+        if tangled:
+            self.tangled = True
+        self.collision_count += len(pairs)
+        # Hit counting, with the pucks of each pair in the order of the pucks list (as in the other resolvers).
+        store = self.puck_store
+        index_of_row = np.zeros(store.n, dtype=np.intp)
+        index_of_row[store.rows_of(self.pucks)] = np.arange(len(self.pucks))
+        for a_row, b_row in pairs:
+            if index_of_row[a_row] > index_of_row[b_row]:
+                a_row, b_row = b_row, a_row
+            self.count_bullet_hit(store.owners[a_row], store.owners[b_row])
+        return True
+
+    def resolve_collision_round(self, a_rows, b_rows):
+        # Resolve a set of collisions where no puck appears more than once.
+        store = self.puck_store
+        resolve_collision_round_arrays(store.vectors['pos_2d_m'], store.vectors['vel_2d_mps'], store.scalars['radius_m'],
+                                       store.scalars['mass_kg'], store.scalars['coef_rest'], a_rows, b_rows,
+                                       self.correct_for_puck_penetration)
+
+    def check_for_puck_collisions_scalar(self, a, b):
+        # The same math as check_for_puck_collisions, done on plain floats (no temporary Vec2D
+        # objects). a and b are the indices of the two pucks in the pucks list. The state is read
+        # from the per-step lists (self.puck_lists), and the results are written to the lists
+        # and to the puck store. The operations are in the same order, so the results are
+        # identical to the Vec2D version.
+        puck, otherpuck = self.pucks[a], self.pucks[b]
+        if self.filters_active and (not self.categories_collide(puck, otherpuck)):
+            return
+        
+        lists = self.puck_lists
+        a_x, a_y = lists.x_m[a], lists.y_m[a]
+        b_x, b_y = lists.x_m[b], lists.y_m[b]
+        a_r, b_r = lists.radius_m[a], lists.radius_m[b]
+        
+        # Parallel to the normal, and to the tangent (rotated 90 degrees).
+        n_x, n_y = b_x - a_x, b_y - a_y
+        t_x, t_y = -n_y, n_x
+        
+        p_to_p_m2 = n_x*n_x + n_y*n_y
+        r_plus_r_m2 = (a_r + b_r)**2
+        
+        if (p_to_p_m2 < (1.1 * r_plus_r_m2)):
+            self.tangled = True
+        
+        if (p_to_p_m2 < r_plus_r_m2):
+        
+            # Ignore collisions within same negative group
+            if (lists.groupIndex[a] == lists.groupIndex[b]) and (lists.groupIndex[a] < 0):
+                return
+
+            self.collision_count += 1
+            
+            self.count_bullet_hit(puck, otherpuck)
+            
+            a_vx, a_vy = lists.vx_mps[a], lists.vy_mps[a]
+            b_vx, b_vy = lists.vx_mps[b], lists.vy_mps[b]
+            a_m, b_m = lists.mass_kg[a], lists.mass_kg[b]
+            
+            # Velocity components along and perpendicular to the normal.
+            a_nx, a_ny = self.projection_xy(a_vx, a_vy, n_x, n_y)
+            a_tx, a_ty = self.projection_xy(a_vx, a_vy, t_x, t_y)
+            b_nx, b_ny = self.projection_xy(b_vx, b_vy, n_x, n_y)
+            b_tx, b_ty = self.projection_xy(b_vx, b_vy, t_x, t_y)
+            
+            if self.correct_for_puck_penetration:
+                rel_x, rel_y = b_nx - a_nx, b_ny - a_ny
+                relative_normal_spd_mps = (rel_x*rel_x + rel_y*rel_y)**0.5
+                penetration_m = (a_r + b_r) - p_to_p_m2**0.5
+                penetration_time_s = penetration_m / relative_normal_spd_mps
+                
+                penetration_time_scaler = 1.0
+                k_s = penetration_time_scaler * penetration_time_s
+                
+                # Reverse to the collision point, then travel forward with the AFTER velocities (CR = 1).
+                a_x, a_y = a_x - (a_nx * k_s), a_y - (a_ny * k_s)
+                b_x, b_y = b_x - (b_nx * k_s), b_y - (b_ny * k_s)
+                
+                CR_puck = 1
+                a_after_x, a_after_y, b_after_x, b_after_y = self.AandB_normal_AFTER_xy(a_nx, a_ny, a_m, b_nx, b_ny, b_m, CR_puck)
+                
+                a_x, a_y = a_x + (a_after_x * k_s), a_y + (a_after_y * k_s)
+                b_x, b_y = b_x + (b_after_x * k_s), b_y + (b_after_y * k_s)
+                lists.set_position(a, a_x, a_y)
+                lists.set_position(b, b_x, b_y)
+            
+            CR_puck = min(lists.coef_rest[a], lists.coef_rest[b])
+            a_after_x, a_after_y, b_after_x, b_after_y = self.AandB_normal_AFTER_xy(a_nx, a_ny, a_m, b_nx, b_ny, b_m, CR_puck)
+            
+            lists.set_velocity(a, a_after_x + a_tx, a_after_y + a_ty)
+            lists.set_velocity(b, b_after_x + b_tx, b_after_y + b_ty)
 
     def check_for_puck_collisions(self, puck, otherpuck):
+        # Category and mask filtering (before any geometry).
+        if self.filters_active and (not self.categories_collide(puck, otherpuck)):
+            return
+        
         # Check if the two puck circles are overlapping.
         
         # Parallel to the normal
@@ -589,19 +1996,7 @@ class CircularAirTable(AirTable):
 
             self.collision_count += 1
             
-            # If it's a bullet coming from another client, add to the
-            # hit count for non-bullet client.
-            if (otherpuck.client_name != None):
-                if (puck.client_name != otherpuck.client_name):
-                    if (otherpuck.bullet and (not puck.bullet)):
-                        if puck.gun and puck.gun.shield:
-                            puck.gun.shield_hit_count += 1
-                            puck.gun.shield_hit = True
-                            puck.gun.shield_hit_duration_s = 0.0
-                        else:
-                            puck.bullet_hit_count += 1
-                            puck.hit = True
-                            puck.hitflash_duration_timer_s = 0.0
+            self.count_bullet_hit(puck, otherpuck)
             
             # Use the p_to_p vector (between the two colliding pucks) as projection target for 
             # normal calculation.
@@ -653,16 +2048,25 @@ class CircularAirTable(AirTable):
 
 
 class PerfectKissAirTable(AirTable):
-    def __init__(self, walls_dic):
-        super().__init__(walls_dic)
+    def __init__(self, walls_dic, ctx=None):
+        super().__init__(walls_dic, ctx=ctx)
 
         self.engine = "circular-perfectKiss"
+        self.collision_resolvers.append("scalar")
 
         # For perfect kiss
         self.perfect_kiss = False
         self.count_direction = 1
         self.timeDirection = 1
 
+    def update_sleep_states(self):
+        # Sleeping zeroes small velocities, which would spoil the reversibility of the perfect-kiss demos.
+        if self.perfect_kiss:
+            if np.any(self.puck_store.ints['sleeping'][:self.puck_store.n]):
+                self.wake_all_pucks()
+            return
+        super().update_sleep_states()
+
     def time_past_kiss(self, puckA, puckB):
         # Determine the time between the kiss point and collision detection event (penetration time).
         
@@ -710,7 +2114,153 @@ class PerfectKissAirTable(AirTable):
             
         return time_between_kiss_and_detection_s
 
+    def time_past_kiss_scalar(self, a_x, a_y, a_vx, a_vy, a_r, b_x, b_y, b_vx, b_vy, b_r):
+        # time_past_kiss on floats (same operations, same order).
+        dt_s = self.dt_s
+        
+        # As seen from B.
+        rel_x, rel_y = a_vx - b_vx, a_vy - b_vy
+        
+        # Previous positions (position 1) of the two pucks
+        a1_x, a1_y = a_x - a_vx * dt_s, a_y - a_vy * dt_s
+        b1_x, b1_y = b_x - b_vx * dt_s, b_y - b_vy * dt_s
+        
+        # Position 2-prime of PuckA
+        a2p_x, a2p_y = a1_x + rel_x * dt_s, a1_y + rel_y * dt_s
+        
+        # Prime path
+        prime_x, prime_y = a2p_x - a1_x, a2p_y - a1_y
+        prime_length_m = (prime_x*prime_x + prime_y*prime_y)**0.5
+        prime_normalized_x, prime_normalized_y = prime_x / prime_length_m, prime_y / prime_length_m
+        
+        # Between the original positions, and its projection onto the prime path.
+        a1b1_x, a1b1_y = b1_x - a1_x, b1_y - a1_y
+        proj_x, proj_y = self.projection_xy(a1b1_x, a1b1_y, prime_x, prime_y)
+        
+        # B1 to the nearest point on the prime path.
+        b1_to_prime_x, b1_to_prime_y = a1b1_x - proj_x, a1b1_y - proj_y
+        
+        x_m = ((a_r + b_r)**2 - (b1_to_prime_x*b1_to_prime_x + b1_to_prime_y*b1_to_prime_y))**0.5
+        
+        # Kiss point, and the path between detection and kiss.
+        kiss_x = (a1_x + proj_x) - prime_normalized_x * x_m
+        kiss_y = (a1_y + proj_y) - prime_normalized_y * x_m
+        d_x, d_y = a2p_x - kiss_x, a2p_y - kiss_y
+        
+        # Avoid zero in the denominator.
+        if abs(rel_x) > 0:
+            return d_x / rel_x
+        else:
+            return d_y / rel_y
+
+    def check_for_puck_collisions_scalar(self, a, b):
+        # The same math as check_for_puck_collisions, done on plain floats (no temporary Vec2D
+        # objects). a and b are the indices of the two pucks in the pucks list. The state is read
+        # from the per-step lists (self.puck_lists), and the results are written to the lists
+        # and to the puck store. The operations are in the same order, so the results are
+        # identical to the Vec2D version.
+        puck, otherpuck = self.pucks[a], self.pucks[b]
+        if self.filters_active and (not self.categories_collide(puck, otherpuck)):
+            return
+        
+        lists = self.puck_lists
+        a_x, a_y = lists.x_m[a], lists.y_m[a]
+        b_x, b_y = lists.x_m[b], lists.y_m[b]
+        a_r, b_r = lists.radius_m[a], lists.radius_m[b]
+        
+        # Parallel to the normal, and to the tangent (rotated 90 degrees).
+        n_x, n_y = b_x - a_x, b_y - a_y
+        t_x, t_y = -n_y, n_x
+        
+        p_to_p_m2 = n_x*n_x + n_y*n_y
+        r_plus_r_m2 = (a_r + b_r)**2
+        
+        if (p_to_p_m2 < (1.1 * r_plus_r_m2)):
+            self.tangled = True
+        
+        if (p_to_p_m2 < r_plus_r_m2):
+
+            # Ignore collisions within same negative group
+            if (lists.groupIndex[a] == lists.groupIndex[b]) and (lists.groupIndex[a] < 0):
+                return
+            
+            if self.perfect_kiss: self.collision_count += 1 * self.count_direction
+            
+            self.count_bullet_hit(puck, otherpuck)
+            
+            # Draw the overlapping pucks.
+            if self.perfect_kiss: puck.draw(tempColor=THECOLORS["red"]); otherpuck.draw(tempColor=THECOLORS["red"])
+            
+            a_vx, a_vy = lists.vx_mps[a], lists.vy_mps[a]
+            b_vx, b_vy = lists.vx_mps[b], lists.vy_mps[b]
+            a_m, b_m = lists.mass_kg[a], lists.mass_kg[b]
+            
+            # Velocity components along and perpendicular to the normal.
+            a_nx, a_ny = self.projection_xy(a_vx, a_vy, n_x, n_y)
+            a_tx, a_ty = self.projection_xy(a_vx, a_vy, t_x, t_y)
+            b_nx, b_ny = self.projection_xy(b_vx, b_vy, n_x, n_y)
+            b_tx, b_ty = self.projection_xy(b_vx, b_vy, t_x, t_y)
+            
+            if self.correct_for_puck_penetration:
+                rel_x, rel_y = b_nx - a_nx, b_ny - a_ny
+                relative_normal_spd_mps = (rel_x*rel_x + rel_y*rel_y)**0.5
+                penetration_m = (a_r + b_r) - p_to_p_m2**0.5
+                if self.perfect_kiss:
+                    penetration_time_s = self.time_past_kiss_scalar(a_x, a_y, a_vx, a_vy, a_r, b_x, b_y, b_vx, b_vy, b_r)
+                else:
+                    penetration_time_s = penetration_m / relative_normal_spd_mps
+                
+                penetration_time_scaler = 1.0
+                k_s = penetration_time_scaler * penetration_time_s
+                
+                # Reverse the two pucks to their collision point.
+                if self.perfect_kiss:
+                    a_x, a_y = a_x - (a_vx * k_s), a_y - (a_vy * k_s)
+                    b_x, b_y = b_x - (b_vx * k_s), b_y - (b_vy * k_s)
+                    lists.set_position(a, a_x, a_y)
+                    lists.set_position(b, b_x, b_y)
+                    
+                    # Draw the perfect-kissing pucks.
+                    puck.draw(tempColor=THECOLORS["cyan"])
+                    otherpuck.draw(tempColor=THECOLORS["cyan"])
+                else:
+                    a_x, a_y = a_x - (a_nx * k_s), a_y - (a_ny * k_s)
+                    b_x, b_y = b_x - (b_nx * k_s), b_y - (b_ny * k_s)
+                
+                if self.perfect_kiss:
+                    # Recalculate the tangent and normals based on the pucks in the just-touching position.
+                    n_x, n_y = b_x - a_x, b_y - a_y
+                    t_x, t_y = -n_y, n_x
+                    a_nx, a_ny = self.projection_xy(a_vx, a_vy, n_x, n_y)
+                    a_tx, a_ty = self.projection_xy(a_vx, a_vy, t_x, t_y)
+                    b_nx, b_ny = self.projection_xy(b_vx, b_vy, n_x, n_y)
+                    b_tx, b_ty = self.projection_xy(b_vx, b_vy, t_x, t_y)
+                
+                # AFTER velocities along the normal with a CR of 1 (avoids stickiness).
+                CR_puck = 1
+                a_after_x, a_after_y, b_after_x, b_after_y = self.AandB_normal_AFTER_xy(a_nx, a_ny, a_m, b_nx, b_ny, b_m, CR_puck)
+                
+                # Travel another penetration time using the AFTER velocities.
+                if self.perfect_kiss:
+                    a_x, a_y = a_x + ((a_after_x + a_tx) * k_s), a_y + ((a_after_y + a_ty) * k_s)
+                    b_x, b_y = b_x + ((b_after_x + b_tx) * k_s), b_y + ((b_after_y + b_ty) * k_s)
+                else:
+                    a_x, a_y = a_x + (a_after_x * k_s), a_y + (a_after_y * k_s)
+                    b_x, b_y = b_x + (b_after_x * k_s), b_y + (b_after_y * k_s)
+                lists.set_position(a, a_x, a_y)
+                lists.set_position(b, b_x, b_y)
+            
+            CR_puck = min(lists.coef_rest[a], lists.coef_rest[b])
+            a_after_x, a_after_y, b_after_x, b_after_y = self.AandB_normal_AFTER_xy(a_nx, a_ny, a_m, b_nx, b_ny, b_m, CR_puck)
+            
+            lists.set_velocity(a, a_after_x + a_tx, a_after_y + a_ty)
+            lists.set_velocity(b, b_after_x + b_tx, b_after_y + b_ty)
+
     def check_for_puck_collisions(self, puck, otherpuck):
+        # Category and mask filtering (before any geometry).
+        if self.filters_active and (not self.categories_collide(puck, otherpuck)):
+            return
+        
         # Check if the two puck circles are overlapping.
         
         # Parallel to the normal
@@ -736,19 +2286,7 @@ class PerfectKissAirTable(AirTable):
             
             if self.perfect_kiss: self.collision_count += 1 * self.count_direction
             
-            # If it's a bullet coming from another client, add to the
-            # hit count for non-bullet client.
-            if (otherpuck.client_name != None):
-                if (puck.client_name != otherpuck.client_name): 
-                    if (otherpuck.bullet and (not puck.bullet)):
-                        if puck.gun and puck.gun.shield:
-                            puck.gun.shield_hit_count += 1
-                            puck.gun.shield_hit = True
-                            puck.gun.shield_hit_duration_s = 0.0
-                        else:
-                            puck.bullet_hit_count += 1
-                            puck.hit = True
-                            puck.hitflash_duration_timer_s = 0.0
+            self.count_bullet_hit(puck, otherpuck)
             
             # Use the p_to_p vector (between the two colliding pucks) as projection target for 
             # normal calculation.
@@ -834,6 +2372,438 @@ class PerfectKissAirTable(AirTable):
             otherpuck.vel_2d_mps = otherpuck_normal_2d_mps + otherpuck_tangent_2d_mps
 
 
+class EventDrivenAirTable(AirTable):
+    def __init__(self, walls_dic, ctx=None):
+        super().__init__(walls_dic, ctx=ctx)
+
+        self.engine = "circular-eventDriven"
+
+        # Collisions are predicted, not detected, so the broad phase and resolver options of the
+        # other circular engines don't apply here.
+        self.broad_phases = ["all-pairs"]
+
+        # Safety limit on the number of events processed in one time step (e.g. for pucks
+        # squeezed together in a corner). Any remaining overlaps are picked up in the next step.
+        self.max_events_per_step = 10000
+        # Number of events (puck-puck and puck-wall collisions) in the last time step.
+        self.event_count = 0
+
+    def predict_wall_time(self, x_m, y_m, vx_mps, vy_mps, r_m):
+        # Time until the puck reaches the fence, and the axis (0 for x, 1 for y) of that wall.
+        if self.inhibit_wall_collisions:
+            return math.inf, 0
+        
+        def time_to_wall(position_m, velocity_mps, low_m, high_m):
+            if velocity_mps > 0:
+                return max((high_m - r_m - position_m) / velocity_mps, 0.0)
+            elif velocity_mps < 0:
+                return max((low_m + r_m - position_m) / velocity_mps, 0.0)
+            else:
+                return math.inf
+        
+        time_x_s = time_to_wall(x_m, vx_mps, self.walls_dic["L_m"], self.walls_dic["R_m"])
+        time_y_s = time_to_wall(y_m, vy_mps, self.walls_dic["B_m"], self.walls_dic["T_m"])
+        if time_x_s <= time_y_s:
+            return time_x_s, 0
+        else:
+            return time_y_s, 1
+
+    def advance_to_end_of_step(self):
+        # Move the pucks through the time step, dt_s, from one predicted collision to the next.
+        # Call this after the forces have been applied to the velocities (update_TotalForce_Speed_allPucks).
+        #
+        # Each puck has its own clock: its position is recorded at its local time, and only
+        # the pucks in a collision are moved up to the time of that collision. Pucks that are
+        # not colliding cost nothing between events. Each event in the queue records the
+        # collision counter of its pucks when it was predicted. If either puck has collided
+        # since then, the event is stale and is skipped.
+        self.tangled = False
+        self.event_count = 0
+        n_pucks = len(self.pucks)
+        if n_pucks == 0: return
+        
+        store = self.puck_store
+        rows = store.rows_of(self.pucks)
+        pos_2d_m = store.vectors['pos_2d_m'][rows]
+        vel_2d_mps = store.vectors['vel_2d_mps'][rows]
+        radius_m = store.scalars['radius_m'][rows]
+        mass_kg = store.scalars['mass_kg'][rows]
+        coef_rest = store.scalars['coef_rest'][rows]
+        groupIndex = store.ints['groupIndex'][rows]
+        
+        skip_puck_collisions = self.inhibit_all_puck_collisions or (not self.any_categories_collide())
+        end_s = self.dt_s
+        local_time_s = np.zeros(n_pucks)
+        collision_counters = [0] * n_pucks
+        
+        events = []
+        tie_breaker = itertools.count()
+        
+        def positions_at(time_s):
+            return pos_2d_m + vel_2d_mps * (time_s - local_time_s)[:, np.newaxis]
+        
+        def push_pair_events(i_index, j_index, time_now_s):
+            if skip_puck_collisions: return
+            collide = self.collision_filter(i_index, j_index, rows)
+            i_index, j_index = i_index[collide], j_index[collide]
+            times_s = self.predict_pair_times(i_index, j_index, positions_at(time_now_s), vel_2d_mps, radius_m, groupIndex) + time_now_s
+            for k in np.flatnonzero(times_s <= end_s):
+                i, j = int(i_index[k]), int(j_index[k])
+                heapq.heappush(events, (times_s[k], next(tie_breaker), i, j, collision_counters[i], collision_counters[j]))
+        
+        def push_wall_event(i, time_now_s):
+            x_m, y_m = pos_2d_m[i] + vel_2d_mps[i] * (time_now_s - local_time_s[i])
+            time_s, axis = self.predict_wall_time(x_m, y_m, vel_2d_mps[i,0], vel_2d_mps[i,1], radius_m[i])
+            time_s += time_now_s
+            if time_s <= end_s:
+                # A wall event uses -1 (x wall) or -2 (y wall) in place of the second puck index.
+                heapq.heappush(events, (time_s, next(tie_breaker), i, -1 - axis, collision_counters[i], 0))
+        
+        def repredict(i, time_now_s, exclude=None):
+            others = np.array([j for j in range(n_pucks) if (j != i) and (j != exclude)], dtype=np.intp)
+            push_pair_events(np.full(len(others), i, dtype=np.intp), others, time_now_s)
+            push_wall_event(i, time_now_s)
+        
+        def move_to(i, time_s):
+            pos_2d_m[i] += vel_2d_mps[i] * (time_s - local_time_s[i])
+            local_time_s[i] = time_s
+        
+        # Initial predictions for all the pairs and walls.
+        i_index, j_index = np.triu_indices(n_pucks, 1)
+        push_pair_events(i_index, j_index, 0.0)
+        for i in range(n_pucks):
+            push_wall_event(i, 0.0)
+        
+        while events:
+            time_s, _, i, j, counter_i, counter_j = heapq.heappop(events)
+            # Skip stale events.
+            if (counter_i != collision_counters[i]) or ((j >= 0) and (counter_j != collision_counters[j])):
+                continue
+            
+            self.event_count += 1
+            if self.event_count > self.max_events_per_step:
+                break
+            
+            move_to(i, time_s)
+            if j >= 0:
+                move_to(j, time_s)
+                self.collide_pair(i, j, pos_2d_m, vel_2d_mps, mass_kg, coef_rest)
+                collision_counters[i] += 1
+                collision_counters[j] += 1
+                repredict(i, time_s)
+                repredict(j, time_s, exclude=i)
+            else:
+                # Wall collision. The velocity component normal to the wall is reversed.
+                axis = -1 - j
+                vel_2d_mps[i, axis] *= -1 * min(self.coef_rest, coef_rest[i])
+                collision_counters[i] += 1
+                repredict(i, time_s)
+        
+        # Move all the pucks to the end of the time step and write the results back to the store.
+        pos_2d_m = positions_at(end_s)
+        store.vectors['pos_2d_m'][rows] = pos_2d_m
+        store.vectors['vel_2d_mps'][rows] = vel_2d_mps
+        
+        # Check for tangled pucks (Jello Madness).
+        puck_to_puck_2d_m = pos_2d_m[j_index] - pos_2d_m[i_index]
+        p_to_p_m2 = np.einsum('ij,ij->i', puck_to_puck_2d_m, puck_to_puck_2d_m)
+        r_plus_r_m2 = (radius_m[i_index] + radius_m[j_index])**2
+        if np.any(p_to_p_m2 < (1.1 * r_plus_r_m2)):
+            self.tangled = True
+
+    def collide_pair(self, i, j, pos_2d_m, vel_2d_mps, mass_kg, coef_rest):
+        # The two pucks are just touching (no penetration correction needed).
+        puck, otherpuck = self.pucks[i], self.pucks[j]
+        self.collision_count += 1
+        self.count_bullet_hit(puck, otherpuck)
+        
+        # Parallel to the normal
+        puck_to_puck_2d_m = Vec2D(pos_2d_m[j,0] - pos_2d_m[i,0], pos_2d_m[j,1] - pos_2d_m[i,1])
+        # Parallel to the tangent
+        tangent_p_to_p_2d_m = Vec2D.rotate90(puck_to_puck_2d_m)
+        
+        puck_vel_2d_mps = Vec2D(vel_2d_mps[i,0], vel_2d_mps[i,1])
+        otherpuck_vel_2d_mps = Vec2D(vel_2d_mps[j,0], vel_2d_mps[j,1])
+        
+        # The calculate velocity components along and perpendicular to the normal.
+        puck_normal_2d_mps = puck_vel_2d_mps.projection_onto(puck_to_puck_2d_m)
+        puck_tangent_2d_mps = puck_vel_2d_mps.projection_onto(tangent_p_to_p_2d_m)
+        otherpuck_normal_2d_mps = otherpuck_vel_2d_mps.projection_onto(puck_to_puck_2d_m)
+        otherpuck_tangent_2d_mps = otherpuck_vel_2d_mps.projection_onto(tangent_p_to_p_2d_m)
+        
+        CR_puck = min(coef_rest[i], coef_rest[j])
+        puck_normal_AFTER_mps, otherpuck_normal_AFTER_mps = self.AandB_normal_AFTER_2d_mps( puck_normal_2d_mps, mass_kg[i], otherpuck_normal_2d_mps, mass_kg[j], CR_puck)
+        
+        vel_2d_mps[i] = (puck_normal_AFTER_mps + puck_tangent_2d_mps).tuple()
+        vel_2d_mps[j] = (otherpuck_normal_AFTER_mps + otherpuck_tangent_2d_mps).tuple()
+
+
+class FixedPointAirTable(AirTable):
+    def __init__(self, walls_dic, ctx=None):
+        super().__init__(walls_dic, ctx=ctx)
+
+        self.engine = "circular-fixedPoint"
+
+        # Positions are integers: multiples of the quantum. The state of each puck is its position
+        # now and one tick ago (position Verlet), so the velocity is the integer difference. With
+        # forces that depend only on the positions, a tick is exactly reversible: swapping the
+        # two positions runs the simulation backwards, bit for bit. All the arithmetic in a tick
+        # is on Python integers, so the result is the same on any machine, in any order of summation.
+        self.quantum_m = 1.0e-6
+        self.mass_quantum_kg = 1.0e-6
+        # The physics runs in fixed ticks. The game loop steps the table a whole frame at a time.
+        self.tick_s = 1.0/960.0
+        self.ticks_per_frame = 8
+        # Fixed-point scaling (bits) of the coefficients that multiply a distance in quanta.
+        self.coefficient_bits = 32
+        # Contacts (puck-puck and puck-wall) are stiff springs. This is the relative acceleration, in
+        # quanta per tick squared, per quantum of overlap: (omega * tick_s)**2 where omega is the
+        # contact frequency. The contact lasts pi/omega (about 13 ticks here). There is no restitution
+        # loss: energy doesn't drift, but a single collision can shift it by a percent or so.
+        self.contact_stiffness = 0.0625
+
+        # Integer state, keyed by puck: [x, y, x_prev, y_prev, px_m, py_m, vx_mps, vy_mps]. The last
+        # four are the floats written to the puck store after the last frame. If the store no longer
+        # matches them (the puck was moved or given a new velocity outside the engine), the puck is
+        # quantized again.
+        self.fixed_state = {}
+        # Touching pairs of pucks in the last tick (for counting new collisions and bullet hits).
+        self.touching_pairs = set()
+        self.tick_count = 0
+
+        self.timeDirection = 1
+        self.count_direction = 1
+
+        # Contacts are found with a grid of integer cells (see tick_fixed_point).
+        self.broad_phases = ["integer-grid"]
+        self.broad_phase = "integer-grid"
+        self.collision_resolvers = ["integer"]
+        self.collision_resolver = "integer"
+        # Sleeping zeroes small velocities (not reversible).
+        self.sleeping_enabled = False
+
+    def frame_s(self):
+        return self.tick_s * self.ticks_per_frame
+
+    def divide_rounded(self, a, b):
+        # Integer a/b, rounded to the nearest integer (b > 0).
+        return (2*a + b) // (2*b)
+
+    def quantize(self, value):
+        return int(round(value / self.quantum_m))
+
+    def calc_spring_forces_allSprings(self):
+        # The springs are integer forces, calculated in each tick (see tick_fixed_point). The spring
+        # table is still kept current, for the energy diagnostics.
+        self.spring_force_table.update(self.springs, self.puck_store)
+
+    def sync_fixed_state(self):
+        # Collect the integer state of the pucks for this frame. New pucks, and pucks changed outside
+        # the engine, are quantized from the floats in the puck store. Returns the lists used by the ticks.
+        store = self.puck_store
+        old_state = self.fixed_state
+        self.fixed_state = {}
+
+        # The pucks, then the pins at the ends of springs.
+        members = list(self.pucks)
+        index_of = {puck: i for i, puck in enumerate(members)}
+        for spring in self.springs:
+            for puck in (spring.p1, spring.p2):
+                if puck not in index_of:
+                    index_of[puck] = len(members)
+                    members.append(puck)
+
+        X, Y, XP, YP = [], [], [], []
+        for puck in members:
+            px_m, py_m = puck.pos_2d_m.x, puck.pos_2d_m.y
+            vx_mps, vy_mps = puck.vel_2d_mps.x, puck.vel_2d_mps.y
+            state = old_state.get(puck)
+            if (state is None) or (state[4:] != [px_m, py_m, vx_mps, vy_mps]):
+                x, y = self.quantize(px_m), self.quantize(py_m)
+                state = [x, y, x - self.quantize(vx_mps * self.tick_s), y - self.quantize(vy_mps * self.tick_s),
+                         px_m, py_m, vx_mps, vy_mps]
+            self.fixed_state[puck] = state
+            X.append(state[0]); Y.append(state[1]); XP.append(state[2]); YP.append(state[3])
+
+        # Only the dynamic pucks in the pucks list are moved.
+        n_moving = len(self.pucks)
+        moving = [bool(store.dynamic[puck.store_row]) for puck in self.pucks]
+
+        # Per-tick displacement increments from gravity and from the (external) jet, cursor-string and
+        # drag forces. These are held for the frame. The impulses are applied once, in the first tick.
+        # (The pucks' drag forces and the spring dampers depend on the velocity, so they would spoil the
+        # reversibility. They are not used here.)
+        tick2_s2 = self.tick_s**2
+        gx, gy = self.quantize(self.g_2d_mps2.x * tick2_s2), self.quantize(self.g_2d_mps2.y * tick2_s2)
+        rows = store.rows_of(self.pucks)
+        vectors = store.vectors
+        external_2d_N = (vectors['jet_force_2d_N'][rows] + vectors['cursorString_spring_force_2d_N'][rows] +
+                         vectors['cursorString_puckDrag_force_2d_N'][rows])
+        mass_kg = store.scalars['mass_kg'][rows]
+        AX, AY, KX, KY = [], [], [], []
+        for i in range(n_moving):
+            if moving[i]:
+                AX.append(gx + self.quantize(external_2d_N[i, 0] / mass_kg[i] * tick2_s2))
+                AY.append(gy + self.quantize(external_2d_N[i, 1] / mass_kg[i] * tick2_s2))
+                KX.append(self.quantize(vectors['impulse_2d_Ns'][rows[i], 0] / mass_kg[i] * self.tick_s))
+                KY.append(self.quantize(vectors['impulse_2d_Ns'][rows[i], 1] / mass_kg[i] * self.tick_s))
+            else:
+                AX.append(0); AY.append(0); KX.append(0); KY.append(0)
+        self.reset_force_accumulators(store.n)
+
+        radius = [self.quantize(puck.radius_m) for puck in self.pucks]
+        mass = [max(1, int(round(puck.mass_kg / self.mass_quantum_kg))) for puck in self.pucks]
+
+        # Springs: (end 1, end 2, unstretched length, coefficient for end 1, coefficient for end 2). A
+        # coefficient is k * tick**2 / m, scaled by 2**coefficient_bits (zero for an end that doesn't move).
+        scale = 1 << self.coefficient_bits
+        springs = []
+        for spring in self.springs:
+            i, j = index_of[spring.p1], index_of[spring.p2]
+            c_1 = int(round(spring.strength_Npm * tick2_s2 / spring.p1.mass_kg * scale)) if ((i < n_moving) and moving[i]) else 0
+            c_2 = int(round(spring.strength_Npm * tick2_s2 / spring.p2.mass_kg * scale)) if ((j < n_moving) and moving[j]) else 0
+            springs.append((i, j, self.quantize(spring.length_m), c_1, c_2))
+
+        return members, X, Y, XP, YP, moving, AX, AY, KX, KY, radius, mass, springs
+
+    def step_fixed_point(self):
+        # Advance the table by one frame (ticks_per_frame ticks) and write the positions and velocities
+        # back to the puck store.
+        if len(self.pucks) == 0:
+            self.fixed_state = {}
+            return
+        members, X, Y, XP, YP, moving, AX, AY, KX, KY, radius, mass, springs = self.sync_fixed_state()
+
+        # The impulses change the velocity (the difference between the two positions).
+        for i in range(len(moving)):
+            XP[i] -= KX[i]
+            YP[i] -= KY[i]
+
+        self.tangled = False
+        for tick in range(self.ticks_per_frame):
+            self.tick_fixed_point(X, Y, XP, YP, moving, AX, AY, radius, mass, springs)
+
+        for k, puck in enumerate(members):
+            self.fixed_state[puck][:4] = [X[k], Y[k], XP[k], YP[k]]
+        self.write_fixed_state()
+
+    def write_fixed_state(self):
+        # Write the positions and velocities to the puck store. The velocity is the displacement in the last tick.
+        q_m = self.quantum_m
+        for puck, state in self.fixed_state.items():
+            x, y, x_prev, y_prev = state[:4]
+            puck.pos_2d_m = Vec2D(x * q_m, y * q_m)
+            puck.vel_2d_mps = Vec2D((x - x_prev) * q_m / self.tick_s, (y - y_prev) * q_m / self.tick_s)
+            # Read back, so the comparison in sync_fixed_state is with exactly what is in the store.
+            state[4:] = [puck.pos_2d_m.x, puck.pos_2d_m.y, puck.vel_2d_mps.x, puck.vel_2d_mps.y]
+
+    def tick_fixed_point(self, X, Y, XP, YP, moving, AX, AY, radius, mass, springs):
+        # One tick of integer position Verlet:  x_next = 2*x - x_prev + a(x) * tick**2
+        # All the increments depend only on the positions, X and Y (plus the constant external terms).
+        # Integer sums don't depend on their order.
+        n = len(moving)
+        bits = self.coefficient_bits
+        ax = AX[:]
+        ay = AY[:]
+
+        # Springs (undamped).
+        for i, j, length_q, c_1, c_2 in springs:
+            dx = X[i] - X[j]
+            dy = Y[i] - Y[j]
+            d = math.isqrt(dx*dx + dy*dy)
+            if d == 0: continue
+            stretch = length_q - d
+            denominator = d << bits
+            if c_1:
+                ax[i] += self.divide_rounded(stretch * c_1 * dx, denominator)
+                ay[i] += self.divide_rounded(stretch * c_1 * dy, denominator)
+            if c_2:
+                ax[j] -= self.divide_rounded(stretch * c_2 * dx, denominator)
+                ay[j] -= self.divide_rounded(stretch * c_2 * dy, denominator)
+
+        k_contact = int(round(self.contact_stiffness * (1 << bits)))
+
+        # Fence
+        if not self.inhibit_wall_collisions:
+            L, R = self.quantize(self.walls_dic["L_m"]), self.quantize(self.walls_dic["R_m"])
+            B, T = self.quantize(self.walls_dic["B_m"]), self.quantize(self.walls_dic["T_m"])
+            for i in range(n):
+                if not moving[i]: continue
+                r = radius[i]
+                if X[i] - r < L: ax[i] += self.divide_rounded((L - (X[i] - r)) * k_contact, 1 << bits)
+                if X[i] + r > R: ax[i] -= self.divide_rounded(((X[i] + r) - R) * k_contact, 1 << bits)
+                if Y[i] - r < B: ay[i] += self.divide_rounded((B - (Y[i] - r)) * k_contact, 1 << bits)
+                if Y[i] + r > T: ay[i] -= self.divide_rounded(((Y[i] + r) - T) * k_contact, 1 << bits)
+
+        # Puck-puck contacts. The pucks are binned by their centers in square cells as wide as the largest
+        # puck, so touching pucks are in the same or neighboring cells.
+        touching_pairs = set()
+        if (not self.inhibit_all_puck_collisions) and (n > 1):
+            cell = 2 * max(radius) + 1
+            cells = {}
+            for i in range(n):
+                key = (X[i] // cell, Y[i] // cell)
+                if key in cells:
+                    cells[key].append(i)
+                else:
+                    cells[key] = [i]
+
+            pucks = self.pucks
+            for (cx, cy), cell_members in cells.items():
+                for offset in [(0,0), (1,-1), (1,0), (1,1), (0,1)]:
+                    others = cell_members if (offset == (0,0)) else cells.get((cx + offset[0], cy + offset[1]))
+                    if not others: continue
+                    for a, i in enumerate(cell_members):
+                        for j in (others[a+1:] if (offset == (0,0)) else others):
+                            dx = X[j] - X[i]
+                            dy = Y[j] - Y[i]
+                            d2 = dx*dx + dy*dy
+                            r_plus_r = radius[i] + radius[j]
+                            if (10 * d2) < (11 * r_plus_r * r_plus_r):
+                                self.tangled = True
+                            if d2 >= r_plus_r * r_plus_r: continue
+
+                            puck, otherpuck = (pucks[i], pucks[j]) if (i < j) else (pucks[j], pucks[i])
+                            if not self.categories_collide(puck, otherpuck): continue
+                            # Ignore collisions within same negative group
+                            if (puck.groupIndex == otherpuck.groupIndex) and (puck.groupIndex < 0): continue
+
+                            touching_pairs.add((puck, otherpuck))
+                            if (puck, otherpuck) not in self.touching_pairs:
+                                self.collision_count += 1 * self.count_direction
+                                self.count_bullet_hit(puck, otherpuck)
+
+                            d = math.isqrt(d2)
+                            if d == 0: continue
+                            # Each puck gets the share of the relative acceleration set by the other's mass.
+                            overlap_k = (r_plus_r - d) * k_contact
+                            denominator = (d * (mass[i] + mass[j])) << bits
+                            if moving[i]:
+                                ax[i] -= self.divide_rounded(overlap_k * mass[j] * dx, denominator)
+                                ay[i] -= self.divide_rounded(overlap_k * mass[j] * dy, denominator)
+                            if moving[j]:
+                                ax[j] += self.divide_rounded(overlap_k * mass[i] * dx, denominator)
+                                ay[j] += self.divide_rounded(overlap_k * mass[i] * dy, denominator)
+        self.touching_pairs = touching_pairs
+
+        for i in range(n):
+            if moving[i]:
+                x_next = 2*X[i] - XP[i] + ax[i]
+                y_next = 2*Y[i] - YP[i] + ay[i]
+                XP[i], YP[i] = X[i], Y[i]
+                X[i], Y[i] = x_next, y_next
+        self.tick_count += self.timeDirection
+
+    def reverse_time(self):
+        # Swap the two positions of each puck. Stepping forward now retraces the path, exactly, as long as
+        # no forces were added from outside (jets, cursor strings, bullets).
+        for state in self.fixed_state.values():
+            state[0], state[1], state[2], state[3] = state[2], state[3], state[0], state[1]
+        self.write_fixed_state()
+        self.timeDirection *= -1
+        self.count_direction = self.timeDirection
+
+
 """  fwQueryCallback and myContactListener are dependencies of Box2DAirTable  """
 
 class fwQueryCallback(b2QueryCallback):
@@ -855,62 +2825,226 @@ class fwQueryCallback(b2QueryCallback):
         return True
 
 
+class ContactEventBuffer:
+    # Contact events recorded during b2World.Step and processed in one pass after the step (see
+    # Box2DAirTable.process_contact_events). The arrays are preallocated; they are doubled if a step
+    # ever records more events than they can hold.
+    BEGIN = 1
+    END = 0
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.kinds = np.zeros(capacity, dtype=np.int8)
+        self.approach_speed_mps = np.zeros(capacity)
+        self.pucks_a = [None] * capacity
+        self.pucks_b = [None] * capacity
+        self.n = 0
+
+    def grow(self):
+        self.kinds = np.concatenate((self.kinds, np.zeros(self.capacity, dtype=np.int8)))
+        self.approach_speed_mps = np.concatenate((self.approach_speed_mps, np.zeros(self.capacity)))
+        self.pucks_a.extend([None] * self.capacity)
+        self.pucks_b.extend([None] * self.capacity)
+        self.capacity *= 2
+
+    def record(self, kind, puck_a, puck_b, approach_speed_mps):
+        if self.n == self.capacity:
+            self.grow()
+        k = self.n
+        self.kinds[k] = kind
+        self.approach_speed_mps[k] = approach_speed_mps
+        self.pucks_a[k] = puck_a
+        self.pucks_b[k] = puck_b
+        self.n += 1
+
+    def events(self):
+        # The recorded events, as (kind, puck_a, puck_b, approach_speed_mps) tuples.
+        n = self.n
+        return list(zip(self.kinds[:n].tolist(), self.pucks_a[:n], self.pucks_b[:n], self.approach_speed_mps[:n].tolist()))
+
+    def clear(self):
+        # Drop the puck references so deleted pucks aren't kept alive.
+        for k in range(self.n):
+            self.pucks_a[k] = None
+            self.pucks_b[k] = None
+        self.n = 0
+
+
+class BulletBodyPool:
+    # Idle Box2D bodies of expired gun bullets. When a bullet is deleted its body is turned off (not
+    # stepped, no collisions) and kept here. The next bullet of the same size and density turns it back
+    # on at its own position and velocity, instead of creating a new body and fixture. At most capacity
+    # idle bodies are kept; beyond that, they are destroyed.
+    def __init__(self, b2d_world, capacity=256):
+        self.b2d_world = b2d_world
+        self.capacity = capacity
+        # Lists of idle bodies, keyed by (radius_m, density_kgpm2).
+        self.idle_bodies = {}
+        self.idle_count = 0
+        self.reuse_count = 0
+
+    def acquire(self, puck):
+        # Returns an idle body reset to the puck's state (still turned off), or None.
+        if puck.rect_fixture: return None
+        bodies = self.idle_bodies.get((puck.radius_m, puck.density_kgpm2))
+        if not bodies: return None
+        body = bodies.pop()
+        self.idle_count -= 1
+        self.reuse_count += 1
+
+        # Putting the body to sleep zeros its velocities, forces, and sleep timer (as for a new body).
+        body.awake = False
+        body.transform = (b2Vec2(puck.pos_2d_m.tuple()), puck.angle_r)
+        body.linearVelocity = b2Vec2(puck.vel_2d_mps.tuple())
+        body.angularVelocity = puck.angularVelocity_rps
+        body.awake = puck.awake
+        body.userData = puck
+        fixture = body.fixtures[0]
+        fixture.friction = puck.friction_atBirth
+        fixture.restitution = puck.coef_rest_atBirth
+        return body
+
+    def release(self, body, puck):
+        if (self.idle_count >= self.capacity) or puck.rect_fixture:
+            self.b2d_world.DestroyBody(body)
+            return
+        body.active = False
+        self.idle_bodies.setdefault((puck.radius_m, puck.density_kgpm2), []).append(body)
+        self.idle_count += 1
+
+
 class myContactListener(b2ContactListener):
+    # Records the beginning and end of contacts with bullets into the air table's contact event buffer. No
+    # pucks are changed here, during the step; the hits are handled after the step. This listener is
+    # attached to the Box2D world only while there are gun bullets in it (see Box2DAirTable.bullet_added).
     def __init__(self, air_table):
         super().__init__()
         self.air_table = air_table
 
+    def record(self, kind, contact):
+        fixtureA = contact.fixtureA
+        fixtureB = contact.fixtureB
+
+        # Only a contact with a bullet can be a hit. Check the category bits before doing anything else.
+        if not ((fixtureA.filterData.categoryBits | fixtureB.filterData.categoryBits) & CATEGORY_BULLET):
+            return
+
+        # Each puck's body has the puck in its userData (walls have None).
+        bodyA = fixtureA.body
+        bodyB = fixtureB.body
+        puckA = bodyA.userData
+        puckB = bodyB.userData
+        if (puckA is None) or (puckB is None):
+            return
+
+        # Speed at which the bodies approach each other along the contact normal (A to B).
+        normal = contact.worldManifold.normal
+        relative_vel = bodyA.linearVelocity - bodyB.linearVelocity
+        approach_speed_mps = relative_vel.x * normal.x + relative_vel.y * normal.y
+
+        self.air_table.contact_events.record(kind, puckA, puckB, approach_speed_mps)
+
     def BeginContact(self, contact):
-        # Check if both bodies are in the puck dictionary
-        bodyA = contact.fixtureA.body
-        bodyB = contact.fixtureB.body
-
-        if (bodyA in self.air_table.puck_dictionary) and (bodyB in self.air_table.puck_dictionary):
-            puckA = self.air_table.puck_dictionary[bodyA]
-            puckB = self.air_table.puck_dictionary[bodyB]
-
-            # Handle bullet collisions from either puck
-            # Exclude the case where it's your own bullet hitting you.
-            if puckA.client_name != puckB.client_name:
-                # Case 1: puckB is bullet, puckA is target
-                if (puckB.client_name != None) and (puckB.bullet and (not puckA.bullet)):
-                    if puckA.gun and puckA.gun.shield:
-                        puckA.gun.shield_hit_count += 1
-                        puckA.gun.shield_hit = True
-                        puckA.gun.shield_hit_duration_s = 0.0
-                    else:
-                        puckA.bullet_hit_count += 1
-                        puckA.hit = True
-                        puckA.hitflash_duration_timer_s = 0.0
-                # Case 2: puckA is bullet, puckB is target
-                elif (puckA.client_name != None) and (puckA.bullet and (not puckB.bullet)):
-                    if puckB.gun and puckB.gun.shield:
-                        puckB.gun.shield_hit_count += 1
-                        puckB.gun.shield_hit = True
-                        puckB.gun.shield_hit_duration_s = 0.0
-                    else:
-                        puckB.bullet_hit_count += 1
-                        puckB.hit = True
-                        puckB.hitflash_duration_timer_s = 0.0
+        self.record(ContactEventBuffer.BEGIN, contact)
+
+    def EndContact(self, contact):
+        self.record(ContactEventBuffer.END, contact)
 
 
 class Box2DAirTable(AirTable):
-    def __init__(self, walls_dic):
-        super().__init__(walls_dic)
+    def __init__(self, walls_dic, ctx=None):
+        super().__init__(walls_dic, ctx=ctx)
 
         self.engine = "box2d"
 
-        self.puck_dictionary = {}
         self.walls = []
 
         self.jello_tangle_checking_enabled = False
         self.tangle_checker_time_s = 0.0
 
-        # Create the Box2D world
-        self.b2d_world = b2World(gravity=(-0.0, -0.0), doSleep=True, contactListener=myContactListener(self))
+        # Create the Box2D world. The contact listener runs a Python callback for every contact that begins,
+        # but only contacts with gun bullets (CATEGORY_BULLET) can be hits. So the listener is attached
+        # only while there are bullets in the world (see bullet_added and bullet_removed).
+        self.b2d_world = b2World(gravity=(-0.0, -0.0), doSleep=True)
+        self.contact_listener = myContactListener(self)
+        self.live_bullet_count = 0
+
+        # The listener only records contact events. After each step, process_contact_events passes them
+        # to each of the handlers in turn. Handlers run outside of b2World.Step, so they may change or
+        # delete bodies. Other handlers can be appended.
+        self.contact_events = ContactEventBuffer()
+        self.contact_handlers = [self.handle_bullet_hits, self.handle_hits_by_client]
+        # Hits in the last processed step, keyed by the name of the client that fired the bullets.
+        self.hits_by_client = {}
+        # Box2D does its own sleeping (doSleep).
+        self.sleeping_enabled = False
+
+        # Fixed-Hz substeps and adaptive solver iterations (environment timestep_adaptive).
+        self.step_controller = Box2DStepController()
+
+        # Bodies of expired gun bullets, turned off and kept for reuse.
+        self.bullet_pool = BulletBodyPool(self.b2d_world)
 
         print("pybox2d version: ", Box2D.__version__)
 
+    def bullet_added(self):
+        self.live_bullet_count += 1
+        if (self.live_bullet_count == 1):
+            self.b2d_world.contactListener = self.contact_listener
+
+    def bullet_removed(self):
+        self.live_bullet_count -= 1
+        if (self.live_bullet_count == 0):
+            self.b2d_world.contactListener = None
+
+    def process_contact_events(self):
+        # Call this after each b2World.Step.
+        if self.contact_events.n == 0:
+            if self.hits_by_client: self.hits_by_client = {}
+            return
+        events = self.contact_events.events()
+        self.contact_events.clear()
+        for handler in self.contact_handlers:
+            handler(events)
+
+    def bullet_hit(self, kind, puckA, puckB):
+        # A bullet beginning contact with a puck (not another bullet) from a different client is a hit.
+        # Returns (bullet, target), or None if the event is not a hit.
+        if (kind != ContactEventBuffer.BEGIN) or (puckA.client_name == puckB.client_name):
+            return None
+        # Exclude the case where it's your own bullet hitting you.
+        if (puckB.client_name != None) and (puckB.bullet and (not puckA.bullet)):
+            return puckB, puckA
+        elif (puckA.client_name != None) and (puckA.bullet and (not puckB.bullet)):
+            return puckA, puckB
+        return None
+
+    def handle_bullet_hits(self, events):
+        # Hits land on the target puck's shield if it is up. Hits are counted per target, then applied
+        # once to each target.
+        hits_on_target = {}
+        for kind, puckA, puckB, approach_speed_mps in events:
+            hit = self.bullet_hit(kind, puckA, puckB)
+            if hit is None: continue
+            bullet, target = hit
+            hits_on_target[target] = hits_on_target.get(target, 0) + 1
+
+        for target, hit_count in hits_on_target.items():
+            if target.gun and target.gun.shield:
+                target.gun.shield_hit_count += hit_count
+                target.gun.shield_hit = True
+                target.gun.shield_hit_duration_s = 0.0
+            else:
+                target.bullet_hit_count += hit_count
+                target.hit = True
+                target.hitflash_duration_timer_s = 0.0
+
+    def spin_angular_momentum_Js(self):
+        # Box2D pucks can spin: add the angular momentum about each puck's own center. The spins are
+        # copied into the store with the positions (the rows without a body have no inertia).
+        n = self.puck_store.n
+        return float(np.dot(self.puck_store.scalars['inertia_kgm2'][:n], self.puck_store.scalars['rotation_speed'][:n]))
+
     def buildFence(self, onoff={'L':True,'R':True,'T':True,'B':True}):
         for eachWall in self.walls[:]:
             if eachWall.fence:
@@ -920,21 +3054,21 @@ class Box2DAirTable(AirTable):
         fenceColor = THECOLORS['orangered1']
         border_px = 2
         # A nudge of 1 pixel is applied to top and left walls to keep them out of view.
-        nudge_m = g.env.px_to_m * 1 # 1; 0 for no nudge
+        nudge_m = self.ctx.env.px_to_m * 1 # 1; 0 for no nudge
         # Left and right walls
         if onoff['L']: 
             Wall( Vec2D( self.walls_dic["L_m"] - (width_m + nudge_m), self.walls_dic["T_m"]/2.0), 
-                width_m, self.walls_dic["T_m"]/2.0, fence=True, border_px=border_px, color=fenceColor)
+                width_m, self.walls_dic["T_m"]/2.0, fence=True, border_px=border_px, color=fenceColor, ctx=self.ctx)
         if onoff['R']: 
             Wall( Vec2D( self.walls_dic["R_m"] + width_m, self.walls_dic["T_m"]/2.0), 
-                width_m, self.walls_dic["T_m"]/2.0, fence=True, border_px=border_px, color=fenceColor)
+                width_m, self.walls_dic["T_m"]/2.0, fence=True, border_px=border_px, color=fenceColor, ctx=self.ctx)
         # Top and bottom walls
         if onoff['T']: 
             Wall( Vec2D( self.walls_dic["R_m"]/2.0, self.walls_dic["T_m"] + (width_m + nudge_m)), 
-                self.walls_dic["R_m"]/2.0, width_m, fence=True, border_px=border_px, color=fenceColor)
+                self.walls_dic["R_m"]/2.0, width_m, fence=True, border_px=border_px, color=fenceColor, ctx=self.ctx)
         if onoff['B']: 
             Wall( Vec2D( self.walls_dic["R_m"]/2.0, self.walls_dic["B_m"] - width_m), 
-                self.walls_dic["R_m"]/2.0, width_m, fence=True, border_px=border_px, color=fenceColor)
+                self.walls_dic["R_m"]/2.0, width_m, fence=True, border_px=border_px, color=fenceColor, ctx=self.ctx)
 
     def checkForPuckAtThisPosition_b2d(self, x_px_or_tuple, y_px = None):
         # This is used for cursor selection at a particular point on the puck.  #b2d
@@ -950,7 +3084,7 @@ class Box2DAirTable(AirTable):
             self.y_px = y_px
         
         # Convert to a world point.
-        test_position_2d_m = g.env.ConvertScreenToWorld(Vec2D(self.x_px, self.y_px))
+        test_position_2d_m = self.ctx.env.ConvertScreenToWorld(Vec2D(self.x_px, self.y_px))
         
         # Convert this to a box2d vector.
         p = b2Vec2( test_position_2d_m.tuple())
@@ -970,10 +3104,10 @@ class Box2DAirTable(AirTable):
             # Find the local point in the body's coordinate system.
             local_b2d_m = selected_b2d_body.GetLocalPoint( p)
         
-            # Use a dictionary to identify the puck based on the b2d body.
+            # The b2d body has its puck in userData.
             bulletFromGun = (selected_b2d_body.bullet and (selected_b2d_body.fixtures[0].filterData.groupIndex != 0))
             if not bulletFromGun:
-                selected_puck = self.puck_dictionary[ selected_b2d_body]
+                selected_puck = selected_b2d_body.userData
                 selected_puck.selected = True
         
             # Return a dictionary with the puck and local selection point on it.
@@ -1013,6 +3147,71 @@ class Box2DAirTable(AirTable):
         puck.cursorString_torque_force_Nm = 0.0
         
         puck.impulse_2d_Ns = Vec2D(0.0,0.0)
+
+    def update_TotalForceVector_allPucks(self):
+        # A batched version of update_TotalForceVectorOnPuck. The net forces are summed for all the pucks
+        # in one pass over the puck store, and Box2D is called only for the pucks that have a force to apply.
+        # A spring, jet, drag, cursor-string, or impulse force wakes the body. Gravity alone is applied only
+        # to awake bodies, so pucks resting in a pile stay asleep.
+        store = self.puck_store
+        vectors = store.vectors
+        rows = store.rows_of(self.pucks)
+        other_forces_2d_N = (vectors['SprDamp_force_2d_N'][rows] +
+                             vectors['jet_force_2d_N'][rows] +
+                             vectors['puckDrag_force_2d_N'][rows] +
+                             vectors['cursorString_spring_force_2d_N'][rows] +
+                             vectors['cursorString_puckDrag_force_2d_N'][rows] +
+                             vectors['impulse_2d_Ns'][rows]/self.dt_s)
+        has_other_force = np.any(other_forces_2d_N != 0.0, axis=1).tolist()
+        gravity_on = (self.g_2d_mps2.x != 0.0) or (self.g_2d_mps2.y != 0.0)
+        forces_2d_N = (store.scalars['mass_kg'][rows][:,None] * np.array(self.g_2d_mps2.tuple())) + other_forces_2d_N
+
+        for k, puck in enumerate(self.pucks):
+            body = puck.b2d_body
+            if has_other_force[k] or puck.nonCOM_N or puck.cursorString_torque_force_Nm:
+                body.ApplyForceToCenter( b2Vec2( forces_2d_N[k,0], forces_2d_N[k,1]), True)
+                # Apply any non-COM forces and torques.   #b2d
+                for force_dict in puck.nonCOM_N:
+                    force_point_b2d_m = body.GetWorldPoint( force_dict['local_b2d_m'])
+                    force_vector_b2d_N = b2Vec2( force_dict['force_2d_N'].tuple())
+                    body.ApplyForce( force=force_vector_b2d_N, point=force_point_b2d_m, wake=True)
+                body.ApplyTorque( puck.cursorString_torque_force_Nm, wake=True)
+                puck.nonCOM_N = []
+                puck.cursorString_torque_force_Nm = 0.0
+            elif gravity_on and body.awake:
+                body.ApplyForceToCenter( b2Vec2( forces_2d_N[k,0], forces_2d_N[k,1]), False)
+
+        # Now reset the aggregate forces.
+        self.reset_force_accumulators(store.n)
+
+    def get_Box2d_XandV_allPucks(self):
+        # Copy the positions and velocities back from Box2D into the puck store. Sleeping bodies don't
+        # move, so they are copied only once: in the step that they fall asleep (Box2D zeros their velocity).
+        # The store's sleeping flags follow the Box2D bodies.
+        store = self.puck_store
+        pos_2d_m = store.vectors['pos_2d_m']
+        vel_2d_mps = store.vectors['vel_2d_mps']
+        sleeping = store.ints['sleeping']
+        rotation_speed = store.scalars['rotation_speed']
+        for puck in self.pucks:
+            body = puck.b2d_body
+            row = puck.store_row
+            if body.awake:
+                sleeping[row] = 0
+            elif sleeping[row]:
+                continue
+            else:
+                sleeping[row] = 1
+            position = body.position
+            velocity = body.linearVelocity
+            pos_2d_m[row] = (position.x, position.y)
+            vel_2d_mps[row] = (velocity.x, velocity.y)
+            rotation_speed[row] = body.angularVelocity
+
+    def wake_puck(self, puck):
+        # Box2D does its own sleeping; wake the body (e.g. when gravity is toggled).
+        if puck.b2d_body:
+            puck.b2d_body.awake = True
     
     def check_for_jello_tangle(self):
         if self.tangle_checker_time_s > 0.1:
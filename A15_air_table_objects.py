@@ -9,6 +9,8 @@ This module defines the physical objects that can exist in the simulation:
 
 Classes:
     Wall: Static boundary objects with collision detection  
+    WallSegment: Static line segment for the circular engines  
+    WallPolygon: Static convex polygon for the circular engines  
     Puck: Dynamic objects with physics properties (mass, velocity, etc.)  
     Spring: Elastic connections between pucks with customizable properties  
     Tube: Base class for rotatable attachments (Jet/Gun)  
@@ -16,6 +18,9 @@ Classes:
     Gun: Weapon system that can be mounted on pucks  
 
 Walls and Puck supports Box2D integration for advanced physics simulation when enabled.
+
+Each object keeps a reference to its simulation context (self.ctx), through which it reaches the
+air table, env, and game window. Springs, jets, and guns use the context of their puck.
 """
 
 import math
@@ -28,13 +33,22 @@ from Box2D import b2Vec2
 
 # Import the vector class from a local module
 from A09_vec2d import Vec2D
-# Global variables shared across scripts
-import A15_globals as g
+from A15_puck_store import vector_property, scalar_property, int_property
+# The env, window, and air table are reached through a simulation context (A15_globals by default).
+from A15_simulation_context import context_or_default
+
+# Collision filtering categories (Box2D style). Two pucks collide only if each one's category
+# bit is in the other's mask. The defaults (category 1, mask all) collide with everything.
+CATEGORY_DEFAULT = 0x0001
+CATEGORY_BULLET  = 0x0002
+CATEGORY_BURST   = 0x0004
+MASK_ALL         = 0xFFFF
 
 
 class Wall:
     def __init__(self, pos_2d_m, half_width_m, half_height_m, angle_radians=0.0,
-                       color=THECOLORS["gray"], border_px=3, fence=False):
+                       color=THECOLORS["gray"], border_px=3, fence=False, ctx=None):
+        self.ctx = context_or_default(ctx)
         self.pos_2d_m = pos_2d_m
         self.half_width_m = half_width_m
         self.half_height_m = half_height_m
@@ -44,11 +58,11 @@ class Wall:
         self.fence = fence
 
         self.b2d_body = self.create_Box2d_Wall()
-        g.air_table.walls.append(self)
+        self.ctx.air_table.walls.append(self)
 
     def create_Box2d_Wall(self):
         # Create a static body
-        static_body = g.air_table.b2d_world.CreateStaticBody(position=b2Vec2(self.pos_2d_m.tuple()), angle=self.angle_radians )
+        static_body = self.ctx.air_table.b2d_world.CreateStaticBody(position=b2Vec2(self.pos_2d_m.tuple()), angle=self.angle_radians )
         
         # And add a box fixture onto it.
         static_body.CreatePolygonFixture(box=(self.half_width_m, self.half_height_m))
@@ -56,31 +70,189 @@ class Wall:
 
     def delete(self):
         # Remove the wall from the world in box2d.
-        g.air_table.b2d_world.DestroyBody(self.b2d_body)        
-        g.air_table.walls.remove( self)
+        self.ctx.air_table.b2d_world.DestroyBody(self.b2d_body)        
+        self.ctx.air_table.walls.remove( self)
 
     def draw(self):
         fixture_shape = self.b2d_body.fixtures[0].shape
         vertices_screen_2d_px = []
         for vertex_object_2d_m in fixture_shape.vertices:
             vertex_world_2d_m = self.b2d_body.transform * vertex_object_2d_m  # Overload operation
-            vertex_screen_2d_px = g.env.ConvertWorldToScreen( Vec2D(vertex_world_2d_m.x, vertex_world_2d_m.y)) # This returns a tuple
+            vertex_screen_2d_px = self.ctx.env.ConvertWorldToScreen( Vec2D(vertex_world_2d_m.x, vertex_world_2d_m.y)) # This returns a tuple
             vertices_screen_2d_px.append( vertex_screen_2d_px) # Append to the list.
-        pygame.draw.polygon(g.game_window.surface, self.color, vertices_screen_2d_px, g.env.zoomLineThickness(self.border_px))
+        pygame.draw.polygon(self.ctx.game_window.surface, self.color, vertices_screen_2d_px, self.ctx.env.zoomLineThickness(self.border_px))
+
+
+class WallSegment:
+    # A static line segment (circular engines). It is added to the air table's static shapes, which
+    # are kept in a bounding-volume hierarchy for the puck checks. See AirTable.checkForStaticCollisions.
+    def __init__(self, p1_2d_m, p2_2d_m, color=THECOLORS["orangered1"], border_px=3, ctx=None):
+        self.ctx = context_or_default(ctx)
+        self.p1_2d_m = p1_2d_m
+        self.p2_2d_m = p2_2d_m
+        self.color = color
+        self.border_px = border_px
+
+        # Bounding box: (x_min, y_min, x_max, y_max)
+        self.aabb_m = (min(p1_2d_m.x, p2_2d_m.x), min(p1_2d_m.y, p2_2d_m.y),
+                       max(p1_2d_m.x, p2_2d_m.x), max(p1_2d_m.y, p2_2d_m.y))
+
+        self.ctx.air_table.add_static_shape(self)
+
+    def contact(self, x_m, y_m, radius_m):
+        # For a puck at (x_m, y_m), return (normal_x, normal_y, penetration_m), with the normal
+        # pointing from the segment to the puck, or None if they don't touch.
+        return segment_contact(self.p1_2d_m.x, self.p1_2d_m.y, self.p2_2d_m.x, self.p2_2d_m.y, x_m, y_m, radius_m)
+
+    def delete(self):
+        self.ctx.air_table.remove_static_shape(self)
+
+    def draw(self):
+        pygame.draw.line(self.ctx.game_window.surface, self.color,
+                         self.ctx.env.ConvertWorldToScreen(self.p1_2d_m), self.ctx.env.ConvertWorldToScreen(self.p2_2d_m),
+                         self.ctx.env.zoomLineThickness(self.border_px))
+
+
+class WallPolygon:
+    # A static convex polygon (circular engines). The vertices can be in either order.
+    def __init__(self, vertices_2d_m, color=THECOLORS["orangered1"], border_px=3, ctx=None):
+        self.ctx = context_or_default(ctx)
+        if len(vertices_2d_m) < 3:
+            raise ValueError("A wall polygon needs at least three vertices.")
+
+        # Put the vertices in counterclockwise order, so the edge normals point out.
+        signed_area_m2 = 0.0
+        for i, vertex in enumerate(vertices_2d_m):
+            next_vertex = vertices_2d_m[(i + 1) % len(vertices_2d_m)]
+            signed_area_m2 += vertex.x * next_vertex.y - next_vertex.x * vertex.y
+        if signed_area_m2 < 0:
+            vertices_2d_m = vertices_2d_m[::-1]
+        self.vertices_2d_m = list(vertices_2d_m)
+
+        # Edges as (x1, y1, x2, y2, outward normal x, outward normal y)
+        self.edges = []
+        for i, vertex in enumerate(self.vertices_2d_m):
+            next_vertex = self.vertices_2d_m[(i + 1) % len(self.vertices_2d_m)]
+            edge_2d_m = next_vertex - vertex
+            edge_m = edge_2d_m.length()
+            self.edges.append((vertex.x, vertex.y, next_vertex.x, next_vertex.y, edge_2d_m.y/edge_m, -edge_2d_m.x/edge_m))
+
+        for i, edge in enumerate(self.edges):
+            next_edge = self.edges[(i + 1) % len(self.edges)]
+            # Cross product of consecutive edges (negative at a reflex vertex).
+            if ((edge[2] - edge[0]) * (next_edge[3] - next_edge[1]) - (edge[3] - edge[1]) * (next_edge[2] - next_edge[0])) < 0:
+                raise ValueError("Wall polygons must be convex.")
+
+        self.color = color
+        self.border_px = border_px
+
+        xs = [vertex.x for vertex in self.vertices_2d_m]
+        ys = [vertex.y for vertex in self.vertices_2d_m]
+        self.aabb_m = (min(xs), min(ys), max(xs), max(ys))
+
+        self.ctx.air_table.add_static_shape(self)
+
+    def contact(self, x_m, y_m, radius_m):
+        # Same as WallSegment.contact. If the center of the puck is inside the polygon, it is
+        # pushed out through the nearest edge.
+        max_distance_m = -math.inf
+        nearest_edge = None
+        for edge in self.edges:
+            distance_m = (x_m - edge[0]) * edge[4] + (y_m - edge[1]) * edge[5]
+            if distance_m > max_distance_m:
+                max_distance_m = distance_m
+                nearest_edge = edge
+
+        if max_distance_m <= 0.0:
+            # Center inside.
+            return (nearest_edge[4], nearest_edge[5], radius_m - max_distance_m)
+
+        # Center outside: the closest point is on one of the edges.
+        best_contact = None
+        for edge in self.edges:
+            contact = segment_contact(edge[0], edge[1], edge[2], edge[3], x_m, y_m, radius_m)
+            if (contact is not None) and ((best_contact is None) or (contact[2] > best_contact[2])):
+                best_contact = contact
+        return best_contact
+
+    def delete(self):
+        self.ctx.air_table.remove_static_shape(self)
+
+    def draw(self):
+        vertices_2d_px = [self.ctx.env.ConvertWorldToScreen(vertex) for vertex in self.vertices_2d_m]
+        pygame.draw.polygon(self.ctx.game_window.surface, self.color, vertices_2d_px, self.ctx.env.zoomLineThickness(self.border_px))
+
+
+def segment_contact(x1_m, y1_m, x2_m, y2_m, x_m, y_m, radius_m):
+    # Contact between a circle and the segment from (x1, y1) to (x2, y2). Returns (normal_x, normal_y,
+    # penetration_m), with the normal pointing toward the circle, or None if they don't touch.
+    edge_x = x2_m - x1_m
+    edge_y = y2_m - y1_m
+    edge_m2 = edge_x*edge_x + edge_y*edge_y
+    if edge_m2 > 0.0:
+        fraction = min(max(((x_m - x1_m)*edge_x + (y_m - y1_m)*edge_y) / edge_m2, 0.0), 1.0)
+    else:
+        fraction = 0.0
+    dx_m = x_m - (x1_m + fraction * edge_x)
+    dy_m = y_m - (y1_m + fraction * edge_y)
+    distance_m2 = dx_m*dx_m + dy_m*dy_m
+    if distance_m2 >= radius_m*radius_m:
+        return None
+
+    distance_m = math.sqrt(distance_m2)
+    if distance_m > 0.0:
+        return (dx_m / distance_m, dy_m / distance_m, radius_m - distance_m)
+    elif edge_m2 > 0.0:
+        # Center exactly on the segment: push out along the segment's left normal.
+        edge_m = math.sqrt(edge_m2)
+        return (-edge_y / edge_m, edge_x / edge_m, radius_m)
+    else:
+        return (0.0, 1.0, radius_m)
 
 
 class Puck:
+    # The state vectors, mass, radius, restitution, collision filter, and sleep state live in a row of
+    # the air table's PuckStore (NumPy arrays). These properties make them look like ordinary attributes.
+    pos_2d_m = vector_property('pos_2d_m')
+    vel_2d_mps = vector_property('vel_2d_mps')
+    SprDamp_force_2d_N = vector_property('SprDamp_force_2d_N')
+    jet_force_2d_N = vector_property('jet_force_2d_N')
+    cursorString_spring_force_2d_N = vector_property('cursorString_spring_force_2d_N')
+    cursorString_puckDrag_force_2d_N = vector_property('cursorString_puckDrag_force_2d_N')
+    puckDrag_force_2d_N = vector_property('puckDrag_force_2d_N')
+    impulse_2d_Ns = vector_property('impulse_2d_Ns')
+
+    mass_kg = scalar_property('mass_kg')
+    radius_m = scalar_property('radius_m')
+    coef_rest = scalar_property('coef_rest')
+    groupIndex = int_property('groupIndex')
+    categoryBits = int_property('categoryBits')
+    maskBits = int_property('maskBits')
+    # Sleeping pucks (circular engines) are not moved. See AirTable.update_sleep_states. For Box2D, this
+    # follows the sleep state of the body (see Box2DAirTable.get_Box2d_XandV_allPucks).
+    sleeping = int_property('sleeping')
+    # Box2D only: the body's spin and its moment of inertia (for the angular momentum diagnostics).
+    rotation_speed = scalar_property('rotation_speed')
+    inertia_kgm2 = scalar_property('inertia_kgm2')
+
     def __init__(self, pos_2d_m, radius_m, density_kgpm2, vel_2d_mps=Vec2D(0.0,0.0), 
                        angle_r=math.pi/2, angularVelocity_rps=0, showSpoke=True,
                        c_drag=0.0, coef_rest=0.85, CR_fixed=False,
                        hit_limit=50.0, show_health=False, age_limit_s=3.0,
                        color=THECOLORS["gray"], client_name=None, bullet=False, pin=False, border_px=3,
                        rect_fixture=False, hw_ratio=1.0, groupIndex=0, awake=True,
-                       friction=0.2, friction_fixed=False, c_angularDrag=0.0):
+                       categoryBits=CATEGORY_DEFAULT, maskBits=MASK_ALL,
+                       friction=0.2, friction_fixed=False, c_angularDrag=0.0, ctx=None):
         
+        self.ctx = context_or_default(ctx)
+
+        # Get a row in the puck store. This must be done before any of the stored
+        # attributes are set. Pin pucks get a row but are not moved by the physics.
+        self.ctx.air_table.puck_store.add(self, dynamic=(not pin))
+
         self.radius_m = radius_m
         self.diameter_m = 2 * radius_m
-        self.radius_px = round(g.env.px_from_m(self.radius_m))
+        self.radius_px = round(self.ctx.env.px_from_m(self.radius_m))
 
         self.density_kgpm2 = density_kgpm2    # mass per unit area
         self.mass_kg = self.density_kgpm2 * math.pi * self.radius_m ** 2
@@ -105,6 +277,8 @@ class Puck:
         self.angle_r = angle_r
         self.angularVelocity_rps = angularVelocity_rps
         self.groupIndex = groupIndex
+        self.categoryBits = categoryBits
+        self.maskBits = maskBits
         
         self.SprDamp_force_2d_N = Vec2D(0.0,0.0)
         self.jet_force_2d_N = Vec2D(0.0,0.0)
@@ -140,7 +314,7 @@ class Puck:
         
         # bullet nature
         self.bullet = bullet
-        self.birth_time_s = g.air_table.time_s
+        self.birth_time_s = self.ctx.air_table.time_s
         self.age_limit_s = age_limit_s
         
         # Keep track of health.
@@ -157,16 +331,17 @@ class Puck:
         self.pin = pin
         # Add puck to the lists of pucks, controlled pucks, and target pucks.
         if not pin:
-            if (g.air_table.engine == 'box2d'):
+            if (self.ctx.air_table.engine == 'box2d'):
                 self.b2d_body = self.create_Box2d_Puck()
-                g.air_table.puck_dictionary[self.b2d_body] = self
+                if (self.categoryBits & CATEGORY_BULLET):
+                    self.ctx.air_table.bullet_added()
 
-            g.air_table.pucks.append(self)
+            self.ctx.air_table.pucks.append(self)
             
             if not self.bullet:
-                g.air_table.target_pucks.append(self)
+                self.ctx.air_table.target_pucks.append(self)
                 if self.client_name:
-                    g.air_table.controlled_pucks.append(self)
+                    self.ctx.air_table.controlled_pucks.append(self)
                 
     # If you print an object instance...
     def __str__(self):
@@ -174,43 +349,61 @@ class Puck:
     
     # Box2d
     def create_Box2d_Puck(self):
-        # Create a dynamic body
-        dynamic_body = g.air_table.b2d_world.CreateDynamicBody(
-            position=b2Vec2(self.pos_2d_m.tuple()), 
-            angle=self.angle_r, angularVelocity=self.angularVelocity_rps,
-            linearVelocity=b2Vec2(self.vel_2d_mps.tuple()),
-            awake=self.awake
-        )
-        
-        if self.rect_fixture:
-            # And add a box fixture onto it.
-            half_width_m = self.radius_m
-            half_height_m = half_width_m * self.hw_ratio
-            self.width_m = half_width_m * 2.0
-            self.height_m = half_height_m * 2.0
-            dynamic_body.CreatePolygonFixture(
-                box=(half_width_m, half_height_m), 
-                density=self.density_kgpm2, 
-                friction=self.friction_atBirth, restitution=self.coef_rest_atBirth
-            )
+        # Gun bullets reuse an idle body from the air table's bullet pool, if there is one that fits.
+        pooled_body = None
+        if (self.categoryBits & CATEGORY_BULLET):
+            pooled_body = self.ctx.air_table.bullet_pool.acquire(self)
+
+        if pooled_body:
+            # The pooled body already has its fixture (same shape and density). Its state is reset in acquire.
+            dynamic_body = pooled_body
         else:
-            # And add a circular fixture onto it.
-            dynamic_body.CreateCircleFixture(
-                radius=self.radius_m, 
-                density=self.density_kgpm2, 
-                friction=self.friction_atBirth, restitution=self.coef_rest_atBirth
+            # Create a dynamic body
+            dynamic_body = self.ctx.air_table.b2d_world.CreateDynamicBody(
+                position=b2Vec2(self.pos_2d_m.tuple()), 
+                angle=self.angle_r, angularVelocity=self.angularVelocity_rps,
+                linearVelocity=b2Vec2(self.vel_2d_mps.tuple()),
+                awake=self.awake,
+                # The body refers back to its puck (used for cursor selection and by the contact listener).
+                userData=self
             )
+        
+            if self.rect_fixture:
+                # And add a box fixture onto it.
+                half_width_m = self.radius_m
+                half_height_m = half_width_m * self.hw_ratio
+                self.width_m = half_width_m * 2.0
+                self.height_m = half_height_m * 2.0
+                dynamic_body.CreatePolygonFixture(
+                    box=(half_width_m, half_height_m), 
+                    density=self.density_kgpm2, 
+                    friction=self.friction_atBirth, restitution=self.coef_rest_atBirth
+                )
+            else:
+                # And add a circular fixture onto it.
+                dynamic_body.CreateCircleFixture(
+                    radius=self.radius_m, 
+                    density=self.density_kgpm2, 
+                    friction=self.friction_atBirth, restitution=self.coef_rest_atBirth
+                )
 
         dynamic_body.fixtures[0].filterData.groupIndex = self.groupIndex
+        dynamic_body.fixtures[0].filterData.categoryBits = self.categoryBits
+        dynamic_body.fixtures[0].filterData.maskBits = self.maskBits
 
         # Set the mass attribute based on what box2d calculates.
         self.mass_kg = dynamic_body.mass
+        self.inertia_kgm2 = dynamic_body.inertia
         
         # fluid drag inside Box2D
         dynamic_body.linearDamping = self.c_drag
         dynamic_body.angularDamping = self.c_angularDrag
         dynamic_body.bullet = self.bullet
 
+        if pooled_body:
+            # Back into the world (at its new position).
+            dynamic_body.active = True
+
         return dynamic_body
     
     # Box2d
@@ -231,48 +424,67 @@ class Puck:
         self.pos_2d_m = pos_2d_m
         self.vel_2d_mps = vel_2d_m
 
-        if (g.air_table.engine == 'box2d'):
+        if (self.ctx.air_table.engine == 'box2d'):
             # Update Box2D body
             self.b2d_body.position = b2Vec2(pos_2d_m.x, pos_2d_m.y)
             self.b2d_body.linearVelocity = b2Vec2(vel_2d_m.x, vel_2d_m.y)
+            self.b2d_body.awake = True
 
     def delete(self):
-        if (g.air_table.engine == 'box2d'):
-            # Remove the puck from the dictionary.
-            del g.air_table.puck_dictionary[self.b2d_body]
-            # Remove the puck from the world in box2d.
-            g.air_table.b2d_world.DestroyBody(self.b2d_body)
+        if self.pin:
+            # Pin pucks are only in the store (not in Box2D or the pucks lists).
+            self.store.remove(self)
+            return
+
+        if (self.ctx.air_table.engine == 'box2d'):
+            if (self.categoryBits & CATEGORY_BULLET):
+                self.ctx.air_table.bullet_removed()
+            # Release the body's reference to the puck, then remove it from the world in box2d. A bullet's
+            # body is turned off and kept in the bullet pool, for reuse by the next bullet.
+            self.b2d_body.userData = None
+            if (self.categoryBits & CATEGORY_BULLET):
+                self.ctx.air_table.bullet_pool.release(self.b2d_body, self)
+            else:
+                self.ctx.air_table.b2d_world.DestroyBody(self.b2d_body)
+            self.b2d_body = None
+
+        # Wake the pucks that were resting against (or connected by springs to) this one.
+        self.ctx.air_table.wake_pucks_near(self)
 
         if (not self.bullet):
             # Delete any springs that connect this puck to other pucks.
-            for spring in g.air_table.springs[:]:
+            for spring in self.ctx.air_table.springs[:]:
                 if (spring.p1 == self) or (spring.p2 == self):
-                    g.air_table.springs.remove( spring)
+                    self.ctx.air_table.springs.remove( spring)
+                    # Also remove the pin puck at the far end of a pinned spring.
+                    if spring.p2.pin:
+                        spring.p2.delete()
             
             # If a client has selected this puck (a cursor string connected),
             # unselect it so the cursor string won't continue to be drawn. 
-            for client_name in g.env.clients:
-                client = g.env.clients[client_name]
+            for client_name in self.ctx.env.clients:
+                client = self.ctx.env.clients[client_name]
                 if client.selected_puck == self:
                     client.selected_puck = None
 
             # Remove the puck from special lists.
-            if self in g.air_table.controlled_pucks: 
-                g.air_table.controlled_pucks.remove(self)
-            if self in g.air_table.target_pucks:
-                g.air_table.target_pucks.remove(self)
+            if self in self.ctx.air_table.controlled_pucks: 
+                self.ctx.air_table.controlled_pucks.remove(self)
+            if self in self.ctx.air_table.target_pucks:
+                self.ctx.air_table.target_pucks.remove(self)
         
-        g.air_table.pucks.remove(self)
+        self.ctx.air_table.pucks.remove(self)
+        self.store.remove(self)
     
     def calc_regularDragForce(self):  
         self.puckDrag_force_2d_N = self.vel_2d_mps * -1 * self.c_drag
     
     def draw(self, tempColor=None):
         # Convert x,y to pixel screen location and then draw.
-        self.pos_2d_px = g.env.ConvertWorldToScreen( self.pos_2d_m)
+        self.pos_2d_px = self.ctx.env.ConvertWorldToScreen( self.pos_2d_m)
         
         # Update based on zoom factor in px_from_m.
-        self.radius_px = round(g.env.px_from_m( self.radius_m))
+        self.radius_px = round(self.ctx.env.px_from_m( self.radius_m))
         if (self.radius_px < 2):
             self.radius_px = 2
             
@@ -280,7 +492,7 @@ class Puck:
         if self.hit:
             puck_border_thickness = 0
             puck_color = THECOLORS["red"]
-            self.hitflash_duration_timer_s += g.env.dt_render_limit_s
+            self.hitflash_duration_timer_s += self.ctx.env.dt_render_limit_s
             if self.hitflash_duration_timer_s > self.hitflash_duration_timer_limit_s:
                 self.hit = False
         else:
@@ -296,31 +508,31 @@ class Puck:
             vertices_screen_2d_px = []
             for vertex_object_2d_m in fixture_shape.vertices:
                 vertex_world_2d_m = self.b2d_body.transform * vertex_object_2d_m  # Overload operation
-                vertex_screen_2d_px = g.env.ConvertWorldToScreen( Vec2D(vertex_world_2d_m.x, vertex_world_2d_m.y)) # This returns a tuple
+                vertex_screen_2d_px = self.ctx.env.ConvertWorldToScreen( Vec2D(vertex_world_2d_m.x, vertex_world_2d_m.y)) # This returns a tuple
                 vertices_screen_2d_px.append( vertex_screen_2d_px) # Append to the list.
-            pygame.draw.polygon(g.game_window.surface, puck_color, vertices_screen_2d_px, g.env.zoomLineThickness(puck_border_thickness))
+            pygame.draw.polygon(self.ctx.game_window.surface, puck_color, vertices_screen_2d_px, self.ctx.env.zoomLineThickness(puck_border_thickness))
             
         else:
             # Draw main puck body.
-            pygame.draw.circle( g.game_window.surface, puck_color, self.pos_2d_px, self.radius_px, g.env.zoomLineThickness(puck_border_thickness))
+            pygame.draw.circle( self.ctx.game_window.surface, puck_color, self.pos_2d_px, self.radius_px, self.ctx.env.zoomLineThickness(puck_border_thickness))
             
-            if (g.air_table.engine == 'box2d' and not self.pin):
+            if (self.ctx.air_table.engine == 'box2d' and not self.pin):
                 # If it's not a bullet and not a rectangle, draw a spoke to indicate rotational orientation.
                 if ((self.bullet == False) and (self.rect_fixture==False) and self.showSpoke):
                     # Shorten the spoke by a fraction of the thickness so that its end
                     # (and the blocky rendering) is hidden in the border.
-                    reduction_m = g.env.px_to_m * self.border_thickness_px * 0.50
+                    reduction_m = self.ctx.env.px_to_m * self.border_thickness_px * 0.50
                     # Position the outer-edge point right from the center (r_m, 0), so
                     # spoke will look like it's at zero angle.
                     point_on_radius_b2d_m = self.b2d_body.GetWorldPoint( b2Vec2(self.radius_m - reduction_m, 0.0))
                     point_on_radius_2d_m = Vec2D( point_on_radius_b2d_m.x, point_on_radius_b2d_m.y)
-                    point_on_radius_2d_px = g.env.ConvertWorldToScreen( point_on_radius_2d_m)
+                    point_on_radius_2d_px = self.ctx.env.ConvertWorldToScreen( point_on_radius_2d_m)
                     
                     point_at_center_b2d_m = self.b2d_body.GetWorldPoint( b2Vec2(0.0, 0.0))
                     point_at_center_2d_m = Vec2D( point_at_center_b2d_m.x, point_at_center_b2d_m.y)
-                    point_at_center_2d_px = g.env.ConvertWorldToScreen( point_at_center_2d_m)
+                    point_at_center_2d_px = self.ctx.env.ConvertWorldToScreen( point_at_center_2d_m)
 
-                    pygame.draw.line(g.game_window.surface, puck_color, point_on_radius_2d_px, point_at_center_2d_px, g.env.zoomLineThickness(puck_border_thickness))
+                    pygame.draw.line(self.ctx.game_window.surface, puck_color, point_on_radius_2d_px, point_at_center_2d_px, self.ctx.env.zoomLineThickness(puck_border_thickness))
                     # Round the end of the spoke that is at the center of the puck.
                     #pygame.draw.circle( g.game_window.surface, puck_color, self.pos_2d_px, 0.7 *g.env.zoomLineThickness(puck_border_thickness), 0)
         
@@ -336,15 +548,16 @@ class Puck:
             if (life_radius_px < 2.0):
                 life_radius_px = 2.0
             
-            pygame.draw.circle(g.game_window.surface, THECOLORS["red"], self.pos_2d_px, life_radius_px, g.env.zoomLineThickness(2))
+            pygame.draw.circle(self.ctx.game_window.surface, THECOLORS["red"], self.pos_2d_px, life_radius_px, self.ctx.env.zoomLineThickness(2))
 
 
 class Tube:
-    def __init__(self, puck, sf_abs=False):
-        # Associate the tube with the puck.
+    def __init__(self, puck, sf_abs=False, ctx=None):
+        # Associate the tube with the puck. The tube works in the puck's context unless told otherwise.
         self.puck = puck
+        self.ctx = puck.ctx if (ctx is None) else ctx
     
-        self.color = g.env.clients[self.puck.client_name].cursor_color
+        self.color = self.ctx.env.clients[self.puck.client_name].cursor_color
         
         # Degrees of rotation per second.
         self.rotation_rate_dps = 360.0
@@ -382,20 +595,20 @@ class Tube:
         vertices_2d_px = []
         for vertex_2d_m in vertices_2d_m:
             # Calculate absolute position of this vertex.
-            vertices_2d_px.append( g.env.ConvertWorldToScreen(vertex_2d_m + base_point_2d_m))
+            vertices_2d_px.append( self.ctx.env.ConvertWorldToScreen(vertex_2d_m + base_point_2d_m))
         return vertices_2d_px
         
     def draw_tube(self, line_thickness=3):
         # Draw the tube on the game-window surface. Establish the base_point as the center
         # of the puck.
-        pygame.draw.polygon(g.game_window.surface, self.color, 
-                            self.convert_from_world_to_screen(self.tube_vertices_2d_m, self.puck.pos_2d_m), g.env.zoomLineThickness(line_thickness))
+        pygame.draw.polygon(self.ctx.game_window.surface, self.color, 
+                            self.convert_from_world_to_screen(self.tube_vertices_2d_m, self.puck.pos_2d_m), self.ctx.env.zoomLineThickness(line_thickness))
 
 
 class Jet(Tube):
-    def __init__(self, puck, sf_abs=True):
+    def __init__(self, puck, sf_abs=True, ctx=None):
         # Associate the jet with the puck (referenced in the Tube class).
-        super().__init__(puck, sf_abs=sf_abs)
+        super().__init__(puck, sf_abs=sf_abs, ctx=ctx)
         
         # Degrees of rotation per second.
         self.rotation_rate_dps = 360.0
@@ -413,12 +626,12 @@ class Jet(Tube):
                                   Vec2D(-0.00 * self.sf_x, -1.40 * self.sf_y)]
                                    
         # Scaler magnitude of jet force.
-        self.jet_force_N = 1.3 * self.puck.mass_kg * abs(g.air_table.gON_2d_mps2.y)
+        self.jet_force_N = 1.3 * self.puck.mass_kg * abs(self.ctx.air_table.gON_2d_mps2.y)
         
         # Point everything down for starters.
         self.rotate_everything( 180)
         
-        self.client = g.env.clients[self.puck.client_name]
+        self.client = self.ctx.env.clients[self.puck.client_name]
         
     def turn_jet_forces_onoff(self):
         if (self.client.key_w == "D"):
@@ -429,9 +642,9 @@ class Jet(Tube):
             
     def client_rotation_control(self):
         if (self.client.key_a == "D"):
-            self.rotate_everything( +1 * self.rotation_rate_dps * g.env.dt_render_limit_s)
+            self.rotate_everything( +1 * self.rotation_rate_dps * self.ctx.env.dt_render_limit_s)
         if (self.client.key_d == "D"):
-            self.rotate_everything( -1 * self.rotation_rate_dps * g.env.dt_render_limit_s)
+            self.rotate_everything( -1 * self.rotation_rate_dps * self.ctx.env.dt_render_limit_s)
         if (self.client.key_s == "D"):
             # Rotate jet tube to be in the same direction as the motion of the puck.
             puck_velocity_angle = self.puck.vel_2d_mps.get_angle()
@@ -469,24 +682,24 @@ class Jet(Tube):
         # Draw a little nose cone on the other side of the puck from the jet. This is a
         # visual aid to help the player see the direction the puck will go when the jet is
         # on.
-        pygame.draw.polygon(g.game_window.surface, THECOLORS["yellow1"], 
+        pygame.draw.polygon(self.ctx.game_window.surface, THECOLORS["yellow1"], 
                             self.convert_from_world_to_screen(self.nose_vertices_2d_m, self.puck.pos_2d_m), 0)
         
         # Draw the red flame.
         if (self.client.key_w == "D"):
-            pygame.draw.polygon(g.game_window.surface, THECOLORS["red"], 
+            pygame.draw.polygon(self.ctx.game_window.surface, THECOLORS["red"], 
                                 self.convert_from_world_to_screen(self.flame_vertices_2d_m, self.puck.pos_2d_m), 0)
                                 
 
 class Gun(Tube):
-    def __init__(self, puck, sf_abs=True, bullet_age_limit_s=3.0):
+    def __init__(self, puck, sf_abs=True, bullet_age_limit_s=3.0, ctx=None):
         # Associate the gun with the puck (referenced in the Tube class).
-        super().__init__(puck, sf_abs=sf_abs)
+        super().__init__(puck, sf_abs=sf_abs, ctx=ctx)
         
         # Degrees of rotation per second.
         self.rotation_rate_dps = 180.0
         
-        self.color = g.env.clients[self.puck.client_name].cursor_color
+        self.color = self.ctx.env.clients[self.puck.client_name].cursor_color
 
         # Set a negative group index for bullet stream (inhibit collisions with itself)
         if self.puck.client_name == "local":
@@ -498,13 +711,13 @@ class Gun(Tube):
         self.rotate_everything( 45)
         
         self.bullet_speed_mps = 5.0
-        self.fire_time_s = g.air_table.time_s
+        self.fire_time_s = self.ctx.air_table.time_s
         self.firing_delay_s = 0.1
         self.bullet_count = 0
         self.bullet_count_limit = 10
         self.bullet_age_limit_s = bullet_age_limit_s
         self.gun_recharge_wait_s = 2.5
-        self.gun_recharge_start_time_s = g.air_table.time_s
+        self.gun_recharge_start_time_s = self.ctx.air_table.time_s
         self.gun_recharging = False
         
         self.shield = False
@@ -516,16 +729,16 @@ class Gun(Tube):
         self.shield_hit_count_limit = 20
         self.shield_recharging = False
         self.shield_recharge_wait_s = 4.0
-        self.shield_recharge_start_time_s = g.air_table.time_s
+        self.shield_recharge_start_time_s = self.ctx.air_table.time_s
         self.shield_thickness = 5
         self.targetPuck = None
-        self.client = g.env.clients[self.puck.client_name]
+        self.client = self.ctx.env.clients[self.puck.client_name]
         
     def client_rotation_control(self):
         if (self.client.key_j == "D"):
-            self.rotate_everything( +self.rotation_rate_dps * g.env.dt_render_limit_s)
+            self.rotate_everything( +self.rotation_rate_dps * self.ctx.env.dt_render_limit_s)
         if (self.client.key_l == "D"):
-            self.rotate_everything( -self.rotation_rate_dps * g.env.dt_render_limit_s)
+            self.rotate_everything( -self.rotation_rate_dps * self.ctx.env.dt_render_limit_s)
         if (self.client.key_k == "D"):
             # Rotate jet tube to be in the same direction as the motion of the puck.
             puck_velocity_angle = self.puck.vel_2d_mps.get_angle()
@@ -548,32 +761,32 @@ class Gun(Tube):
             self.rotate_everything( angle_change + 1.0)
         
     def findNewTarget(self):
-        puck_indexes = list( range( len( g.air_table.target_pucks)))
+        puck_indexes = list( range( len( self.ctx.air_table.target_pucks)))
         # Shuffle them.
         random.shuffle( puck_indexes)
         
         for puck_index in puck_indexes:
-            puck = g.air_table.target_pucks[ puck_index]
+            puck = self.ctx.air_table.target_pucks[ puck_index]
             # Other than itself, pick a new target.
             if (puck != self.puck) and (puck != self.targetPuck):
                 self.targetPuck = puck
                 break
         
     def control_firing(self):
-        droneShooting = self.client.drone and (len(g.air_table.target_pucks) > 1)
+        droneShooting = self.client.drone and (len(self.ctx.air_table.target_pucks) > 1)
         
         # Fire only if the shield is off.
         if ((self.client.key_i == "D") and (not self.shield)) or droneShooting:
             # Fire the gun.
-            if ((g.air_table.time_s - self.fire_time_s) > self.firing_delay_s) and (not self.gun_recharging):
+            if ((self.ctx.air_table.time_s - self.fire_time_s) > self.firing_delay_s) and (not self.gun_recharging):
                 self.fire_gun()
                 self.bullet_count += 1
                 # Timestamp the firing event.
-                self.fire_time_s = g.air_table.time_s
+                self.fire_time_s = self.ctx.air_table.time_s
     
         # Check to see if gun bullet count indicates the need to start recharging.
         if (self.bullet_count > self.bullet_count_limit):
-            self.gun_recharge_start_time_s = g.air_table.time_s
+            self.gun_recharge_start_time_s = self.ctx.air_table.time_s
             self.gun_recharging = True
             self.bullet_count = 0
             # At the beginning of the charging period, find a new target. This gives a
@@ -584,11 +797,11 @@ class Gun(Tube):
                 self.findNewTarget()
     
         # If recharged.
-        if (self.gun_recharging and (g.air_table.time_s - self.gun_recharge_start_time_s) > self.gun_recharge_wait_s):
+        if (self.gun_recharging and (self.ctx.air_table.time_s - self.gun_recharge_start_time_s) > self.gun_recharge_wait_s):
             self.gun_recharging = False
             # If the puck the drone is aiming at has been destroyed, find a new target
             # before starting to shoot.
-            if self.client.drone and not (self.targetPuck in g.air_table.target_pucks):
+            if self.client.drone and not (self.targetPuck in self.ctx.air_table.target_pucks):
                 self.findNewTarget()
                 
     def fire_gun(self):
@@ -607,7 +820,8 @@ class Gun(Tube):
         bullet_absolute_vel_2d_mps = self.puck.vel_2d_mps + bullet_relative_vel_2d_mps
 
         temp_bullet = Puck(initial_position_2d_m, bullet_radius_m, 0.3, vel_2d_mps=bullet_absolute_vel_2d_mps, 
-                           bullet=True, age_limit_s=self.bullet_age_limit_s, groupIndex=self.groupIndex)
+                           bullet=True, age_limit_s=self.bullet_age_limit_s, groupIndex=self.groupIndex,
+                           categoryBits=CATEGORY_BULLET, ctx=self.ctx)
         temp_bullet.color = self.client.cursor_color
         temp_bullet.client_name = self.puck.client_name
                 
@@ -622,15 +836,15 @@ class Gun(Tube):
         
         # Check to see if the shield hit count indicates the need to start recharging.
         if self.shield_hit_count > self.shield_hit_count_limit:
-            self.shield_recharge_start_time_s = g.air_table.time_s
+            self.shield_recharge_start_time_s = self.ctx.air_table.time_s
             self.shield = False
             self.shield_recharging = True
             self.shield_hit_count = 0
         else:
-            self.shield_thickness = g.env.zoomLineThickness(5 * (1 - self.shield_hit_count/self.shield_hit_count_limit), noFill=True)
+            self.shield_thickness = self.ctx.env.zoomLineThickness(5 * (1 - self.shield_hit_count/self.shield_hit_count_limit), noFill=True)
         
         # If recharged.
-        if (self.shield_recharging and (g.air_table.time_s - self.shield_recharge_start_time_s) > self.shield_recharge_wait_s):
+        if (self.shield_recharging and (self.ctx.air_table.time_s - self.shield_recharge_start_time_s) > self.shield_recharge_wait_s):
             self.shield_recharging = False
     
     def draw(self):
@@ -648,28 +862,31 @@ class Gun(Tube):
         if (self.shield):
             if self.shield_hit:
                 # Don't draw the shield for a moment after the hit. This visualizes the shield hit.
-                self.shield_hit_duration_s += g.env.dt_render_limit_s
+                self.shield_hit_duration_s += self.ctx.env.dt_render_limit_s
                 if (self.shield_hit_duration_s > self.shield_hit_duration_limit_s):
                     self.shield_hit = False
                     
             else:
                 # Display the shield 5px outside of the puck.
-                shield_radius_px = self.puck.radius_px + round(5 * g.env.viewZoom)
-                pygame.draw.circle(g.game_window.surface, self.color, 
+                shield_radius_px = self.puck.radius_px + round(5 * self.ctx.env.viewZoom)
+                pygame.draw.circle(self.ctx.game_window.surface, self.color, 
                                    self.puck.pos_2d_px, shield_radius_px, self.shield_thickness)
                                    
                                    
 class Spring:
     def __init__(self, p1, p2, length_m=3.0, strength_Npm=0.5, pin_radius_m=0.05,
-        color=THECOLORS["dodgerblue"], width_m=0.025, c_damp=0.5, c_drag=0.0):
+        color=THECOLORS["dodgerblue"], width_m=0.025, c_damp=0.5, c_drag=0.0, ctx=None):
         
+        # The spring works in the context of its first puck unless told otherwise.
+        self.ctx = p1.ctx if (ctx is None) else ctx
+
         # Optionally this spring can have one end pinned to a vector point. Do this by
         # passing in p2 as a vector.
-        if (p2.__class__.__name__ == 'Vec2D'):
+        if isinstance(p2, Vec2D):
             # Create a point puck at the pinning location. The location of this point puck
             # will never change because it is not in the pucks list that is processed by
             # the physics engine.
-            p2 = Puck( p2, pin_radius_m, 1.0, pin=True, border_px=0, color=THECOLORS['white'])
+            p2 = Puck( p2, pin_radius_m, 1.0, pin=True, border_px=0, color=THECOLORS['white'], ctx=self.ctx)
             length_m = 0.0
         
         self.p1 = p1
@@ -692,7 +909,7 @@ class Spring:
         self.draw_as_line = False
         
         # Automatically add this spring to the air_table springs list
-        g.air_table.springs.append(self)
+        self.ctx.air_table.springs.append(self)
     
     def calc_spring_forces_on_pucks(self):
         self.p1p2_separation_2d_m = self.p1.pos_2d_m - self.p2.pos_2d_m
@@ -731,6 +948,14 @@ class Spring:
         self.p1.SprDamp_force_2d_N += self.p1.vel_2d_mps * (-1) * self.c_drag
         self.p2.SprDamp_force_2d_N += self.p2.vel_2d_mps * (-1) * self.c_drag
         
+    def update_geometry(self):
+        # The separation of the ends. (The spring forces are usually calculated for all the springs
+        # at once, by the air table, so this is not left over from the force calculation.)
+        self.p1p2_separation_2d_m = self.p1.pos_2d_m - self.p2.pos_2d_m
+        self.p1p2_separation_m = self.p1p2_separation_2d_m.length()
+        if (self.p1p2_separation_m > 0.0):
+            self.p1p2_normalized_2d = self.p1p2_separation_2d_m / self.p1p2_separation_m
+
     def width_to_draw_m(self):
         width_m = self.unstretched_width_m * (1 + 0.30 * (self.length_m - self.p1p2_separation_m))
         if width_m < (0.05 * self.unstretched_width_m):
@@ -745,6 +970,7 @@ class Spring:
         # it's good to do this outside of the main calc loop (using the rendering timer).
         # No need to do all this each time step.
         
+        self.update_geometry()
         width_m = self.width_to_draw_m()
         
         # Calculate the four corners of the spring rectangle.
@@ -758,13 +984,13 @@ class Spring:
         # Transform from world to screen.
         self.spring_vertices_2d_px = []
         for vertice_2d_m in self.spring_vertices_2d_m:
-            self.spring_vertices_2d_px.append( g.env.ConvertWorldToScreen( vertice_2d_m))
+            self.spring_vertices_2d_px.append( self.ctx.env.ConvertWorldToScreen( vertice_2d_m))
         
         # Draw the spring
         if self.draw_as_line == True:
-            pygame.draw.aaline(g.game_window.surface, self.color, g.env.ConvertWorldToScreen(self.p1.pos_2d_m),
-                                                                       g.env.ConvertWorldToScreen(self.p2.pos_2d_m))
+            pygame.draw.aaline(self.ctx.game_window.surface, self.color, self.ctx.env.ConvertWorldToScreen(self.p1.pos_2d_m),
+                                                                       self.ctx.env.ConvertWorldToScreen(self.p2.pos_2d_m))
         else:
-            pygame.draw.polygon(g.game_window.surface, self.color, self.spring_vertices_2d_px)
+            pygame.draw.polygon(self.ctx.game_window.surface, self.color, self.spring_vertices_2d_px)
 
         if self.p2.pin: self.p2.draw()
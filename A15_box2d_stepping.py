@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Filename: A15_box2d_stepping.py
+
+"""
+Fixed-Hz substepping and adaptive solver iterations for the Box2D air table.
+
+In the floating and fixed time-step modes, the game loop advances the Box2D world with one call
+to b2World.Step per frame, using the frame's dt and 10 velocity and 10 position iterations. In the
+adaptive mode (shift+p), a Box2DStepController advances it instead: in whole substeps of a fixed
+size (1/step_hz), with an accumulator that carries the leftover time to the next frame (a frame
+can have no substeps at all). Box2D is at its most stable (e.g. for stacking) with a constant step
+size.
+
+Classes:
+    Box2DStepController: Plans the substeps for each frame, picks the solver iterations, and steps the world
+
+The iterations are picked each frame from the measured wall-clock cost of a substep and the
+number of contacts. They go down when the frame's substeps would not fit in the time budget,
+and up when there is time to spare, up to a ceiling set by the number of contacts: a few contacts
+can have many iterations, a crowded table gets fewer. A table with no contacts gets the minimum:
+the solver iterations only work on contacts and joints. What was picked is kept in last_frame (see
+report).
+"""
+
+import time
+
+
+class Box2DStepController:
+    def __init__(self, step_hz=120, max_substeps=8, budget_s=0.010):
+        self.step_hz = step_hz
+        self.max_substeps = max_substeps
+        # Wall-clock time allowed for the Box2D substeps in each frame.
+        self.budget_s = budget_s
+
+        # Solver iterations: start at the values recommended by Box2D and stay within these ranges.
+        self.velocity_iterations = 8
+        self.position_iterations = 3
+        self.velocity_iterations_range = (4, 20)
+        self.position_iterations_range = (2, 10)
+        # The solver's work goes with (velocity iterations) x (contacts). The velocity iterations are
+        # not raised above this many per contact, so a few contacts can get many iterations and a
+        # crowded table gets fewer (see iteration_ceilings).
+        self.contact_iterations = 400
+
+        self.accumulator_s = 0.0
+        self.substeps = 0
+        # Running average of the wall-clock time per substep.
+        self.substep_cost_s = None
+
+        self.last_frame = {}
+
+    def step_s(self):
+        return 1.0 / self.step_hz
+
+    def reset(self):
+        self.accumulator_s = 0.0
+        self.substep_cost_s = None
+
+    def plan_frame(self, dt_frame_s):
+        # Number of substeps for this frame: the frame time plus the time left over from the last frame,
+        # rounded to whole substeps. So the leftover is never more than half a substep either way, and
+        # the simulated time keeps pace with the frames. A frame that is shorter than the time left for a
+        # substep (e.g. an 8 ms frame from the millisecond clock, when a substep is 8.33 ms) can have no
+        # substeps; the game loop then leaves the forces for the next frame. If the frames are too long
+        # (more than max_substeps), the extra time is dropped rather than carried.
+        # Returns the simulated time for the frame.
+        step_s = self.step_s()
+        self.accumulator_s += dt_frame_s
+        substeps = int(self.accumulator_s / step_s + 0.5)
+        if substeps > self.max_substeps:
+            substeps = self.max_substeps
+            self.accumulator_s = substeps * step_s
+        self.substeps = substeps
+        self.accumulator_s -= substeps * step_s
+        return substeps * step_s
+
+    def iteration_ceilings(self, contact_count):
+        # The most velocity and position iterations to use with this many contacts. The position
+        # iterations are scaled along with the velocity iterations.
+        v_min, v_max = self.velocity_iterations_range
+        p_min, p_max = self.position_iterations_range
+        v_ceiling = min(v_max, max(v_min, self.contact_iterations // max(contact_count, 1)))
+        p_ceiling = p_min + ((p_max - p_min) * (v_ceiling - v_min)) // (v_max - v_min)
+        return v_ceiling, p_ceiling
+
+    def choose_iterations(self, contact_count):
+        v_min, v_max = self.velocity_iterations_range
+        p_min, p_max = self.position_iterations_range
+        if contact_count == 0:
+            # Nothing for the solver to iterate on.
+            self.velocity_iterations, self.position_iterations = v_min, p_min
+            return
+
+        # More contacts lower the ceiling (and bring the iterations down to it at once).
+        v_ceiling, p_ceiling = self.iteration_ceilings(contact_count)
+        self.velocity_iterations = min(self.velocity_iterations, v_ceiling)
+        self.position_iterations = min(self.position_iterations, p_ceiling)
+
+        if self.substep_cost_s is not None:
+            projected_s = self.substeps * self.substep_cost_s
+            if projected_s > self.budget_s:
+                self.velocity_iterations = max(v_min, self.velocity_iterations - 2)
+                self.position_iterations = max(p_min, self.position_iterations - 1)
+            elif projected_s < 0.5 * self.budget_s:
+                self.velocity_iterations = min(v_ceiling, self.velocity_iterations + 1)
+                self.position_iterations = min(p_ceiling, self.position_iterations + 1)
+
+    def step(self, b2d_world):
+        # Advance the world by the substeps planned for this frame. The forces applied before this call
+        # (for the whole frame) are held for all the substeps, then cleared.
+        if self.substeps == 0: return
+        contact_count = b2d_world.contactCount
+        self.choose_iterations(contact_count)
+
+        start_s = time.perf_counter()
+        b2d_world.autoClearForces = False
+        step_s = self.step_s()
+        for substep in range(self.substeps):
+            b2d_world.Step(step_s, self.velocity_iterations, self.position_iterations)
+        b2d_world.ClearForces()
+        b2d_world.autoClearForces = True
+
+        cost_s = (time.perf_counter() - start_s) / self.substeps
+        if self.substep_cost_s is None:
+            self.substep_cost_s = cost_s
+        else:
+            self.substep_cost_s += 0.1 * (cost_s - self.substep_cost_s)
+
+        self.last_frame = {'substeps': self.substeps, 'step_s': step_s,
+                           'velocity_iterations': self.velocity_iterations,
+                           'position_iterations': self.position_iterations,
+                           'contacts': contact_count, 'accumulator_s': self.accumulator_s}
+
+    def report(self):
+        frame = self.last_frame
+        if not frame: return ""
+        return (f"{frame['substeps']} x 1/{self.step_hz}  it {frame['velocity_iterations']}/{frame['position_iterations']}"
+                f"  contacts {frame['contacts']}")
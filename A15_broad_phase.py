@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Filename: A15_broad_phase.py
+
+"""
+Broad-phase collision culling for the circular air tables.
+
+The circular engines (CircularAirTable and PerfectKissAirTable) check every pair of pucks
+for overlap. With n pucks, that is n(n-1)/2 checks per time step. The classes here quickly
+find the pairs of pucks that are close enough to possibly be touching so that only these
+candidate pairs are passed on to check_for_puck_collisions.
+
+Classes:
+    SpatialHashGrid: Uniform grid of square cells, stored in a dictionary keyed by cell coordinates
+    SweepAndPrune: Sort-and-sweep along the x axis using an endpoint list kept between steps
+    StaticBVH: Bounding-volume hierarchy of the static shapes (wall segments and polygons)
+
+Each broad-phase object has a candidate_pairs(pucks, sleeping=None) method. This returns a sorted
+list of (i, j) index pairs, with i < j, into the pucks list. The sorting keeps the collisions
+processing in the same order as the original all-pairs loop. Pairs whose category and mask bits
+keep them from colliding are not reported. Neither are pairs of two sleeping pucks, if the sleep
+flags of the pucks are given (a list, in the order of the pucks list).
+
+The StaticBVH is different. It is built once (for a scene's walls) and its query(box) method
+returns the static shapes whose bounding boxes overlap the box around one puck.
+"""
+
+import math
+
+# The pair check in the circular engines also flags pucks as "tangled" (Jello Madness) when
+# their separation is less than (1.1)**0.5 times the sum of their radii. So the broad phase must
+# report pairs out to that distance, not just the touching pairs.
+REACH_FACTOR = 1.05
+
+# The pairs are listed at the positions from the start of the collision checks, but the wall and
+# pair corrections made during the checks move pucks. So each puck's reach is widened by this fraction
+# of its radius when listing the pairs. A puck that then moves less than that still has all its pairs
+# listed; one that moves further is checked against all the others (see AirTable.check_listed_pairs).
+MOVE_MARGIN_FACTOR = 0.25
+LISTING_REACH_FACTOR = REACH_FACTOR + MOVE_MARGIN_FACTOR
+
+
+def collision_filter_bits(pucks):
+    # Lists of the category and mask bits of the pucks (read once, not per pair).
+    return [puck.categoryBits for puck in pucks], [puck.maskBits for puck in pucks]
+
+
+class SpatialHashGrid:
+    def __init__(self, cell_size_m=None):
+        # If the cell size is not specified, it is derived each step from the largest puck.
+        self.cell_size_m = cell_size_m
+        self.cell_size_used_m = None
+
+        # Lists of puck indexes, keyed by the (ix, iy) integer coordinates of the cell.
+        self.cells = {}
+
+    def derived_cell_size_m(self, pucks):
+        # A cell the width of the largest puck's reach (diameter) means a puck can
+        # touch at most a 2x2 block of cells.
+        largest_radius_m = max(puck.radius_m for puck in pucks)
+        return 2.0 * largest_radius_m * LISTING_REACH_FACTOR
+
+    def candidate_pairs(self, pucks, sleeping=None):
+        if (len(pucks) < 2) or (sleeping and all(sleeping)):
+            return []
+
+        if self.cell_size_m:
+            cell_m = self.cell_size_m
+        else:
+            cell_m = self.derived_cell_size_m(pucks)
+        self.cell_size_used_m = cell_m
+
+        # Rebuild the grid each step. Each puck is added to every cell that its reach
+        # (bounding box) overlaps. This works for any cell size, even one smaller than the pucks.
+        self.cells = {}
+        cells = self.cells
+        for i, puck in enumerate(pucks):
+            reach_m = puck.radius_m * LISTING_REACH_FACTOR
+            x_m = puck.pos_2d_m.x
+            y_m = puck.pos_2d_m.y
+            ix_min = math.floor((x_m - reach_m) / cell_m)
+            ix_max = math.floor((x_m + reach_m) / cell_m)
+            iy_min = math.floor((y_m - reach_m) / cell_m)
+            iy_max = math.floor((y_m + reach_m) / cell_m)
+            for ix in range(ix_min, ix_max + 1):
+                for iy in range(iy_min, iy_max + 1):
+                    key = (ix, iy)
+                    if key in cells:
+                        cells[key].append(i)
+                    else:
+                        cells[key] = [i]
+
+        # Pucks sharing a cell are candidates. The indexes in each cell are in ascending order
+        # (the pucks were added in order) so each pair comes out as (i, j) with i < j. The set
+        # removes the duplicates from pucks that share more than one cell.
+        categoryBits, maskBits = collision_filter_bits(pucks)
+        pairs = set()
+        for members in cells.values():
+            n_members = len(members)
+            if n_members > 1:
+                for a in range(n_members - 1):
+                    i = members[a]
+                    for b in range(a + 1, n_members):
+                        j = members[b]
+                        if sleeping and sleeping[i] and sleeping[j]:
+                            continue
+                        if (categoryBits[i] & maskBits[j]) and (categoryBits[j] & maskBits[i]):
+                            pairs.add((i, j))
+
+        return sorted(pairs)
+
+
+class SweepAndPrune:
+    def __init__(self):
+        # Each puck has two endpoints on the x axis: the left and right edges of its reach.
+        # An endpoint is a small list, [x_m, is_right, puck], so its position can be updated
+        # in place. The list of endpoints is kept (sorted) from one step to the next.
+        self.endpoints = []
+        self.tracked_pucks = set()
+
+        # Number of endpoint moves in the last insertion sort (a measure of how much the
+        # order changed since the previous step).
+        self.sort_moves = 0
+
+    def sync_membership(self, pucks):
+        current_pucks = set(pucks)
+        if current_pucks == self.tracked_pucks:
+            return
+
+        # Drop the endpoints of deleted pucks and add endpoints for new ones. New endpoints
+        # go on the end of the list; the insertion sort moves them into place.
+        self.endpoints = [e for e in self.endpoints if e[2] in current_pucks]
+        for puck in pucks:
+            if puck not in self.tracked_pucks:
+                self.endpoints.append([0.0, False, puck])
+                self.endpoints.append([0.0, True, puck])
+        self.tracked_pucks = current_pucks
+
+    def candidate_pairs(self, pucks, sleeping=None):
+        # (When all the pucks are asleep, the endpoints are left as they are. They are updated
+        # and re-sorted in the next call that needs them.)
+        if (len(pucks) < 2) or (sleeping and all(sleeping)):
+            return []
+
+        self.sync_membership(pucks)
+
+        # Update the endpoint positions.
+        for e in self.endpoints:
+            puck = e[2]
+            if e[1]:
+                e[0] = puck.pos_2d_m.x + puck.radius_m * LISTING_REACH_FACTOR
+            else:
+                e[0] = puck.pos_2d_m.x - puck.radius_m * LISTING_REACH_FACTOR
+
+        # Insertion sort. The pucks move very little in one time step, so the list is almost
+        # sorted and this is close to O(n). At equal positions, left edges go first so that
+        # touching reaches are reported as overlapping.
+        endpoints = self.endpoints
+        moves = 0
+        for k in range(1, len(endpoints)):
+            e = endpoints[k]
+            x_m = e[0]
+            j = k - 1
+            while (j >= 0) and ((endpoints[j][0] > x_m) or ((endpoints[j][0] == x_m) and endpoints[j][1] and not e[1])):
+                endpoints[j + 1] = endpoints[j]
+                j -= 1
+            if (j + 1) != k:
+                endpoints[j + 1] = e
+                moves += k - (j + 1)
+        self.sort_moves = moves
+
+        # Sweep along x. Any puck whose left edge is reached while other pucks are still open
+        # (active) overlaps them in x. Check the y overlap before reporting the pair.
+        index_of = {puck: i for i, puck in enumerate(pucks)}
+        categoryBits, maskBits = collision_filter_bits(pucks)
+        active = []
+        pairs = []
+        for e in endpoints:
+            puck = e[2]
+            if e[1]:
+                active.remove(puck)
+            else:
+                i = index_of[puck]
+                y_m = puck.pos_2d_m.y
+                reach_m = puck.radius_m * LISTING_REACH_FACTOR
+                for otherpuck in active:
+                    if abs(otherpuck.pos_2d_m.y - y_m) <= (reach_m + otherpuck.radius_m * LISTING_REACH_FACTOR):
+                        j = index_of[otherpuck]
+                        if sleeping and sleeping[i] and sleeping[j]:
+                            continue
+                        if not ((categoryBits[i] & maskBits[j]) and (categoryBits[j] & maskBits[i])):
+                            continue
+                        if i < j:
+                            pairs.append((i, j))
+                        else:
+                            pairs.append((j, i))
+                active.append(puck)
+
+        pairs.sort()
+        return pairs
+
+
+class StaticBVH:
+    def __init__(self, shapes, leaf_size=4):
+        # Each shape has a bounding box, aabb_m = (x_min, y_min, x_max, y_max). The tree is built by
+        # splitting the shapes at the median of their box centers, along the longer axis of the
+        # node's box. Nodes are stored in parallel lists: the node's box, and either its two
+        # children (internal node) or its list of shapes (leaf).
+        self.shapes = list(shapes)
+        self.leaf_size = leaf_size
+        self.boxes = []
+        self.children = []
+        self.leaf_shapes = []
+        if self.shapes:
+            self.build(self.shapes)
+
+    def build(self, shapes):
+        node = len(self.boxes)
+        box = (min(shape.aabb_m[0] for shape in shapes), min(shape.aabb_m[1] for shape in shapes),
+               max(shape.aabb_m[2] for shape in shapes), max(shape.aabb_m[3] for shape in shapes))
+        self.boxes.append(box)
+        self.children.append(None)
+        self.leaf_shapes.append(None)
+
+        if len(shapes) <= self.leaf_size:
+            self.leaf_shapes[node] = shapes
+            return node
+
+        axis = 0 if ((box[2] - box[0]) >= (box[3] - box[1])) else 1
+        shapes = sorted(shapes, key=lambda shape: shape.aabb_m[axis] + shape.aabb_m[axis + 2])
+        half = len(shapes) // 2
+        left = self.build(shapes[:half])
+        right = self.build(shapes[half:])
+        self.children[node] = (left, right)
+        return node
+
+    def query(self, x_min, y_min, x_max, y_max):
+        # Shapes whose boxes overlap the query box.
+        if not self.boxes:
+            return []
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            box = self.boxes[node]
+            if (box[0] > x_max) or (box[2] < x_min) or (box[1] > y_max) or (box[3] < y_min):
+                continue
+            if self.children[node] is None:
+                for shape in self.leaf_shapes[node]:
+                    shape_box = shape.aabb_m
+                    if not ((shape_box[0] > x_max) or (shape_box[2] < x_min) or (shape_box[1] > y_max) or (shape_box[3] < y_min)):
+                        found.append(shape)
+            else:
+                stack.extend(self.children[node])
+        return found
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Filename: A15_diagnostics.py
+
+"""
+Energy and momentum diagnostics for the air tables.
+
+AirTable.measure_diagnostics calculates the conserved quantities of the pucks and springs in one
+vectorized pass: kinetic energy, spring potential, gravitational potential, linear momentum and
+angular momentum. When diagnostics are turned on (shift+F1), the game loop records a sample every
+diagnostics_decimation steps into a ring buffer. The buffer can be drawn as a small graph in the
+corner of the game window, and can be streamed to a CSV file. Samples are spaced further apart when
+needed to keep their cost under 2% (diagnostics_budget) of the time spent in the physics steps.
+
+Classes:
+    DiagnosticsRing: Fixed-size ring buffer (a NumPy array) of the most recent samples
+    DiagnosticsGraph: Draws the recent energy samples as a strip chart, in the style of RunningAvg.draw
+    DiagnosticsFileSink: Appends the new samples in a ring buffer to a CSV file
+
+The ring buffer is preallocated, so recording a sample doesn't allocate anything. A sudden jump in
+the total energy (a numerical blow-up) is reported once, when it is recorded, so a session can be
+left running with the diagnostics on.
+"""
+
+import math
+
+import numpy as np
+from pygame.color import THECOLORS
+
+
+class DiagnosticsRing:
+    fields = ('time_s', 'kinetic_J', 'spring_J', 'gravity_J', 'total_J', 'px_Ns', 'py_Ns', 'L_Js')
+
+    def __init__(self, capacity=600):
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, len(self.fields)))
+        self.column = {name: k for k, name in enumerate(self.fields)}
+        self.reset()
+
+    def reset(self):
+        # Number of samples ever recorded (the next sample goes in row count % capacity).
+        self.count = 0
+
+    def append(self, sample):
+        self.samples[self.count % self.capacity] = sample
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self, name):
+        if self.count == 0: return None
+        return float(self.samples[(self.count - 1) % self.capacity, self.column[name]])
+
+    def series(self, name, since_count=0):
+        # Values of one field, oldest first. Only the samples recorded after since_count (a value of
+        # count) are returned; older samples that have been overwritten are skipped.
+        first = max(since_count, self.count - self.capacity)
+        rows = np.arange(first, self.count) % self.capacity
+        return self.samples[rows, self.column[name]]
+
+    def rows_since(self, since_count):
+        # Whole samples (oldest first), as for series.
+        first = max(since_count, self.count - self.capacity)
+        rows = np.arange(first, self.count) % self.capacity
+        return self.samples[rows]
+
+
+class DiagnosticsGraph:
+    def __init__(self, pygame_instance, width_px=200, height_px=60):
+        self.pygame = pygame_instance
+        self.font = self.pygame.font.SysFont("Courier", 16)
+        self.width_px = width_px
+        self.height_px = height_px
+        self.backGroundColor = THECOLORS["grey14"]
+        self.textColor = THECOLORS["white"]
+        # Energy fields drawn, and their colors.
+        self.traces = [('total_J', THECOLORS["white"]), ('kinetic_J', THECOLORS["orange"]),
+                       ('spring_J', THECOLORS["dodgerblue"]), ('gravity_J', THECOLORS["green"])]
+
+    def draw(self, pygame_display, ring, pos_x, pos_y):
+        if len(ring) < 2: return
+        self.pygame.draw.rect(pygame_display, self.backGroundColor, self.pygame.Rect(pos_x, pos_y, self.width_px, self.height_px + 20))
+
+        # All the traces share one vertical scale.
+        series = [(ring.series(name)[-self.width_px:], color) for name, color in self.traces]
+        low = min(float(np.min(values)) for values, color in series)
+        high = max(float(np.max(values)) for values, color in series)
+        if not (math.isfinite(low) and math.isfinite(high)): return
+        span = (high - low) or 1.0
+
+        for values, color in series:
+            x_px = pos_x + np.arange(len(values)) * (self.width_px - 1) / max(len(values) - 1, 1)
+            y_px = pos_y + 20 + (self.height_px - 1) * (high - values) / span
+            self.pygame.draw.lines(pygame_display, color, False, np.column_stack((x_px, y_px)).tolist())
+
+        # The latest total energy
+        txt_surface = self.font.render(f"E {ring.latest('total_J'):10.3f} J", True, self.textColor)
+        pygame_display.blit(txt_surface, [pos_x + 3, pos_y + 1])
+
+
+class DiagnosticsFileSink:
+    def __init__(self, file_name, flush_every=60):
+        self.file_name = file_name
+        self.file = open(file_name, 'w')
+        self.file.write(",".join(DiagnosticsRing.fields) + "\n")
+        self.written_count = 0
+        self.flush_every = flush_every
+        self.unflushed = 0
+
+    def write_new(self, ring):
+        # Append the samples recorded since the last call. (If more than a full ring of samples was
+        # recorded in between, the overwritten ones are lost.)
+        rows = ring.rows_since(self.written_count)
+        self.written_count = ring.count
+        for row in rows:
+            self.file.write(",".join(f"{value:.9g}" for value in row) + "\n")
+        self.unflushed += len(rows)
+        if self.unflushed >= self.flush_every:
+            self.file.flush()
+            self.unflushed = 0
+
+    def close(self):
+        self.file.close()
@@ -39,14 +39,14 @@ from pygame.locals import (
     K_f, K_g, K_r, K_x, K_e, K_q,
     K_n, K_h, K_LCTRL, K_RCTRL, K_z, K_p,
     K_t, K_LSHIFT, K_RSHIFT, K_F1, K_TAB,
-    K_RIGHT, K_LEFT
+    K_RIGHT, K_LEFT, K_b, K_v, K_c, K_m
 )
 from pygame.color import THECOLORS
 from Box2D import b2Vec2
 
 from A08_network import RunningAvg, setClientColors
 from A09_vec2d import Vec2D
-import A15_globals as g
+from A15_simulation_context import context_or_default
 
 
 def custom_update(self, client_name, state_dict):    
@@ -98,7 +98,10 @@ def signInOut_function(self, client_name, activate=True):
 
 
 class Client:
-    def __init__(self, cursor_color):
+    def __init__(self, cursor_color, ctx=None):
+        # The air table and env are reached through the simulation context (A15_globals by default).
+        self.ctx = context_or_default(ctx)
+
         self.cursor_location_px: tuple[int, int] = (0,0)   # x_px, y_px
         self.mouse_button = 1 # 1, 2, or 3
         self.buttonIsStillDown = False
@@ -166,7 +169,7 @@ class Client:
         # the puck from unselecting if cursor is dragged off the puck!
         if (self.selected_puck == None):
             if self.buttonIsStillDown:
-                self.selected_puck = g.air_table.checkForPuckAtThisPosition(self.cursor_location_px)        
+                self.selected_puck = self.ctx.air_table.checkForPuckAtThisPosition(self.cursor_location_px)        
         
         else:
             if not self.buttonIsStillDown:
@@ -178,15 +181,15 @@ class Client:
             # Use dx difference to calculate the hooks law force being applied by the tether line. 
             # If you release the mouse button after a drag it will fling the puck.
             # This tether force will diminish as the puck gets closer to the mouse point.
-            dx_2d_m = g.env.ConvertScreenToWorld(Vec2D(self.cursor_location_px)) - self.selected_puck.pos_2d_m
+            dx_2d_m = self.ctx.env.ConvertScreenToWorld(Vec2D(self.cursor_location_px)) - self.selected_puck.pos_2d_m
             
             stringName = "string" + str(self.mouse_button)
             self.selected_puck.cursorString_spring_force_2d_N   += dx_2d_m * self.mouse_strings[stringName]['k_Npm']
             
             # The drag force is generally in the opposite direction from the puck velocity. So the sign term is -1
             # unless the timeDirection has been reversed in testing the reversibility of perfect-kiss collisions. 
-            if (g.air_table.engine == 'circular-perfectKiss'):
-                sign = -1 * g.air_table.timeDirection 
+            if (self.ctx.air_table.engine == 'circular-perfectKiss'):
+                sign = -1 * self.ctx.air_table.timeDirection 
             else:
                 sign = -1
             self.selected_puck.cursorString_puckDrag_force_2d_N += self.selected_puck.vel_2d_mps * sign * self.mouse_strings[stringName]['c_drag']
@@ -202,7 +205,7 @@ class Client:
             if self.buttonIsStillDown:
                 # Depending on whether the shift key is down or not, do a COM based selection.
                 # Use box2d to look for pucks at the cursor location.
-                result = g.air_table.checkForPuckAtThisPosition_b2d(self.cursor_location_px)
+                result = self.ctx.air_table.checkForPuckAtThisPosition_b2d(self.cursor_location_px)
                 self.selected_puck = result['puck']
                 if (self.key_shift == 'D' or self.select_offCenter_lock):
                     # non-COM selection, specific local point on object.
@@ -252,7 +255,7 @@ class Client:
             # Calculation and aggregation of the cursor forces.
             if self.COM_selection:
                 # Spring force
-                dx_2d_m = g.env.ConvertScreenToWorld(Vec2D(self.cursor_location_px)) - self.selected_puck.pos_2d_m
+                dx_2d_m = self.ctx.env.ConvertScreenToWorld(Vec2D(self.cursor_location_px)) - self.selected_puck.pos_2d_m
                 spring_force_2d_N = dx_2d_m * self.mouse_strings[stringName]['k_Npm'] * force_choke
                 self.selected_puck.cursorString_spring_force_2d_N += spring_force_2d_N
                 
@@ -263,7 +266,7 @@ class Client:
             else:
                 # NonCOM selection:
                 # Spring
-                dx_2d_m = g.env.ConvertScreenToWorld(Vec2D(self.cursor_location_px)) - self.selection_2d_m
+                dx_2d_m = self.ctx.env.ConvertScreenToWorld(Vec2D(self.cursor_location_px)) - self.selection_2d_m
                 
                 # Spring force
                 spring_force_2d_N = dx_2d_m * self.mouse_strings_nonCOM[stringName]['k_Npm'] * force_choke
@@ -295,7 +298,7 @@ class Client:
                     self.selected_puck.cursorString_torque_force_Nm = 10.0 * self.selected_puck.mass_kg * spin_direction
 
     def calc_string_forces_on_pucks(self):
-        if (g.air_table.engine == "box2d"):
+        if (self.ctx.air_table.engine == "box2d"):
             self.calc_string_forces_on_pucks_b2d()
         else:
             self.calc_string_forces_on_pucks_circular()
@@ -307,14 +310,14 @@ class Client:
             else:
                 selection_location_2d_m = self.selection_2d_m
 
-            line_points = [g.env.ConvertWorldToScreen(selection_location_2d_m), self.cursor_location_px]
+            line_points = [self.ctx.env.ConvertWorldToScreen(selection_location_2d_m), self.cursor_location_px]
 
             # small circle at selection point.
             radius_px = 4  # * g.env.viewZoom
-            pygame.draw.circle(g.game_window.surface, THECOLORS['red'], line_points[0], radius_px, 2)
+            pygame.draw.circle(self.ctx.game_window.surface, THECOLORS['red'], line_points[0], radius_px, 2)
 
             # Draw green/red indicator circles when applying torque.
-            if (g.air_table.engine == "box2d") and (self.key_t == "D"):
+            if (self.ctx.air_table.engine == "box2d") and (self.key_t == "D"):
                 if self.selected_puck.rect_fixture:
                     height_px = 2 * self.selected_puck.hw_ratio * self.selected_puck.radius_px
                     width_px = 2 * self.selected_puck.radius_px
@@ -326,9 +329,9 @@ class Client:
                     indicator_color = THECOLORS['green']
                 elif self.key_shift == "D":
                     indicator_color = THECOLORS['red']
-                pygame.draw.circle(g.game_window.surface, indicator_color, line_points[0], indicator_r_px, 4)
+                pygame.draw.circle(self.ctx.game_window.surface, indicator_color, line_points[0], indicator_r_px, 4)
 
-            pygame.draw.line(g.game_window.surface, self.cursor_color, line_points[0], line_points[1], 1)  # g.env.zoomLineThickness(1)
+            pygame.draw.line(self.ctx.game_window.surface, self.cursor_color, line_points[0], line_points[1], 1)  # g.env.zoomLineThickness(1)
                     
     def draw_fancy_server_cursor(self):
         self.draw_server_cursor( self.cursor_color, 0)
@@ -340,30 +343,31 @@ class Client:
         cursor_outline_vertices.append( (self.cursor_location_px[0] + 12,  self.cursor_location_px[1] + 12) )
         cursor_outline_vertices.append( (self.cursor_location_px[0] +  0,  self.cursor_location_px[1] + 17) )
         
-        pygame.draw.polygon(g.game_window.surface, color, cursor_outline_vertices, edge_px)
+        pygame.draw.polygon(self.ctx.game_window.surface, color, cursor_outline_vertices, edge_px)
 
         if self.buttonIsStillDown:
-            pygame.draw.circle(g.game_window.surface, THECOLORS['red'], self.cursor_location_px, 4, 2)
+            pygame.draw.circle(self.ctx.game_window.surface, THECOLORS['red'], self.cursor_location_px, 4, 2)
 
 
 class GameWindow:
-    def __init__(self, title):
-        self.width_px = g.env.screenSize_2d_px.x
-        self.height_px = g.env.screenSize_2d_px.y
+    def __init__(self, title, ctx=None):
+        self.ctx = context_or_default(ctx)
+        self.width_px = self.ctx.env.screenSize_2d_px.x
+        self.height_px = self.ctx.env.screenSize_2d_px.y
         
         # The initial World position vector of the Upper Right corner of the screen.
         # Yes, y_px = 0 for UR.
-        self.UR_2d_m = g.env.ConvertScreenToWorld(Vec2D(self.width_px, 0))
+        self.UR_2d_m = self.ctx.env.ConvertScreenToWorld(Vec2D(self.width_px, 0))
 
         self.center_2d_m = Vec2D(self.UR_2d_m.x / 2.0, self.UR_2d_m.y / 2.0)
         
-        print(f"Screen dimensions in pixels: {g.env.screenSize_2d_px.x:.0f}, {g.env.screenSize_2d_px.y:.0f}")
+        print(f"Screen dimensions in pixels: {self.ctx.env.screenSize_2d_px.x:.0f}, {self.ctx.env.screenSize_2d_px.y:.0f}")
         print(f"Screen dimensions in meters: {self.UR_2d_m.x:.2f}, {self.UR_2d_m.y:.2f}")
-        print(f"One pixel = {g.env.px_to_m * 1:.4f} meters")
+        print(f"One pixel = {self.ctx.env.px_to_m * 1:.4f} meters")
         
         # Create a reference to the display surface object. This is a pygame "surface".
         # Screen dimensions in pixels (tuple)
-        self.surface = pygame.display.set_mode(g.env.screenSize_2d_px.tuple())
+        self.surface = pygame.display.set_mode(self.ctx.env.screenSize_2d_px.tuple())
 
         self.set_caption(title)
         
@@ -428,7 +432,8 @@ class GameWindow:
 
 
 class Environment:
-    def __init__(self, screen_tuple_px, length_x_m, aspect_ratio_wh):
+    def __init__(self, screen_tuple_px, length_x_m, aspect_ratio_wh, ctx=None):
+        self.ctx = context_or_default(ctx)
         self.screenSize_2d_px = Vec2D(screen_tuple_px)
         self.viewOffset_2d_px = Vec2D(0,0)
         self.viewZoom = 1
@@ -443,13 +448,15 @@ class Environment:
         self.client_colors = setClientColors()
                               
         # Initialize the client dictionary with a local (non-network) client.
-        self.clients = {'local':Client(THECOLORS["green"])}
+        self.clients = {'local':Client(THECOLORS["green"], ctx=self.ctx)}
         self.clients['local'].active = True
         
         self.fr_avg = RunningAvg(300, pygame, colorScheme='light')
         
         self.constant_dt_s = 1.0/60.0
         self.timestep_fixed = False
+        # Adaptive steps are supported by the circular and perfect-kiss engines.
+        self.timestep_adaptive = False
 
         self.tickCount = 0
         self.inhibit_screen_clears = False
@@ -476,7 +483,7 @@ class Environment:
         }
                         
     def remove_healthless_pucks(self):
-        for puck in g.air_table.pucks[:]:  # [:] indicates a copy 
+        for puck in self.ctx.air_table.pucks[:]:  # [:] indicates a copy 
             if (puck.bullet_hit_count > puck.bullet_hit_limit):
                 puck.delete()
 
@@ -536,24 +543,26 @@ class Environment:
 
     def set_allPucks_elastic(self):
         print("CRs for all pucks have been set for elastic collisions (CR=1)")
-        for eachpuck in g.air_table.pucks:
+        for eachpuck in self.ctx.air_table.pucks:
             eachpuck.coef_rest = 1.0
     
     def set_gravity(self, onOff):
         if (onOff == "on"):
-            g.air_table.g_ON = True
+            self.ctx.air_table.g_ON = True
         else:
-            g.air_table.g_ON = False
+            self.ctx.air_table.g_ON = False
         self.adjust_restitution_for_gravity()
 
     def adjust_restitution_for_gravity(self):
-        if g.air_table.g_ON:
-            g.air_table.g_2d_mps2 = g.air_table.gON_2d_mps2
-            for each_puck in g.air_table.pucks:
+        # A change in gravity wakes any sleeping pucks (circular engines).
+        self.ctx.air_table.wake_all_pucks()
+        if self.ctx.air_table.g_ON:
+            self.ctx.air_table.g_2d_mps2 = self.ctx.air_table.gON_2d_mps2
+            for each_puck in self.ctx.air_table.pucks:
                 if not each_puck.CR_fixed:
-                    each_puck.coef_rest = min(each_puck.coef_rest_atBirth, g.air_table.gON_coef_rest_max)
+                    each_puck.coef_rest = min(each_puck.coef_rest_atBirth, self.ctx.air_table.gON_coef_rest_max)
                     if each_puck.b2d_body:
-                        each_puck.b2d_body.fixtures[0].restitution = min(each_puck.coef_rest_atBirth,  g.air_table.gON_coef_rest_max)
+                        each_puck.b2d_body.fixtures[0].restitution = min(each_puck.coef_rest_atBirth,  self.ctx.air_table.gON_coef_rest_max)
 
                 # Box2d only
                 if not each_puck.friction_fixed:
@@ -561,8 +570,8 @@ class Environment:
                     if each_puck.b2d_body:
                         each_puck.b2d_body.fixtures[0].friction = each_puck.friction_atBirth
         else:
-            g.air_table.g_2d_mps2 = g.air_table.gOFF_2d_mps2
-            for each_puck in g.air_table.pucks:
+            self.ctx.air_table.g_2d_mps2 = self.ctx.air_table.gOFF_2d_mps2
+            for each_puck in self.ctx.air_table.pucks:
                 if not each_puck.CR_fixed:
                     each_puck.coef_rest = 1.0
                     if each_puck.b2d_body:
@@ -624,14 +633,14 @@ class Environment:
                 elif (event.key==K_f):
                     if local_user.key_shift == 'D':
                         # Stop rotational movement.
-                        for puck in g.air_table.pucks:
+                        for puck in self.ctx.air_table.pucks:
                             puck.angularVelocity_rps = 0
                             if puck.b2d_body:
                                 puck.b2d_body.angularVelocity = 0.0
                         print("all rotational speeds set to zero")
                     else:
                         # Stop translational movement.
-                        for puck in g.air_table.pucks:
+                        for puck in self.ctx.air_table.pucks:
                             puck.vel_2d_mps = Vec2D(0,0)
                             if puck.b2d_body:
                                 puck.b2d_body.linearVelocity = b2Vec2(0,0)
@@ -639,62 +648,126 @@ class Environment:
                 
                 elif (event.key==K_r):
                     print("")
-                    if (local_user.key_shift == 'D') and (g.air_table.engine == 'circular-perfectKiss'):
+                    if (local_user.key_shift == 'D') and (self.ctx.air_table.engine == 'circular-perfectKiss'):
                         if demo_index in [1,2,3,4]:
-                            g.air_table.timeDirection *= -1
-                            g.air_table.count_direction = g.air_table.timeDirection
+                            self.ctx.air_table.timeDirection *= -1
+                            self.ctx.air_table.count_direction = self.ctx.air_table.timeDirection
                             print("Time direction has been reversed.")
                         else:
                             print("Time reversals not supported in this demo.")
+                    elif (local_user.key_shift == 'D') and (self.ctx.air_table.engine == 'circular-fixedPoint'):
+                        # Exact reversal: each puck's position now and one tick ago are swapped.
+                        self.ctx.air_table.reverse_time()
+                        print("Time direction has been reversed.")
                     else:
                         # Reverse the velocity of all the pucks...
-                        for puck in g.air_table.pucks:
+                        for puck in self.ctx.air_table.pucks:
                             puck.set_pos_and_vel(puck.pos_2d_m, puck.vel_2d_mps * (-1))
                         print("puck velocities have been reversed")
-                        if (g.air_table.engine == 'circular-perfectKiss'): 
-                            g.air_table.count_direction *= -1
+                        if (self.ctx.air_table.engine in ['circular-perfectKiss', 'circular-fixedPoint']): 
+                            self.ctx.air_table.count_direction *= -1
 
-                    if (g.air_table.engine == 'circular-perfectKiss'):
-                        print("timeDirection =", g.air_table.timeDirection, "count direction =", g.air_table.count_direction)
+                    if (self.ctx.air_table.engine in ['circular-perfectKiss', 'circular-fixedPoint']):
+                        print("timeDirection =", self.ctx.air_table.timeDirection, "count direction =", self.ctx.air_table.count_direction)
 
                 elif (event.key==K_g):
-                    # Toggle the logical flag for g.
-                    g.air_table.g_ON = not g.air_table.g_ON
-                    print("g", g.air_table.g_ON)
+                    # Toggle the logical flag for gravity.
+                    self.ctx.air_table.g_ON = not self.ctx.air_table.g_ON
+                    print("g", self.ctx.air_table.g_ON)
                     self.adjust_restitution_for_gravity()
                 
                 elif(event.key==K_x):
                     if local_user.key_shift == 'D':
                         print("Deleting all client pucks.")
-                        for puck in g.air_table.pucks[:]:
+                        for puck in self.ctx.air_table.pucks[:]:
                             if (puck.client_name):
                                 puck.delete()
                     else:
                         print("Deleting the selected puck.")
-                        for puck in g.air_table.pucks[:]:
+                        for puck in self.ctx.air_table.pucks[:]:
                             if (puck.selected):
                                 puck.delete()
 
                 elif (event.key==K_z):
-                    if hasattr(g.air_table, 'perfect_kiss'):
+                    if hasattr(self.ctx.air_table, 'perfect_kiss'):
                         print("")
-                        g.air_table.perfect_kiss = not g.air_table.perfect_kiss
-                        if (g.air_table.perfect_kiss):
+                        self.ctx.air_table.perfect_kiss = not self.ctx.air_table.perfect_kiss
+                        if (self.ctx.air_table.perfect_kiss):
                             self.set_allPucks_elastic()
-                        print("perfect kiss =", g.air_table.perfect_kiss)
+                        print("perfect kiss =", self.ctx.air_table.perfect_kiss)
                     else:
                         print("Perfect Kiss not available in this script.")
 
+                elif (event.key==K_b):
+                    # Select the broad-phase collision culling (circular engines only).
+                    if (self.ctx.air_table.engine != 'box2d'):
+                        if local_user.key_shift == 'D':
+                            # Cycle the puck-puck collision resolvers (e.g. vec2d, numpy-batch).
+                            resolvers = self.ctx.air_table.collision_resolvers
+                            next_index = (resolvers.index(self.ctx.air_table.collision_resolver) + 1) % len(resolvers)
+                            self.ctx.air_table.set_collision_resolver(resolvers[next_index])
+                            self.fr_avg.reset()
+                            print("collision resolver =", self.ctx.air_table.collision_resolver)
+                        else:
+                            # Cycle: all-pairs, spatial-hash, sweep-and-prune.
+                            phases = self.ctx.air_table.broad_phases
+                            next_index = (phases.index(self.ctx.air_table.broad_phase) + 1) % len(phases)
+                            self.ctx.air_table.set_broad_phase(phases[next_index])
+                            self.fr_avg.reset()
+                            print("broad phase =", self.ctx.air_table.broad_phase)
+                    else:
+                        print("Broad-phase selection not available in the Box2D engine.")
+
+                elif (event.key==K_v):
+                    # Select the integrator and the number of substeps (circular engines only).
+                    if (self.ctx.air_table.engine in ['circular', 'circular-perfectKiss']):
+                        if local_user.key_shift == 'D':
+                            # Cycle: 1, 2, 4, 8 substeps per step.
+                            self.ctx.air_table.substeps = (self.ctx.air_table.substeps * 2) if (self.ctx.air_table.substeps < 8) else 1
+                            print("substeps =", self.ctx.air_table.substeps)
+                        else:
+                            integrators = self.ctx.air_table.integrators
+                            next_index = (integrators.index(self.ctx.air_table.integrator) + 1) % len(integrators)
+                            self.ctx.air_table.integrator = integrators[next_index]
+                            print("integrator =", self.ctx.air_table.integrator)
+                        print(f"system energy = {self.ctx.air_table.system_energy_J():.4f} J")
+                    else:
+                        print("Integrator selection not available in this engine.")
+
+                elif (event.key==K_c):
+                    # Toggle the swept-circle (continuous) collision checks for fast pucks and bullets.
+                    if (self.ctx.air_table.engine in ['circular', 'circular-perfectKiss']):
+                        self.ctx.air_table.continuous_collisions = not self.ctx.air_table.continuous_collisions
+                        print("continuous collisions =", self.ctx.air_table.continuous_collisions)
+                    else:
+                        print("Continuous collisions not available in this engine.")
+
+                elif (event.key==K_m):
+                    # Toggle the sleeping of resting islands of pucks.
+                    if (self.ctx.air_table.engine in ['circular', 'circular-perfectKiss']):
+                        self.ctx.air_table.sleeping_enabled = not self.ctx.air_table.sleeping_enabled
+                        if not self.ctx.air_table.sleeping_enabled:
+                            self.ctx.air_table.wake_all_pucks()
+                        print("sleeping =", self.ctx.air_table.sleeping_enabled)
+                    else:
+                        print("Sleeping not available in this engine.")
+
                 elif (event.key==K_F1):
-                    # Toggle FPS display on/off
-                    g.air_table.FPS_display = not g.air_table.FPS_display
+                    if local_user.key_shift == 'D':
+                        # Toggle the energy and momentum diagnostics (and their graph).
+                        self.ctx.air_table.diagnostics_enabled = not self.ctx.air_table.diagnostics_enabled
+                        self.ctx.air_table.reset_diagnostics()
+                        print("diagnostics =", self.ctx.air_table.diagnostics_enabled)
+                    else:
+                        # Toggle FPS display on/off
+                        self.ctx.air_table.FPS_display = not self.ctx.air_table.FPS_display
                 
                 # Jet keys
                 elif (event.key==K_a):
                     local_user.key_a = 'D'
                     
                     if local_user.key_shift == 'D':
-                        for puck in g.air_table.pucks[:]:
+                        for puck in self.ctx.air_table.pucks[:]:
                             if (puck.selected):
                                 print(f"coef rest = {puck.coef_rest}")
                     
@@ -702,7 +775,7 @@ class Environment:
                     local_user.key_s = 'D'
                 elif (event.key==K_d):
                     if local_user.key_shift == 'D' and local_user.key_ctrl == 'D':
-                        g.game_loop.server.disconnect_all_network_clients()
+                        self.ctx.game_loop.server.disconnect_all_network_clients()
                     else:
                         local_user.key_d = 'D'
                 elif (event.key==K_w):
@@ -734,21 +807,34 @@ class Environment:
                     
                 # Pause the game loop
                 elif ((event.key==K_p) and not (local_user.key_shift == 'D')):
-                    g.air_table.stop_physics = not g.air_table.stop_physics
-                    if (not g.air_table.stop_physics):
-                        g.air_table.game_time_s = 0
+                    self.ctx.air_table.stop_physics = not self.ctx.air_table.stop_physics
+                    if (not self.ctx.air_table.stop_physics):
+                        self.ctx.air_table.game_time_s = 0
                         pygame.mouse.set_visible(False)
                         print("game loop is active again")
                     else:
                         pygame.mouse.set_visible(True)
                         print("game loop is paused")
                 
-                # Set equal-interval physics (more stability for Jello Madness)
-                elif ((event.key==K_p) and (local_user.key_shift == 'D') and (not g.air_table.stop_physics)):
-                    self.timestep_fixed = not self.timestep_fixed
+                # Cycle the time-step mode: floating, fixed (equal intervals), and adaptive (circular and Box2D engines).
+                elif ((event.key==K_p) and (local_user.key_shift == 'D') and (not self.ctx.air_table.stop_physics)):
+                    adaptive_available = self.ctx.air_table.engine in ['circular', 'circular-perfectKiss', 'box2d']
                     if self.timestep_fixed:
+                        self.timestep_fixed = False
+                        self.timestep_adaptive = adaptive_available
+                    elif self.timestep_adaptive:
+                        self.timestep_adaptive = False
+                    else:
+                        self.timestep_fixed = True
                         self.constant_dt_s = 1.0/self.fr_avg.result
+
+                    if self.timestep_fixed:
                         print(f"physics engine is stepping in equal (fixed) intervals of 1/{int(self.fr_avg.result)}")
+                    elif self.timestep_adaptive and (self.ctx.air_table.engine == 'box2d'):
+                        self.ctx.air_table.step_controller.reset()
+                        print(f"Box2D steps are ADAPTIVE (fixed substeps of 1/{self.ctx.air_table.step_controller.step_hz}, solver iterations from the time budget)")
+                    elif self.timestep_adaptive:
+                        print("physics engine steps are ADAPTIVE (substeps from the puck speeds and spring stiffness)")
                     else:
                         print("physics engine steps are FLOATING with the game loop")
                     self.fr_avg.reset()
@@ -765,7 +851,7 @@ class Environment:
                 
                 # Handle demo variations
                 elif (event.key in [K_RIGHT, K_LEFT]):
-                    if g.air_table.engine != 'box2d' and demo_index in [2,3,4]:
+                    if self.ctx.air_table.engine != 'box2d' and demo_index in [2,3,4]:
                         print("Variations only available in box2d engine mode")
                         return demo_index
 
@@ -13,7 +13,7 @@ The GameLoop class encapsulates all the common functionality needed by the three
 scripts (A15a, A15c, A16c), including:
 
 Features:
-    - Flexible physics engine selection (box2d, circular, circular-perfectKiss)
+    - Flexible physics engine selection (box2d, circular, circular-perfectKiss, circular-eventDriven, circular-fixedPoint)
     - Frame rate control and timing management
     - Network server setup and client handling
     - Input processing from local and network users
@@ -25,25 +25,32 @@ Classes:
     GameLoop: Main class that manages the game loop and simulation state
 
 Usage:
-    game_loop = GameLoop(engine_type="box2d")  # or "circular" or "circular-perfectKiss"
+    game_loop = GameLoop(engine_type="box2d")  # or "circular", "circular-perfectKiss", "circular-eventDriven", or "circular-fixedPoint"
     game_loop.start(demo_index=7)  # Start with specified demo
 """
 
 import platform, subprocess
-import socket, math
+import socket, math, time
 import pygame
+from pygame.color import THECOLORS
 
 from A08_network import GameServer, RunningAvg
-from A15_air_table import Box2DAirTable, CircularAirTable, PerfectKissAirTable
+from A15_diagnostics import DiagnosticsGraph
+from A15_air_table import Box2DAirTable, CircularAirTable, PerfectKissAirTable, EventDrivenAirTable, FixedPointAirTable
 from A15_environment import Client, GameWindow, Environment, signInOut_function, custom_update
 # Global variables shared across scripts
-import A15_globals as g
+from A15_simulation_context import context_or_default
 
 class GameLoop:
     # window dimensions: (width_px, height_px)
-    def __init__(self, engine_type="box2d", window_width_px=800, make_some_pucks=None):
+    def __init__(self, engine_type="box2d", window_width_px=800, make_some_pucks=None, ctx=None):
         self.make_some_pucks = make_some_pucks
 
+        # The env, window, air table, and this loop are registered in the simulation context. By
+        # default that is the A15_globals module, which the demo scripts use directly.
+        self.ctx = context_or_default(ctx)
+        self.ctx.game_loop = self
+
         # Demos are best at an aspect ratio of 8/7.
         self.aspect_ratio_wh = 8/7 # width/height
         window_dimensions_px = (window_width_px, math.ceil(window_width_px / self.aspect_ratio_wh))
@@ -54,38 +61,44 @@ class GameLoop:
         # The 10 parameter is in meters and indicates the the width of the world and establishes the
         # relationship between screen pixels and world meters. Similar to the aspect ratio, currently, the
         # positioning of the objects in the demos is best if this stays at 10.
-        self.env = Environment(window_dimensions_px, 10.0, self.aspect_ratio_wh)
-        g.env = self.env
+        self.env = Environment(window_dimensions_px, 10.0, self.aspect_ratio_wh, ctx=self.ctx)
+        self.ctx.env = self.env
 
-        self.game_window = GameWindow('Air Table Server')
-        g.game_window = self.game_window
+        self.game_window = GameWindow('Air Table Server', ctx=self.ctx)
+        self.ctx.game_window = self.game_window
 
         # Define the Left, Right, Bottom, and Top boundaries of the game window.
         walls_dic = {"L_m":0.0, "R_m":self.game_window.UR_2d_m.x, "B_m":0.0, "T_m":self.game_window.UR_2d_m.y}
         
         # Create appropriate air table type based on engine choice.
         if engine_type == "box2d":
-            self.air_table = Box2DAirTable(walls_dic)
+            self.air_table = Box2DAirTable(walls_dic, ctx=self.ctx)
         elif engine_type == "circular":
-            self.air_table = CircularAirTable(walls_dic)
+            self.air_table = CircularAirTable(walls_dic, ctx=self.ctx)
         elif engine_type == "circular-perfectKiss":
-            self.air_table = PerfectKissAirTable(walls_dic)
+            self.air_table = PerfectKissAirTable(walls_dic, ctx=self.ctx)
+        elif engine_type == "circular-eventDriven":
+            self.air_table = EventDrivenAirTable(walls_dic, ctx=self.ctx)
+        elif engine_type == "circular-fixedPoint":
+            self.air_table = FixedPointAirTable(walls_dic, ctx=self.ctx)
         else:
             raise ValueError(f"Unknown engine type: {engine_type}")
-        g.air_table = self.air_table
+        self.ctx.air_table = self.air_table
 
         self.myclock = pygame.time.Clock()
 
         # Extend the clients dictionary to accommodate up to 10 network clients.
         for m in range(1,11):
             c_name = f'C{m}'
-            self.env.clients[ c_name] = Client( self.env.client_colors[ c_name])
+            self.env.clients[ c_name] = Client( self.env.client_colors[ c_name], ctx=self.ctx)
         
         # Font object for rendering text onto display surface.
         self.fnt_gameTimer = pygame.font.SysFont("Courier", 50)
         self.fnt_generalTimer = pygame.font.SysFont("Courier", 25)
+        self.fnt_stepReport = pygame.font.SysFont("Courier", 16)
 
         self.pk_collision_cnt = RunningAvg(1, pygame, colorScheme='light')
+        self.diagnostics_graph = DiagnosticsGraph(pygame)
 
         self.server = None
                     
@@ -95,7 +108,7 @@ class GameLoop:
 
         # Initialize demo
         self.make_some_pucks(demo_index)
-        g.game_window.update_caption()
+        self.game_window.update_caption()
         
         # Setup network server
         self._setup_network_server()
@@ -116,7 +129,7 @@ class GameLoop:
             host='0.0.0.0', 
             port=8888,
             # Pygame uses a tuple and the network module does not use Vec2D.
-            window_xy_px=g.env.screenSize_2d_px.tuple(), 
+            window_xy_px=self.env.screenSize_2d_px.tuple(), 
             update_function=custom_update,
             clientStates=self.env.clients,
             signInOut_function=signInOut_function
@@ -124,16 +137,30 @@ class GameLoop:
 
     def update_air_table(self, demo_index):
         # Limit the framerate, but let it float below this limit.
-        if (self.env.timestep_fixed):
+        if (self.air_table.engine == "circular-fixedPoint"):
+            # Always whole frames of fixed ticks (the same steps on every machine).
+            gameLoop_FR_limit = int(round(1.0/self.air_table.frame_s()))
+        elif (self.env.timestep_fixed):
             gameLoop_FR_limit = int(1.0/self.env.constant_dt_s)
+        elif (self.env.timestep_adaptive) and (self.air_table.engine == "box2d"):
+            # One fixed-size Box2D substep per frame, if the machine can keep up.
+            gameLoop_FR_limit = self.air_table.step_controller.step_hz
+        elif (self.env.timestep_adaptive):
+            # The physics step is divided into substeps as needed (see below).
+            gameLoop_FR_limit = int(1.0/self.air_table.adaptive_dt_max_s)
         else:
             gameLoop_FR_limit = 480 # default
         
         self.env.tickCount += 1 # tickCount is reset to zero when demos start in make_some_pucks
         dt_gameLoop_s = self.myclock.tick(gameLoop_FR_limit) * 1e-3
         
-        if (self.env.timestep_fixed):
+        if (self.air_table.engine == "circular-fixedPoint"):
+            self.air_table.dt_s = self.air_table.frame_s() * self.air_table.timeDirection
+        elif (self.env.timestep_fixed):
             self.air_table.dt_s = self.env.constant_dt_s
+        elif (self.env.timestep_adaptive) and (self.air_table.engine == "box2d"):
+            # Whole fixed-size substeps; the leftover time is carried to the next frame.
+            self.air_table.dt_s = self.air_table.step_controller.plan_frame(dt_gameLoop_s)
         else:
             if self.air_table.engine == "circular-perfectKiss":
                 self.air_table.dt_s = dt_gameLoop_s * self.air_table.timeDirection
@@ -154,7 +181,10 @@ class GameLoop:
                 
                 # Start, or restart a demo.
                 self.make_some_pucks(demo_index)
-                g.game_window.update_caption()
+                self.game_window.update_caption()
+                self.air_table.reset_diagnostics()
+                if (self.air_table.engine == "box2d"):
+                    self.air_table.step_controller.reset()
                         
             if (self.env.render_timer_s > self.env.dt_render_limit_s):
                 # Get input from network clients.
@@ -181,45 +211,80 @@ class GameLoop:
                     # Turn shield on/off
                     controlled_puck.gun.control_shield()
             
-            # Calculate client related cursor-string forces.
-            for client_name in self.env.clients:
-                self.env.clients[client_name].calc_string_forces_on_pucks()
-
-            if (self.air_table.engine != "box2d"):    
-                # Drag on puck movement.
-                for eachpuck in self.air_table.target_pucks:
-                    eachpuck.calc_regularDragForce()
+            # In the adaptive Box2D mode, a frame that is shorter than the time left for a substep has
+            # no substeps (see Box2DStepController.plan_frame). Its time is carried to the next frame.
+            # So are the forces: they are not calculated (or applied) until a frame that steps, and any
+            # impulses wait in the pucks' accumulators.
+            idle_frame = ((self.air_table.engine == "box2d") and self.env.timestep_adaptive and 
+                          (self.air_table.step_controller.substeps == 0))
             
-            # Calculate spring forces on pucks.
-            for eachspring in self.air_table.springs:
-                eachspring.calc_spring_forces_on_pucks()
+            if not idle_frame:
+                # Calculate client related cursor-string forces.
+                for client_name in self.env.clients:
+                    self.env.clients[client_name].calc_string_forces_on_pucks()
+
+                if (self.air_table.engine != "box2d"):    
+                    # Drag on puck movement (all the target pucks in one vectorized pass).
+                    self.air_table.calc_regularDragForce_allPucks()
                 
-            if (self.air_table.engine == "box2d"):
-                # Apply forces to the pucks.
-                for eachpuck in self.air_table.pucks:
-                    self.air_table.update_TotalForceVectorOnPuck(eachpuck)
+                # Calculate spring forces on pucks (all springs in one vectorized pass).
+                self.air_table.calc_spring_forces_allSprings()
                 
-                # Advance Box2d by a single time step (dt). This calculate movements and
-                # manages collisions.
-                self.air_table.b2d_world.Step( self.air_table.dt_s, 10, 10)
-                # Note that self.air_table.b2d_world.ClearForces() has no effect here.
+            if idle_frame:
+                physics_step_s = 0.0
+            elif (self.air_table.engine == "box2d"):
+                # Apply forces to the pucks (skipping the pucks with no force to apply, and leaving resting pucks asleep).
+                self.air_table.update_TotalForceVector_allPucks()
                 
-                # Get new positions, translational velocities, and rotational speeds, from box2d
-                for eachpuck in self.air_table.pucks:
-                    eachpuck.get_Box2d_XandV()
+                # The time taken by the physics step sets the pace of the diagnostics samples.
+                physics_start_s = time.perf_counter()
+                if (self.env.timestep_adaptive):
+                    # Fixed-size substeps, with the solver iterations picked from the time budget and contacts.
+                    self.air_table.step_controller.step( self.air_table.b2d_world)
+                else:
+                    # Advance Box2d by a single time step (dt). This calculate movements and
+                    # manages collisions.
+                    self.air_table.b2d_world.Step( self.air_table.dt_s, 10, 10)
+                    # Note that self.air_table.b2d_world.ClearForces() has no effect here.
+                physics_step_s = time.perf_counter() - physics_start_s
+                # Handle the contact events (bullet hits) recorded during the step.
+                self.air_table.process_contact_events()
+                
+                # Get new positions, translational velocities, and rotational speeds, from box2d (awake bodies only).
+                self.air_table.get_Box2d_XandV_allPucks()
                 
                 # Check for puck-puck contact (Jello tangle).
                 if self.air_table.jello_tangle_checking_enabled:
                     self.air_table.check_for_jello_tangle()
+            elif (self.air_table.engine == "circular-eventDriven"):
+                # Apply forces to the puck velocities, then move the pucks from one predicted
+                # collision to the next until the end of the time step.
+                physics_start_s = time.perf_counter()
+                self.air_table.update_TotalForce_Speed_allPucks()
+                self.air_table.advance_to_end_of_step()
+                physics_step_s = time.perf_counter() - physics_start_s
+            elif (self.air_table.engine == "circular-fixedPoint"):
+                # Integer ticks of position Verlet, with integer spring and contact forces.
+                physics_start_s = time.perf_counter()
+                self.air_table.step_fixed_point()
+                physics_step_s = time.perf_counter() - physics_start_s
             else:
-                # Apply forces to the pucks and calculate movements.
-                for eachpuck in self.air_table.pucks:
-                    self.air_table.update_TotalForce_Speed_Position(eachpuck)
-                
-                # Check for puck-wall and puck-puck collisions and make penetration corrections.
-                self.air_table.check_for_collisions()
+                # Apply forces to the pucks and calculate movements (all pucks in one vectorized pass),
+                # then check for puck-wall and puck-puck collisions and make penetration corrections.
+                # This is repeated for each substep.
+                physics_start_s = time.perf_counter()
+                if (self.env.timestep_adaptive):
+                    # Pick the number of substeps from the error estimate and the time budget.
+                    self.air_table.step_physics(self.air_table.adaptive_substeps())
+                else:
+                    self.air_table.step_physics()
+                physics_step_s = time.perf_counter() - physics_start_s
 
-            if self.air_table.FPS_display and (self.env.tickCount > 10):
+            if (self.air_table.engine != "box2d"):
+                # Put resting islands of pucks to sleep, and wake them when disturbed.
+                self.air_table.update_sleep_states()
+
+            if self.air_table.FPS_display and (self.env.tickCount > 10) and (not idle_frame):
                 self.env.fr_avg.update(1.0/abs(self.air_table.dt_s))
             
             if (self.env.render_timer_s > self.env.dt_render_limit_s):
@@ -239,6 +304,15 @@ class GameLoop:
                 # Display the physics cycle rate.
                 if self.air_table.FPS_display:
                     self.env.fr_avg.draw( self.game_window.surface, 10, 10, caution=self.env.timestep_fixed)
+                
+                # Substeps and solver iterations picked by the Box2D step controller.
+                if (self.air_table.engine == "box2d") and self.env.timestep_adaptive and self.air_table.step_controller.last_frame:
+                    txt_surface = self.fnt_stepReport.render(self.air_table.step_controller.report(), True, THECOLORS["white"])
+                    self.game_window.surface.blit(txt_surface, [10, 45])
+
+                # Graph of the recent energy samples.
+                if self.air_table.diagnostics_enabled:
+                    self.diagnostics_graph.draw( self.game_window.surface, self.air_table.diagnostics, 10, 70)
                     
                 # Display timers.
                 if (demo_index == 8):
@@ -299,6 +373,10 @@ class GameLoop:
             # (determine the age of old bullets to be deleted)
             self.air_table.time_s += self.air_table.dt_s
             
+            # Energy and momentum samples (at the end of the step).
+            if self.air_table.diagnostics_enabled:
+                self.air_table.record_diagnostics(physics_step_s)
+            
             # Jello madness game timer
             if self.air_table.jello_tangle_checking_enabled:
                 if (self.air_table.engine == "box2d"): self.air_table.tangle_checker_time_s += self.air_table.dt_s
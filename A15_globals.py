@@ -18,6 +18,10 @@ to use them, thanks to the initialization sequence in GameLoop:
 This pattern helps avoid circular imports while maintaining a clean way to share
 these essential objects across the application. The globals are effectively read-only
 after their initial setup by GameLoop.
+
+This module is also the default simulation context (see A15_simulation_context). The objects,
+clients, and air tables keep a reference to their context (self.ctx) and use this module when
+no other context is passed in.
 """
 
 # Global variables shared across scripts
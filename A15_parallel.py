@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# Filename: A15_parallel.py
+
+"""
+Parallel puck-puck collisions for large circular scenes.
+
+With thousands of pucks, the puck-puck collisions are most of the work in a time step. Here the
+table is split into vertical strips, and the collisions in the strips are resolved by a pool of
+worker processes. The puck store is moved into shared memory (see PuckStore.share_memory), so the
+workers read and write the same arrays that the Puck objects use; nothing is copied back.
+
+Each strip owns the pucks whose centers are in it. A pair of touching pucks is handled by the strip
+that owns the puck on the left. The other puck may be just over the boundary, in the ghost zone at
+the left edge of the next strip. The strips are at least as wide as the largest possible contact, so
+a strip only ever touches its own pucks and those of its right-hand neighbor. The even strips are
+processed first, all at once, then the odd strips. Strips in the same phase never share a puck.
+The wait for all the workers at the end of each phase is the barrier.
+
+Classes:
+    StripCollider: The worker pool, the strip layout, and the two phases of each step
+
+Functions:
+    collision_rounds: Group the colliding pairs into rounds where no puck appears twice
+    resolve_collision_round_arrays: Resolve one round of collisions (vectorized, on the store arrays)
+    resolve_strip_collisions: The worker task: find and resolve the collisions of one strip
+
+The worker processes are spawned, not forked, so each one imports the main script again (with
+pygame, Box2D, and the rest of the game) before it can take a task. That can take the better part
+of a second, so the pool is started when the parallel-strips resolver is selected (see
+CircularAirTable.set_collision_resolver), not in the middle of a time step.
+"""
+
+import atexit
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def collision_rounds(i_index, j_index, colliding_k):
+    # A puck can only be in one collision per round, so each round can be written back in bulk. A
+    # collision goes in the round after the latest round of either of its pucks. This keeps each
+    # puck's collisions in the same order as the pair-at-a-time loop.
+    last_round = {}
+    rounds = []
+    for k in colliding_k:
+        i = i_index[k]
+        j = j_index[k]
+        round_n = max(last_round.get(i, -1), last_round.get(j, -1)) + 1
+        last_round[i] = round_n
+        last_round[j] = round_n
+        if round_n == len(rounds):
+            rounds.append([])
+        rounds[round_n].append(k)
+    return rounds
+
+
+def resolve_collision_round_arrays(pos, vel, radius_m, mass_kg, coef_rest, a_rows, b_rows, correct_for_puck_penetration):
+    # Resolve a set of collisions where no puck appears more than once. The arrays are those of the
+    # puck store; a_rows and b_rows are the store rows of the two pucks in each collision.
+
+    # Earlier rounds may have moved these pucks. Recheck the overlap as the
+    # pair-at-a-time loop would.
+    puck_to_puck_2d_m = pos[b_rows] - pos[a_rows]
+    p_to_p_m2 = np.einsum('ij,ij->i', puck_to_puck_2d_m, puck_to_puck_2d_m)
+    r_plus_r_m = radius_m[a_rows] + radius_m[b_rows]
+    still_colliding = p_to_p_m2 < r_plus_r_m**2
+    if not np.all(still_colliding):
+        a_rows = a_rows[still_colliding]
+        b_rows = b_rows[still_colliding]
+        puck_to_puck_2d_m = puck_to_puck_2d_m[still_colliding]
+        p_to_p_m2 = p_to_p_m2[still_colliding]
+        r_plus_r_m = r_plus_r_m[still_colliding]
+        if len(a_rows) == 0: return
+
+    # Tangent is the p_to_p vector rotated 90 degrees.
+    tangent_p_to_p_2d_m = np.column_stack((-puck_to_puck_2d_m[:,1], puck_to_puck_2d_m[:,0]))
+
+    def projection_onto(v_2d, onto_2d, onto_m2):
+        return onto_2d * (np.einsum('ij,ij->i', v_2d, onto_2d) / onto_m2)[:, np.newaxis]
+
+    A_vel_2d_mps = vel[a_rows]
+    B_vel_2d_mps = vel[b_rows]
+    A_mass_kg = mass_kg[a_rows][:, np.newaxis]
+    B_mass_kg = mass_kg[b_rows][:, np.newaxis]
+
+    # Velocity components along and perpendicular to the normal.
+    A_normal_2d_mps = projection_onto(A_vel_2d_mps, puck_to_puck_2d_m, p_to_p_m2)
+    A_tangent_2d_mps = projection_onto(A_vel_2d_mps, tangent_p_to_p_2d_m, p_to_p_m2)
+    B_normal_2d_mps = projection_onto(B_vel_2d_mps, puck_to_puck_2d_m, p_to_p_m2)
+    B_tangent_2d_mps = projection_onto(B_vel_2d_mps, tangent_p_to_p_2d_m, p_to_p_m2)
+
+    relative_normal_vel_2d_mps = B_normal_2d_mps - A_normal_2d_mps
+
+    def AandB_normal_AFTER_2d_mps(CR_puck):
+        A = ((relative_normal_vel_2d_mps * (CR_puck * B_mass_kg)) +
+             (A_normal_2d_mps * A_mass_kg + B_normal_2d_mps * B_mass_kg)) / (A_mass_kg + B_mass_kg)
+        B = (((relative_normal_vel_2d_mps * -1) * (CR_puck * A_mass_kg)) +
+             (B_normal_2d_mps * B_mass_kg + A_normal_2d_mps * A_mass_kg)) / (A_mass_kg + B_mass_kg)
+        return A, B
+
+    if correct_for_puck_penetration:
+        # Back out the penetration as in check_for_puck_collisions: reverse along the
+        # normal by the penetration time, then travel forward with the AFTER velocities (CR=1).
+        relative_normal_spd_mps = np.sqrt(np.einsum('ij,ij->i', relative_normal_vel_2d_mps, relative_normal_vel_2d_mps))
+        penetration_m = r_plus_r_m - np.sqrt(p_to_p_m2)
+        # Avoid zero in the denominator (no relative motion, no back-out).
+        penetration_time_s = np.divide(penetration_m, relative_normal_spd_mps,
+                                       out=np.zeros_like(penetration_m), where=(relative_normal_spd_mps > 0))
+        penetration_time_s = penetration_time_s[:, np.newaxis]
+
+        A_normal_AFTER_mps, B_normal_AFTER_mps = AandB_normal_AFTER_2d_mps(1.0)
+        pos[a_rows] = pos[a_rows] - (A_normal_2d_mps * penetration_time_s) + (A_normal_AFTER_mps * penetration_time_s)
+        pos[b_rows] = pos[b_rows] - (B_normal_2d_mps * penetration_time_s) + (B_normal_AFTER_mps * penetration_time_s)
+
+    # Final velocities using the actual CR.
+    CR_puck = np.minimum(coef_rest[a_rows], coef_rest[b_rows])[:, np.newaxis]
+    A_normal_AFTER_mps, B_normal_AFTER_mps = AandB_normal_AFTER_2d_mps(CR_puck)
+    vel[a_rows] = A_normal_AFTER_mps + A_tangent_2d_mps
+    vel[b_rows] = B_normal_AFTER_mps + B_tangent_2d_mps
+
+
+# Shared-memory blocks attached by this (worker) process, keyed by array name: (block, array).
+attached = {}
+
+def attach_arrays(specs):
+    # The store arrays, from their shared-memory specs: {array name: (block name, shape, dtype)}.
+    # The blocks change when the store grows, so a stale attachment is replaced.
+    arrays = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        if (name not in attached) or (attached[name][0].name != block_name):
+            if name in attached:
+                old_block, old_array = attached.pop(name)
+                del old_array
+                old_block.close()
+            block = shared_memory.SharedMemory(name=block_name)
+            attached[name] = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+        arrays[name] = attached[name][1]
+    return arrays
+
+
+def resolve_strip_collisions(task):
+    # Find and resolve the puck-puck collisions of one strip. The rows are the store rows of the
+    # strip's own pucks (the first n_owned, in the order of the pucks list) followed by the ghosts.
+    # Returns the tangled flag and the (row, row) pairs that collided.
+    specs, rows, n_owned, reach_m, correct_for_puck_penetration = task
+    arrays = attach_arrays(specs)
+    pos, vel = arrays['pos_2d_m'], arrays['vel_2d_mps']
+    radius_m, mass_kg, coef_rest = arrays['radius_m'], arrays['mass_kg'], arrays['coef_rest']
+    groupIndex, categoryBits, maskBits = arrays['groupIndex'], arrays['categoryBits'], arrays['maskBits']
+    sleeping = arrays['sleeping']
+
+    m = len(rows)
+    if m < 2: return False, []
+
+    # Sweep along y (vectorized): each puck is paired with the pucks above it, within reach.
+    y_m = pos[rows, 1]
+    order = np.argsort(y_m, kind='stable')
+    end = np.searchsorted(y_m[order], y_m[order] + reach_m, side='right')
+    counts = end - np.arange(m) - 1
+    first = np.repeat(np.arange(m), counts)
+    second = first + 1 + (np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts))
+    i_index = np.minimum(order[first], order[second])
+    j_index = np.maximum(order[first], order[second])
+
+    # Pairs with at least one of the strip's own pucks (ghost pairs belong to the next strip).
+    keep = i_index < n_owned
+    i_index, j_index = i_index[keep], j_index[keep]
+    a_rows, b_rows = rows[i_index], rows[j_index]
+    keep = (((categoryBits[a_rows] & maskBits[b_rows]) != 0) & ((categoryBits[b_rows] & maskBits[a_rows]) != 0) &
+            ~((sleeping[a_rows] != 0) & (sleeping[b_rows] != 0)))
+
+    # In the order of the strip's pucks (the same order as the all-pairs loop, within the strip).
+    sort_k = np.lexsort((j_index[keep], i_index[keep]))
+    a_rows, b_rows = a_rows[keep][sort_k], b_rows[keep][sort_k]
+
+    puck_to_puck_2d_m = pos[b_rows] - pos[a_rows]
+    p_to_p_m2 = np.einsum('ij,ij->i', puck_to_puck_2d_m, puck_to_puck_2d_m)
+    r_plus_r_m2 = (radius_m[a_rows] + radius_m[b_rows])**2
+    tangled = bool(np.any(p_to_p_m2 < (1.1 * r_plus_r_m2)))
+
+    # Ignore collisions within same negative group.
+    colliding = (p_to_p_m2 < r_plus_r_m2) & ~((groupIndex[a_rows] == groupIndex[b_rows]) & (groupIndex[a_rows] < 0))
+    colliding_k = np.flatnonzero(colliding)
+    for round_k in collision_rounds(a_rows, b_rows, colliding_k):
+        resolve_collision_round_arrays(pos, vel, radius_m, mass_kg, coef_rest, a_rows[round_k], b_rows[round_k],
+                                       correct_for_puck_penetration)
+    return tangled, list(zip(a_rows[colliding_k].tolist(), b_rows[colliding_k].tolist()))
+
+
+class StripCollider:
+    def __init__(self, n_workers=None):
+        self.n_workers = n_workers or multiprocessing.cpu_count()
+        self.pool = None
+        # Number of strips used in the last step (zero if the table was too narrow to split).
+        self.n_strips = 0
+
+    def start(self):
+        if self.pool is None:
+            # Spawned (not forked) workers: a fork can copy a lock held by another thread of the game
+            # (e.g. the delayed-throw thread) and hang the worker. This is also what Windows uses.
+            self.pool = multiprocessing.get_context("spawn").Pool(self.n_workers)
+            atexit.register(self.close)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def resolve(self, air_table, reach_factor):
+        # Resolve the puck-puck collisions of the air table in two phases of strips. Returns the tangled
+        # flag and the colliding pairs of store rows, or None if the pool hasn't been started or the
+        # table can't be split into strips.
+        if self.pool is None: return None
+        store = air_table.puck_store
+        rows = store.rows_of(air_table.pucks)
+        x_m = store.vectors['pos_2d_m'][rows, 0]
+        reach_m = 2.0 * float(np.max(store.scalars['radius_m'][rows])) * reach_factor
+
+        # Two strips per worker (one in each phase), each wider than the largest contact.
+        L_m, R_m = air_table.walls_dic["L_m"], air_table.walls_dic["R_m"]
+        self.n_strips = min(2 * self.n_workers, int((R_m - L_m) / reach_m))
+        if self.n_strips < 2: return None
+        strip_m = (R_m - L_m) / self.n_strips
+        strip_of = np.clip(np.floor((x_m - L_m) / strip_m).astype(np.intp), 0, self.n_strips - 1)
+
+        store.share_memory()
+        specs = store.shared_memory_specs()
+
+        tangled = False
+        pairs = []
+        for phase in (0, 1):
+            tasks = []
+            for k in range(phase, self.n_strips, 2):
+                owned = rows[strip_of == k]
+                ghosts = rows[(strip_of == k + 1) & (x_m < L_m + (k + 1) * strip_m + reach_m)]
+                tasks.append((specs, np.concatenate((owned, ghosts)), len(owned), reach_m, air_table.correct_for_puck_penetration))
+            # The barrier: all the strips of this phase are done before the next phase starts.
+            for strip_tangled, strip_pairs in self.pool.map(resolve_strip_collisions, tasks):
+                tangled = tangled or strip_tangled
+                pairs.extend(strip_pairs)
+        return tangled, pairs
@@ -116,14 +116,21 @@ def pool_trick_shot():
 def burst_of_pucks(n_pucks, speed_mps=1, radius_m=0.05):
     Puck, g = get_Puck_and_g()
 
-    g.air_table.inhibit_all_puck_collisions = True
-
     puck_parms = {
         'border_px': 0,
         'coef_rest': 1.0,
         'CR_fixed': True
     }
 
+    if hasattr(Puck, 'categoryBits'):
+        # Collision filtering (A15+): the burst pucks pass through each other, but still collide
+        # with any other pucks.
+        from A15_air_table_objects import CATEGORY_BURST, MASK_ALL
+        puck_parms['categoryBits'] = CATEGORY_BURST
+        puck_parms['maskBits'] = MASK_ALL & ~CATEGORY_BURST
+    else:
+        g.air_table.inhibit_all_puck_collisions = True
+
     if g.air_table.engine == 'box2d':
         puck_parms['friction'] = 0
         puck_parms['friction_fixed'] = True
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+# Filename: A15_puck_store.py
+
+"""
+Structure-of-arrays storage for puck state.
+
+The position, velocity, force accumulators, mass, radius, restitution, collision filter
+(group index, category and mask bits) and sleep state of every puck are kept in rows of
+contiguous NumPy arrays. This lets the air table update all the pucks in one vectorized pass
+instead of creating a dozen short-lived Vec2D objects per puck per step.
+
+Classes:
+    StoreVec2D: A Vec2D whose components are read from (and written to) a row of the store
+    PuckStore: The arrays, one row per puck (including the pin pucks at the ends of springs)
+    PuckLists: Per-step list copies of the state read by the per-puck and per-pair loops
+
+Functions:
+    vector_property: Makes a Puck vector attribute (e.g. pos_2d_m) that lives in the store
+    scalar_property: Makes a Puck scalar attribute (e.g. mass_kg) that lives in the store
+    int_property: Makes a Puck integer attribute (e.g. groupIndex) that lives in the store
+
+The arrays can be moved into shared memory (share_memory), so that worker processes can work on
+the same rows (see A15_parallel.py).
+
+A Puck is a thin view onto its row. Reading puck.pos_2d_m returns a StoreVec2D that reads
+and writes the row, so existing code like puck.pos_2d_m.y += 0.1 still works. Assigning
+a Vec2D (puck.pos_2d_m = Vec2D(1,2)) copies its components into the row.
+"""
+
+import atexit
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from A09_vec2d import Vec2D
+
+
+class StoreVec2D(Vec2D):
+    # Note that the Vec2D __init__ is not called. The x and y properties below replace the
+    # instance attributes. The puck (not its row number) is referenced because a puck's row
+    # can change when other pucks are removed from the store.
+    def __init__(self, puck, name):
+        self.puck = puck
+        self.name = name
+
+    @property
+    def x(self):
+        return float(self.puck.store.vectors[self.name][self.puck.store_row, 0])
+    @x.setter
+    def x(self, value):
+        self.puck.store.vectors[self.name][self.puck.store_row, 0] = value
+
+    @property
+    def y(self):
+        return float(self.puck.store.vectors[self.name][self.puck.store_row, 1])
+    @y.setter
+    def y(self, value):
+        self.puck.store.vectors[self.name][self.puck.store_row, 1] = value
+
+
+def vector_property(name):
+    def get_vector(puck):
+        return puck.store_views[name]
+
+    def set_vector(puck, vector_2d):
+        row = puck.store.vectors[name][puck.store_row]
+        row[0] = vector_2d.x
+        row[1] = vector_2d.y
+
+    return property(get_vector, set_vector)
+
+
+def scalar_property(name):
+    def get_scalar(puck):
+        return float(puck.store.scalars[name][puck.store_row])
+
+    def set_scalar(puck, value):
+        puck.store.scalars[name][puck.store_row] = value
+
+    return property(get_scalar, set_scalar)
+
+
+def int_property(name):
+    def get_int(puck):
+        return int(puck.store.ints[name][puck.store_row])
+
+    def set_int(puck, value):
+        puck.store.ints[name][puck.store_row] = value
+
+    return property(get_int, set_int)
+
+
+class PuckStore:
+    vector_names = ['pos_2d_m', 'vel_2d_mps',
+                    'SprDamp_force_2d_N', 'jet_force_2d_N',
+                    'cursorString_spring_force_2d_N', 'cursorString_puckDrag_force_2d_N',
+                    'puckDrag_force_2d_N', 'impulse_2d_Ns']
+    scalar_names = ['mass_kg', 'radius_m', 'coef_rest', 'rest_time_s', 'rotation_speed', 'inertia_kgm2']
+    int_names = ['groupIndex', 'categoryBits', 'maskBits', 'sleeping']
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        # Number of rows in use. Rows 0 to n-1 are packed (no gaps).
+        self.n = 0
+
+        self.vectors = {name: np.zeros((capacity, 2)) for name in self.vector_names}
+        self.scalars = {name: np.zeros(capacity) for name in self.scalar_names}
+        self.ints = {name: np.zeros(capacity, dtype=np.int64) for name in self.int_names}
+        # Dynamic rows are moved by the physics engine. Pin pucks are not.
+        self.dynamic = np.zeros(capacity, dtype=bool)
+
+        # The puck that owns each row.
+        self.owners = []
+
+        # Incremented whenever rows are added or removed (so any cached row numbers can be refreshed).
+        self.layout_version = 0
+
+        # Shared-memory blocks holding the arrays (after share_memory), keyed by the array name.
+        self.shared = False
+        self.shared_blocks = {}
+        self.retired_blocks = []
+
+    def grow(self):
+        # Double the capacity, copying the existing rows.
+        new_capacity = 2 * self.capacity
+        for name in self.vectors:
+            new_array = np.zeros((new_capacity, 2))
+            new_array[:self.n] = self.vectors[name][:self.n]
+            self.vectors[name] = new_array
+        for name in self.scalars:
+            new_array = np.zeros(new_capacity)
+            new_array[:self.n] = self.scalars[name][:self.n]
+            self.scalars[name] = new_array
+        for name in self.ints:
+            new_array = np.zeros(new_capacity, dtype=np.int64)
+            new_array[:self.n] = self.ints[name][:self.n]
+            self.ints[name] = new_array
+        new_dynamic = np.zeros(new_capacity, dtype=bool)
+        new_dynamic[:self.n] = self.dynamic[:self.n]
+        self.dynamic = new_dynamic
+        self.capacity = new_capacity
+        if self.shared:
+            self.move_to_shared_memory()
+
+    def add(self, puck, dynamic=True):
+        if self.n == self.capacity:
+            self.grow()
+        row = self.n
+        for name in self.vectors:
+            self.vectors[name][row] = 0.0
+        for name in self.scalars:
+            self.scalars[name][row] = 0.0
+        for name in self.ints:
+            self.ints[name][row] = 0
+        self.dynamic[row] = dynamic
+
+        self.owners.append(puck)
+        self.n += 1
+        self.layout_version += 1
+
+        puck.store = self
+        puck.store_row = row
+        puck.store_views = {name: StoreVec2D(puck, name) for name in self.vector_names}
+
+    def copy_row(self, from_row, to_row):
+        for name in self.vectors:
+            self.vectors[name][to_row] = self.vectors[name][from_row]
+        for name in self.scalars:
+            self.scalars[name][to_row] = self.scalars[name][from_row]
+        for name in self.ints:
+            self.ints[name][to_row] = self.ints[name][from_row]
+        self.dynamic[to_row] = self.dynamic[from_row]
+
+    def remove(self, puck):
+        row = puck.store_row
+        last_row = self.n - 1
+
+        # The removed puck keeps its final state in a small store of its own. So any lingering
+        # references to it (e.g. a drone's target) still read sensible values.
+        detached_store = PuckStore(capacity=1)
+        detached_store.add(puck, dynamic=False)
+        for name in self.vectors:
+            detached_store.vectors[name][0] = self.vectors[name][row]
+        for name in self.scalars:
+            detached_store.scalars[name][0] = self.scalars[name][row]
+        for name in self.ints:
+            detached_store.ints[name][0] = self.ints[name][row]
+
+        # Fill the gap with the last row.
+        if row != last_row:
+            self.copy_row(last_row, row)
+            moved_puck = self.owners[last_row]
+            self.owners[row] = moved_puck
+            moved_puck.store_row = row
+        self.owners.pop()
+        self.n -= 1
+        self.layout_version += 1
+
+    def rows_of(self, pucks):
+        # Store rows of a list of pucks (e.g. the air table's pucks list), as an index array.
+        return np.fromiter((puck.store_row for puck in pucks), dtype=np.intp, count=len(pucks))
+
+    def share_memory(self):
+        # Move the arrays into shared memory (once). The blocks are released when the program exits.
+        if self.shared: return
+        self.shared = True
+        self.move_to_shared_memory()
+        atexit.register(self.release_shared_memory)
+
+    def move_to_shared_memory(self):
+        # Copy each array into a new shared-memory block (also after the store grows). The old block is
+        # released once the array no longer refers to it.
+        def move(arrays, name):
+            array = arrays[name]
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            arrays[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            arrays[name][:] = array
+            del array
+            self.release_block(name)
+            self.shared_blocks[name] = block
+
+        for arrays in (self.vectors, self.scalars, self.ints):
+            for name in arrays:
+                move(arrays, name)
+        dynamic = {'dynamic': self.dynamic}
+        self.dynamic = None
+        move(dynamic, 'dynamic')
+        self.dynamic = dynamic['dynamic']
+
+    def release_block(self, name):
+        block = self.shared_blocks.pop(name, None)
+        if block is None: return
+        block.unlink()
+        try:
+            block.close()
+        except BufferError:
+            # Something still refers to the old array. Keep the block until the program exits.
+            self.retired_blocks.append(block)
+
+    def release_shared_memory(self):
+        for name in list(self.shared_blocks):
+            self.release_block(name)
+
+    def shared_memory_specs(self):
+        # What a worker needs to attach to the arrays: {array name: (block name, shape, dtype)}.
+        specs = {}
+        for arrays in (self.vectors, self.scalars, self.ints, {'dynamic': self.dynamic}):
+            for name, array in arrays.items():
+                specs[name] = (self.shared_blocks[name].name, array.shape, array.dtype.str)
+        return specs
+
+
+class PuckLists:
+    # Plain Python copies (lists, in the order of a pucks list) of the puck state that the per-puck
+    # and per-pair loops read. Reading a list entry is much faster than a store property. The lists
+    # are made once per step. A loop that calls code which changes a puck through its properties
+    # (e.g. a wall check) calls reread for that puck afterwards.
+    def __init__(self, store, pucks):
+        self.pos_2d_m = store.vectors['pos_2d_m']
+        self.vel_2d_mps = store.vectors['vel_2d_mps']
+        rows = store.rows_of(pucks)
+        pos_2d_m, vel_2d_mps = self.pos_2d_m[rows], self.vel_2d_mps[rows]
+
+        self.rows = rows.tolist()
+        self.x_m, self.y_m = pos_2d_m[:,0].tolist(), pos_2d_m[:,1].tolist()
+        self.vx_mps, self.vy_mps = vel_2d_mps[:,0].tolist(), vel_2d_mps[:,1].tolist()
+        self.radius_m = store.scalars['radius_m'][rows].tolist()
+        self.mass_kg = store.scalars['mass_kg'][rows].tolist()
+        self.coef_rest = store.scalars['coef_rest'][rows].tolist()
+        self.groupIndex = store.ints['groupIndex'][rows].tolist()
+        self.sleeping = (store.ints['sleeping'][rows] != 0).tolist()
+
+    def reread(self, k):
+        # Refresh the position and velocity of puck k from the store.
+        row = self.rows[k]
+        self.x_m[k], self.y_m[k] = self.pos_2d_m[row].tolist()
+        self.vx_mps[k], self.vy_mps[k] = self.vel_2d_mps[row].tolist()
+
+    def set_position(self, k, x_m, y_m):
+        # Write the position of puck k to the lists and to the store.
+        self.x_m[k], self.y_m[k] = x_m, y_m
+        self.pos_2d_m[self.rows[k]] = (x_m, y_m)
+
+    def set_velocity(self, k, vx_mps, vy_mps):
+        self.vx_mps[k], self.vy_mps[k] = vx_mps, vy_mps
+        self.vel_2d_mps[self.rows[k]] = (vx_mps, vy_mps)
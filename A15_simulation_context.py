@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+# Filename: A15_simulation_context.py
+
+"""
+Simulation context: the environment, window, air table, and game loop that the simulation
+objects work with.
+
+The objects (Puck, Spring, Wall, Jet, Gun, ...), the air tables, and the clients each keep a
+reference to their context (self.ctx) and reach the other parts of the simulation through it:
+self.ctx.air_table, self.ctx.env, self.ctx.game_window. Giving each air table its own context lets
+several tables run side by side in one process (for example, headless tables stepped in a batch
+or in tests).
+
+Classes:
+    SimulationContext: Holds the env, game_window, air_table, and game_loop of one simulation
+
+Functions:
+    context_or_default: Returns the context passed in, or the default (the A15_globals module)
+
+The A15_globals module has the same four attributes and is used as the context when none is
+passed in. So the existing scripts, which set up A15_globals through GameLoop, work as before.
+"""
+
+import A15_globals as g
+
+
+class SimulationContext:
+    def __init__(self, env=None, game_window=None, air_table=None, game_loop=None):
+        self.env = env
+        self.game_window = game_window
+        self.air_table = air_table
+        self.game_loop = game_loop
+
+
+def context_or_default(ctx):
+    return g if (ctx is None) else ctx
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+
+# Filename: A15_spring_network.py
+
+"""
+Implicit (backward-Euler) solver for the springs of the circular air tables.
+
+Spring.calc_spring_forces_on_pucks evaluates each spring explicitly, so a stiff network (like the
+800 N/m jello grids) is only stable with a small time step. Here the whole network is treated
+implicitly. The velocity change over the step, dv, is found from the linear system
+
+    (M - dt*D - dt**2*K) dv = dt*(f0 + dt*K*v0)
+
+where M is the mass matrix, f0 the net force at the start of the step, and K and D the stiffness
+and damping Jacobians (the derivatives of the spring forces with respect to the positions and
+velocities). This is the method of Baraff and Witkin (Large Steps in Cloth Simulation, 1998).
+
+Classes:
+    SpringForceTable: The springs as NumPy arrays (end rows, lengths, stiffness, damping, drag), for
+                      calculating all the spring forces in one vectorized pass
+    ImplicitSpringSolver: Builds the Jacobian blocks of the springs and solves for dv with a few
+                          conjugate-gradient iterations
+    XPBDSpringSolver: Treats the springs as compliant distance constraints (extended position-based
+                      dynamics) instead of forces
+
+Functions:
+    spring_arrays: Store rows and constants (stiffness, length, damping, drag) of a list of springs
+
+The matrices are never formed. Each spring contributes a 2x2 block, and the matrix-vector products
+are accumulated from the blocks (a sparse, matrix-free representation). To keep the system matrix
+positive definite, the stiffness of a compressed spring perpendicular to its length is set to zero.
+
+A spring with a non-zero length whose ends are at the same point has no direction. Such a spring
+(and any spring attached to a puck that is no longer on the table) is left out of the system: its
+force, already included in f0, is applied explicitly.
+"""
+
+import numpy as np
+
+
+def spring_arrays(springs, store):
+    # Store rows and constants of the springs that are connected to pucks in the store.
+    rows_1 = []
+    rows_2 = []
+    constants = []
+    for spring in springs:
+        if (spring.p1.store is store) and (spring.p2.store is store):
+            rows_1.append(spring.p1.store_row)
+            rows_2.append(spring.p2.store_row)
+            constants.append((spring.strength_Npm, spring.length_m, spring.damper_Ns2pm2, spring.c_drag))
+    constants = np.array(constants, dtype=float).reshape(-1, 4)
+    return (np.array(rows_1, dtype=np.intp), np.array(rows_2, dtype=np.intp),
+            constants[:, 0], constants[:, 1], constants[:, 2], constants[:, 3])
+
+
+class SpringForceTable:
+    """
+    Explicit spring and damper forces for all the springs at once. This does the same operations,
+    in the same order, as calling Spring.calc_spring_forces_on_pucks for each spring, without the
+    Vec2D objects. (The results can differ in the last bit: NumPy's square root is correctly
+    rounded, Python's x**0.5 is not always.)
+
+    The arrays are rebuilt when the springs, or the rows of the puck store, change. The force
+    contributions of each spring (spring-damper force on each end, then the drag on each end) are
+    listed in spring order and summed per puck with bincount. Pin pucks are rows like any other;
+    their forces are ignored because they are not dynamic.
+    """
+    def __init__(self):
+        self.key = None
+        self.other_springs = []
+
+    def update(self, springs, store):
+        key = (store.layout_version, tuple(map(id, springs)))
+        if key == self.key: return
+        self.key = key
+
+        (self.rows_1, self.rows_2, self.k_Npm, self.length_m,
+         self.c_damp, self.c_drag) = spring_arrays(springs, store)
+        # Springs attached to a puck that is not in the store are left to the Spring method.
+        self.other_springs = [spring for spring in springs
+                              if (spring.p1.store is not store) or (spring.p2.store is not store)]
+
+        # Four contributions per spring, in the order they are added in the Spring method.
+        self.scatter_rows = np.stack([self.rows_1, self.rows_2, self.rows_1, self.rows_2], axis=1).ravel()
+
+    def add_spring_forces(self, springs, store):
+        # Add the spring, damper and drag forces to the SprDamp_force_2d_N accumulators.
+        self.update(springs, store)
+        n = store.n
+        if len(self.rows_1) > 0:
+            pos_2d_m = store.vectors['pos_2d_m']
+            vel_2d_mps = store.vectors['vel_2d_mps']
+
+            separation_2d_m = pos_2d_m[self.rows_1] - pos_2d_m[self.rows_2]
+            separation_squared_m2 = separation_2d_m[:, 0]*separation_2d_m[:, 0] + separation_2d_m[:, 1]*separation_2d_m[:, 1]
+            separation_m = np.sqrt(separation_squared_m2)
+
+            # Spring force on puck 1. (Zero for a pinned spring at rest, where there is no direction.)
+            has_direction = separation_m != 0.0
+            safe_separation_m = np.where(has_direction, separation_m, 1.0)[:, np.newaxis]
+            spring_force_2d_N = ((separation_2d_m / safe_separation_m) *
+                                 (self.length_m - separation_m)[:, np.newaxis]) * self.k_Npm[:, np.newaxis]
+            spring_force_2d_N[~has_direction] = 0.0
+
+            # Damper force: the relative velocity projected onto the separation.
+            v_relative_2d_mps = vel_2d_mps[self.rows_1] - vel_2d_mps[self.rows_2]
+            v_dot_separation = v_relative_2d_mps[:, 0]*separation_2d_m[:, 0] + v_relative_2d_mps[:, 1]*separation_2d_m[:, 1]
+            projection_factor = v_dot_separation / np.where(has_direction, separation_squared_m2, 1.0)
+            damper_force_2d_N = (separation_2d_m * projection_factor[:, np.newaxis]) * self.c_damp[:, np.newaxis]
+            damper_force_2d_N[~has_direction] = 0.0
+
+            SprDamp_force_2d_N = spring_force_2d_N - damper_force_2d_N
+
+            contributions_2d_N = np.empty((len(self.rows_1), 4, 2))
+            contributions_2d_N[:, 0] = SprDamp_force_2d_N
+            contributions_2d_N[:, 1] = -SprDamp_force_2d_N
+            contributions_2d_N[:, 2] = -vel_2d_mps[self.rows_1] * self.c_drag[:, np.newaxis]
+            contributions_2d_N[:, 3] = -vel_2d_mps[self.rows_2] * self.c_drag[:, np.newaxis]
+
+            accumulator_2d_N = store.vectors['SprDamp_force_2d_N']
+            for axis in (0, 1):
+                accumulator_2d_N[:n, axis] += np.bincount(self.scatter_rows, contributions_2d_N[:, :, axis].ravel(), minlength=n)
+
+        for spring in self.other_springs:
+            spring.calc_spring_forces_on_pucks()
+
+
+class ImplicitSpringSolver:
+    def __init__(self, cg_iterations=10, cg_tolerance=1e-6):
+        self.cg_iterations = cg_iterations
+        # Relative to the size of the right-hand side.
+        self.cg_tolerance = cg_tolerance
+
+        # From the last solve.
+        self.iterations_used = 0
+        self.n_implicit_springs = 0
+        self.n_explicit_springs = 0
+
+    def jacobian_blocks(self, pos_2d_m, rows_1, rows_2, k_Npm, length_m, c_damp):
+        # 2x2 blocks of the stiffness and damping Jacobians, the derivatives of the force on the
+        # first puck with respect to its own position (or velocity). The other three blocks of each
+        # spring follow from the symmetry: d(f1)/d(x2) = d(f2)/d(x1) = -block, d(f2)/d(x2) = block.
+        separation_2d_m = pos_2d_m[rows_1] - pos_2d_m[rows_2]
+        separation_m = np.hypot(separation_2d_m[:, 0], separation_2d_m[:, 1])
+
+        has_direction = separation_m > 1e-9
+        # A zero-length spring (e.g. one pinned at its rest point) has the same stiffness in every
+        # direction, so it doesn't need one. Other springs without a direction stay explicit.
+        implicit = has_direction | (length_m == 0.0)
+
+        safe_separation_m = np.where(has_direction, separation_m, 1.0)
+        normal_2d = separation_2d_m / safe_separation_m[:, np.newaxis]
+        normal_2d[~has_direction] = 0.0
+        nn = normal_2d[:, :, np.newaxis] * normal_2d[:, np.newaxis, :]
+
+        # Perpendicular stiffness factor, 1 - L/l (zero when compressed).
+        ratio = np.where(has_direction, np.clip(1.0 - length_m / safe_separation_m, 0.0, None), 1.0)
+        identity = np.eye(2)
+        stiffness = -k_Npm[:, np.newaxis, np.newaxis] * (nn + ratio[:, np.newaxis, np.newaxis] * (identity - nn))
+        damping = -c_damp[:, np.newaxis, np.newaxis] * nn
+
+        return stiffness[implicit], damping[implicit], implicit
+
+    def apply_blocks(self, blocks, rows_1, rows_2, vectors_2d, n):
+        # Product of the assembled (sparse) matrix and a set of per-puck vectors.
+        difference_2d = vectors_2d[rows_1] - vectors_2d[rows_2]
+        product_2d = np.einsum('sij,sj->si', blocks, difference_2d)
+        result_2d = np.empty((n, 2))
+        for axis in (0, 1):
+            result_2d[:, axis] = (np.bincount(rows_1, product_2d[:, axis], minlength=n) -
+                                  np.bincount(rows_2, product_2d[:, axis], minlength=n))
+        return result_2d
+
+    def velocity_change(self, springs, store, n, acc_2d_mps2, vel_2d_mps, dt_s, free):
+        # Solve for the velocity change of each puck (rows 0 to n-1). acc_2d_mps2 is the acceleration
+        # from the net force at the start of the step (including the spring forces). Rows that are
+        # not free (pins and sleeping pucks) don't change.
+        mass_kg = store.scalars['mass_kg'][:n, np.newaxis]
+        rhs_2d = acc_2d_mps2 * mass_kg * dt_s
+
+        rows_1, rows_2, k_Npm, length_m, c_damp, c_drag = spring_arrays(springs, store)
+        self.n_implicit_springs = 0
+        self.n_explicit_springs = len(springs)
+        self.iterations_used = 0
+        if len(rows_1) == 0:
+            return rhs_2d / mass_kg * free[:, np.newaxis]
+
+        pos_2d_m = store.vectors['pos_2d_m'][:n]
+        stiffness, damping, implicit = self.jacobian_blocks(pos_2d_m, rows_1, rows_2, k_Npm, length_m, c_damp)
+        drag_rows_1 = rows_1
+        drag_rows_2 = rows_2
+        rows_1 = rows_1[implicit]
+        rows_2 = rows_2[implicit]
+        self.n_implicit_springs = len(rows_1)
+        self.n_explicit_springs = len(springs) - self.n_implicit_springs
+
+        # The drag of a spring acts on the velocity of each puck (not the relative velocity).
+        drag_Nspm = (np.bincount(drag_rows_1, c_drag, minlength=n) +
+                     np.bincount(drag_rows_2, c_drag, minlength=n))[:, np.newaxis]
+
+        # dt*(f0 + dt*K*v0)
+        rhs_2d += dt_s**2 * self.apply_blocks(stiffness, rows_1, rows_2, vel_2d_mps, n)
+        rhs_2d *= free[:, np.newaxis]
+
+        # The system matrix: A = M - dt*D - dt**2*K (plus the spring drag on the diagonal).
+        blocks = -(dt_s * damping + dt_s**2 * stiffness)
+        diagonal_2d = mass_kg + dt_s * drag_Nspm
+        def apply_A(vectors_2d):
+            result_2d = diagonal_2d * vectors_2d + self.apply_blocks(blocks, rows_1, rows_2, vectors_2d, n)
+            return result_2d * free[:, np.newaxis]
+
+        # Jacobi (diagonal) preconditioner.
+        block_diagonal_2d = np.zeros((n, 2))
+        for axis in (0, 1):
+            block_diagonal_2d[:, axis] = (np.bincount(rows_1, blocks[:, axis, axis], minlength=n) +
+                                          np.bincount(rows_2, blocks[:, axis, axis], minlength=n))
+        inverse_diagonal_2d = 1.0 / (diagonal_2d + block_diagonal_2d)
+
+        # Conjugate gradient, starting from the explicit velocity change.
+        dv_2d_mps = rhs_2d / mass_kg
+        residual_2d = rhs_2d - apply_A(dv_2d_mps)
+        z_2d = residual_2d * inverse_diagonal_2d
+        direction_2d = z_2d.copy()
+        rz = np.sum(residual_2d * z_2d)
+        tolerance = (self.cg_tolerance * np.linalg.norm(rhs_2d))**2
+        for iteration in range(self.cg_iterations):
+            if np.sum(residual_2d**2) <= tolerance:
+                break
+            A_direction_2d = apply_A(direction_2d)
+            alpha = rz / np.sum(direction_2d * A_direction_2d)
+            dv_2d_mps += alpha * direction_2d
+            residual_2d -= alpha * A_direction_2d
+            z_2d = residual_2d * inverse_diagonal_2d
+            rz_new = np.sum(residual_2d * z_2d)
+            direction_2d = z_2d + (rz_new / rz) * direction_2d
+            rz = rz_new
+            self.iterations_used = iteration + 1
+
+        return dv_2d_mps * free[:, np.newaxis]
+
+
+class XPBDSpringSolver:
+    """
+    Extended position-based dynamics (Macklin, Muller and Chentanev, XPBD: Position-Based Simulation
+    of Compliant Constrained Dynamics, 2016). Each spring is a distance constraint, C = l - L, with
+    a compliance of 1/strength_Npm. The damper (c_damp) becomes the constraint damping. The pucks
+    are first moved by the other forces, then the constraints are projected for a fixed number of
+    iterations, and the velocities are taken from the change in position.
+
+    The projections are Gauss-Seidel (each uses the positions from the last). To vectorize them,
+    the springs are split into batches (colors) in which no two springs share a puck. The springs
+    in one batch are projected together.
+    """
+    def __init__(self, iterations=10):
+        self.iterations = iterations
+
+        self.batches = []
+        self.coloring_rows = None
+        self.arrays = None
+
+    def color_batches(self, rows_1, rows_2):
+        # Greedy coloring. It is kept until the springs (or the rows of their pucks) change.
+        rows = (rows_1.tobytes(), rows_2.tobytes())
+        if rows == self.coloring_rows:
+            return
+        colors = np.zeros(len(rows_1), dtype=np.intp)
+        colors_at_row = {}
+        for s, (a, b) in enumerate(zip(rows_1.tolist(), rows_2.tolist())):
+            taken = colors_at_row.setdefault(a, set()) | colors_at_row.setdefault(b, set())
+            color = 0
+            while color in taken:
+                color += 1
+            colors[s] = color
+            colors_at_row[a].add(color)
+            colors_at_row[b].add(color)
+        n_colors = (colors.max() + 1) if len(colors) else 0
+        self.batches = [np.flatnonzero(colors == color) for color in range(n_colors)]
+        self.coloring_rows = rows
+
+    def prepare(self, springs, store, n):
+        # Collect the springs for this step and return the spring drag forces (rows 0 to n-1). The
+        # drag acts on the velocity of each puck, not on the constraint, so it stays a force.
+        self.arrays = spring_arrays(springs, store)
+        rows_1, rows_2, k_Npm, length_m, c_damp, c_drag = self.arrays
+        self.color_batches(rows_1, rows_2)
+
+        vel_2d_mps = store.vectors['vel_2d_mps'][:n]
+        drag_2d_N = np.zeros((n, 2))
+        for axis in (0, 1):
+            drag_2d_N[:, axis] -= np.bincount(rows_1, c_drag * vel_2d_mps[rows_1, axis], minlength=n)
+            drag_2d_N[:, axis] -= np.bincount(rows_2, c_drag * vel_2d_mps[rows_2, axis], minlength=n)
+        return drag_2d_N
+
+    def solve_positions(self, store, n, pos_start_2d_m, dt_s, free):
+        # Project the constraints. The positions in the store (rows 0 to n-1) are moved in place.
+        # pos_start_2d_m has the positions at the start of the step. Rows that are not free (pins
+        # and sleeping pucks) have no inverse mass, so they don't move.
+        rows_1, rows_2, k_Npm, length_m, c_damp, c_drag = self.arrays
+        if len(rows_1) == 0: return
+
+        pos_2d_m = store.vectors['pos_2d_m']
+        inverse_mass = np.where(free, 1.0 / store.scalars['mass_kg'][:n], 0.0)
+
+        # alpha~ = compliance/dt**2, gamma = alpha~ * (c_damp * dt**2) / dt. A spring with no
+        # stiffness has infinite compliance (no constraint).
+        active = k_Npm > 0.0
+        safe_k_Npm = np.where(active, k_Npm, 1.0)
+        alpha_tilde = 1.0 / (safe_k_Npm * dt_s**2)
+        gamma = c_damp / (safe_k_Npm * dt_s)
+        lambdas = np.zeros(len(rows_1))
+
+        for iteration in range(self.iterations):
+            for batch in self.batches:
+                a = rows_1[batch]
+                b = rows_2[batch]
+                separation_2d_m = pos_2d_m[a] - pos_2d_m[b]
+                separation_m = np.hypot(separation_2d_m[:, 0], separation_2d_m[:, 1])
+                # A zero-length spring whose ends are together is satisfied (and has no direction).
+                has_direction = (separation_m > 1e-9) & active[batch]
+                normal_2d = separation_2d_m / np.where(has_direction, separation_m, 1.0)[:, np.newaxis]
+
+                w_sum = inverse_mass[a] + inverse_mass[b]
+                C_m = separation_m - length_m[batch]
+                # Relative movement along the constraint direction since the start of the step (damping).
+                relative_move_2d_m = (pos_2d_m[a] - pos_start_2d_m[a]) - (pos_2d_m[b] - pos_start_2d_m[b])
+                relative_move_m = np.sum(normal_2d * relative_move_2d_m, axis=1)
+
+                denominator = (1.0 + gamma[batch]) * w_sum + alpha_tilde[batch]
+                valid = has_direction & (denominator > 0.0)
+                delta_lambda = (-C_m - alpha_tilde[batch] * lambdas[batch] - gamma[batch] * relative_move_m) / np.where(valid, denominator, 1.0)
+                delta_lambda[~valid] = 0.0
+                lambdas[batch] += delta_lambda
+
+                correction_2d_m = normal_2d * delta_lambda[:, np.newaxis]
+                pos_2d_m[a] += correction_2d_m * inverse_mass[a][:, np.newaxis]
+                pos_2d_m[b] -= correction_2d_m * inverse_mass[b][:, np.newaxis]
@@ -69,12 +69,14 @@ def no_drone_custom1__circular():
 def make_some_pucks(demo, specials=None, caption="A15a"):
     g.game_window.set_caption(f"Air-Table Server {caption} {g.air_table.engine}    Demo #" + str(demo))
     g.env.timestep_fixed = False
+    g.env.timestep_adaptive = False
 
     # This removes all references to pucks and effectively deletes them.
     for eachpuck in g.air_table.pucks[:]:
         eachpuck.delete()
 
     g.air_table.resetFence()
+    g.air_table.remove_all_static_shapes()
 
     # Most of the demos don't need the tangle checker.
     g.air_table.jello_tangle_checking_enabled = False
@@ -184,6 +186,9 @@ def make_some_pucks(demo, specials=None, caption="A15a"):
         g.air_table.puckPopper_variations(demo, two_drone_special__circular, custom_1=no_drone_custom1__circular)
         
     elif demo == 8:
+        # Jello Madness: stiff springs and hard throws. Adaptive steps keep it stable at any frame rate.
+        if g.air_table.engine in ['circular', 'circular-perfectKiss']:
+            g.env.timestep_adaptive = True
         g.env.set_gravity("on")
         g.air_table.throwJello_variations(demo)
 
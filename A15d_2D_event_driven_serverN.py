@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+
+# Filename: A15d_2D_event_driven_serverN.py
+
+from A15_game_loop import GameLoop
+from A15a_2D_finished_game import make_some_pucks as A15a_make_some_pucks
+import A15_globals as g
+
+#===========================================================
+# Functions
+#===========================================================
+
+def make_some_pucks(demo):
+    # The demos are the same as in A15a. The event-driven engine predicts the time of each 
+    # collision, so there is no penetration to correct.
+    A15a_make_some_pucks(demo, caption="A15d")
+
+#============================================================
+# main procedural script
+#============================================================
+
+def main():
+    game_loop = GameLoop(engine_type="circular-eventDriven", window_width_px=900, make_some_pucks=make_some_pucks)
+    g.game_loop = game_loop
+    game_loop.start(demo_index=7)
+
+#============================================================
+# Start everything.
+#============================================================
+        
+if __name__ == '__main__':
+    main()
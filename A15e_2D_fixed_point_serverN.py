@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+# Filename: A15e_2D_fixed_point_serverN.py
+
+from A15_game_loop import GameLoop
+from A15a_2D_finished_game import make_some_pucks as A15a_make_some_pucks
+import A15_globals as g
+
+#===========================================================
+# Functions
+#===========================================================
+
+def make_some_pucks(demo):
+    # The demos are the same as in A15a. The fixed-point engine keeps the puck positions as
+    # integers, so a run gives the same result on any machine, and a time reversal (shift+r)
+    # retraces the motion exactly. Contacts are stiff elastic springs; the drag and damping
+    # forces are not used.
+    g.air_table.timeDirection = 1
+    g.air_table.count_direction = 1
+    A15a_make_some_pucks(demo, caption="A15e")
+
+#============================================================
+# main procedural script
+#============================================================
+
+def main():
+    game_loop = GameLoop(engine_type="circular-fixedPoint", window_width_px=900, make_some_pucks=make_some_pucks)
+    g.game_loop = game_loop
+    game_loop.start(demo_index=1)
+
+#============================================================
+# Start everything.
+#============================================================
+        
+if __name__ == '__main__':
+    main()
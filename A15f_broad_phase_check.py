@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Filename: A15f_broad_phase_check.py
+
+"""
+Check that the broad phases give the same trajectories as the all-pairs loop.
+
+Demos 7 and 9 of A15a are run on the circular engine, without a window (SDL dummy driver) and
+with a fixed time step, once with each broad phase. The puck positions after every step are
+compared with those of the all-pairs run. The spatial hash is run with its derived cell size and
+with a small cell size (smaller than the pucks).
+"""
+
+import os, sys, random
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from A15_game_loop import GameLoop
+from A15a_2D_finished_game import make_some_pucks
+import A15_globals as g
+
+#===========================================================
+# Functions
+#===========================================================
+
+class FixedClock:
+    # Stands in for the pygame clock: every frame is one 480 Hz step, and there is no waiting.
+    def tick(self, framerate_limit):
+        return 1000.0/480.0
+
+class NoServer:
+    running = False
+
+def run_demo(demo, broad_phase, cell_size_m=None, n_steps=600):
+    random.seed(1)
+    game_loop = GameLoop(engine_type="circular", window_width_px=900, make_some_pucks=make_some_pucks)
+    g.game_loop = game_loop
+    game_loop.myclock = FixedClock()
+    game_loop.server = NoServer()
+    game_loop.air_table.set_broad_phase(broad_phase, cell_size_m=cell_size_m)
+
+    make_some_pucks(demo)
+
+    positions = []
+    for step in range(n_steps):
+        game_loop.update_air_table(demo)
+        positions.append([(puck.pos_2d_m.x, puck.pos_2d_m.y) for puck in g.air_table.pucks])
+    return positions
+
+def first_difference(positions_a, positions_b):
+    # The first step at which the two runs differ (None if they match).
+    for step, (pucks_a, pucks_b) in enumerate(zip(positions_a, positions_b)):
+        if pucks_a != pucks_b:
+            return step
+    return None
+
+#============================================================
+# main procedural script
+#============================================================
+
+def main():
+    failures = 0
+    for demo in [7, 9]:
+        all_pairs = run_demo(demo, "all-pairs")
+        for broad_phase, cell_size_m in [("sweep-and-prune", None), ("spatial-hash", None), ("spatial-hash", 0.05)]:
+            step = first_difference(all_pairs, run_demo(demo, broad_phase, cell_size_m))
+            label = f"demo {demo}, {broad_phase}" + (f" ({cell_size_m} m cells)" if cell_size_m else "")
+            if step is None:
+                print(f"{label}: matches all-pairs")
+            else:
+                print(f"{label}: differs from all-pairs at step {step}")
+                failures += 1
+    sys.exit(1 if failures else 0)
+
+#============================================================
+# Start everything.
+#============================================================
+
+if __name__ == '__main__':
+    main()